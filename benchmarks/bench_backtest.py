@@ -0,0 +1,77 @@
+""" Feature cost of a walk-forward backtest on the stored leagues: the features rebuilt for every fold (processing
+of the raw matches up to the fold) against models.backtest, computing them once into a feature matrix that the
+folds slice (then served from its disk cache to the next runs). Models are not trained, only the fold inputs.
+
+Run from the repository root:  python -m benchmarks.bench_backtest
+"""
+
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from leagues.league import DataManager
+from models import backtest
+from models.backtest import feature_matrix, folds, load_matrix
+from models.models import feature_columns, upcoming
+from processing.processing import ProcessingFootball
+
+
+def rebuilt_per_fold(league, columns, fold_list):
+
+    """ Features of every fold computed again from the raw matches up to its last one.
+    """
+
+    processer = ProcessingFootball(league.data.schema)
+    raw = league.data.get_raw_data(columns=processer.model_raw_columns())
+    kickoff = raw['Date'].astype(str) + ' ' + raw['Time'].astype(str)
+
+    for _, cut, test in fold_list:
+        last = str(columns["kickoff"][test].max())[:16].replace('T', ' ')
+        data = ProcessingFootball(league.data.schema).prediction_processing(raw[kickoff <= last].copy())
+        data = data[~upcoming(data)]
+        data[feature_columns(data)].to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+def sliced_once(league, by, cache_folder):
+    features, columns = load_matrix(feature_matrix(league, cache_folder))
+    for _, cut, test in folds(columns, by, step=5):
+        np.asarray(features[:cut]), np.asarray(features[test])
+
+
+def main():
+
+    warnings.filterwarnings('ignore')
+    leagues = [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]
+    for league in leagues:
+        league.data = DataManager(league, cache=False)
+    reference_folder = tempfile.mkdtemp()
+    columns = {league.name: load_matrix(feature_matrix(league, reference_folder))[1] for league in leagues}
+
+    print(f"{'Folds':<16}{'Count':>7}{'Per fold (s)':>14}{'Once (s)':>10}{'Cached (s)':>12}")
+    for by in ["season", "round"]:
+        fold_lists = {league.name: folds(columns[league.name], by, step=5) for league in leagues}
+        start = time.perf_counter()
+        for league in leagues:
+            rebuilt_per_fold(league, columns[league.name], fold_lists[league.name])
+        per_fold = time.perf_counter() - start
+
+        cache_folder = tempfile.mkdtemp()
+        timings = []
+        for _ in range(2):
+            # a new run of the backtest: the second one reads the matrices from the disk cache
+            backtest._matrices.clear()
+            start = time.perf_counter()
+            for league in leagues:
+                sliced_once(league, by, cache_folder)
+            timings.append(time.perf_counter() - start)
+
+        count = sum(len(fold_list) for fold_list in fold_lists.values())
+        print(f"{by if by == 'season' else 'round (step 5)':<16}{count:>7}{per_fold:>14.2f}{timings[0]:>10.2f}"
+              f"{timings[1]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
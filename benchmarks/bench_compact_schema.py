@@ -0,0 +1,65 @@
+""" Memory of the raw, features and prediction frames of every league with the float64 / object dtypes and with
+the CompactSchema, and accuracy check: the compact features are the float64 ones up to float32 rounding.
+
+Run from the repository root:  python -m benchmarks.bench_compact_schema
+"""
+
+import numpy as np
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from leagues.league import DataManager
+from storage.schema import memory_usage
+
+
+VIEWS = {"raw": "get_raw_data", "features": "get_data_with_features", "prediction": "get_data_for_prediction",
+         "future": "get_data_for_future_prediction"}
+
+
+def max_relative_error(wide, compact) -> float:
+
+    """ Largest relative difference over the numeric columns, after checking that both frames hold the
+    same columns, missing values and texts.
+    """
+
+    assert list(wide.columns) == list(compact.columns), "Columns differ"
+    worst = 0.0
+    for col in wide.columns:
+        if pd.api.types.is_numeric_dtype(wide[col]) and pd.api.types.is_numeric_dtype(compact[col]):
+            x = wide[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            y = compact[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            assert (np.isnan(x) == np.isnan(y)).all(), f"{col}: missing values differ"
+            known = ~np.isnan(x)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                error = np.abs(x[known] - y[known]) / np.maximum(np.abs(x[known]), 1.0)
+            worst = max(worst, error.max(initial=0.0))
+        else:
+            assert wide[col].astype(object).where(wide[col].notna(), None).equals(
+                compact[col].astype(object).where(compact[col].notna(), None)), f"{col}: values differ"
+    return worst
+
+
+def main(tolerance=1e-5):
+
+    print(f"\n{'League':<16}{'Frame':<12}{'float64 (MB)':>13}{'compact (MB)':>14}{'Saving':>8}{'Max rel. error':>16}")
+    totals = [0, 0]
+
+    for league_class in [PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA]:
+        wide, compact = league_class(), league_class()
+        wide.data = DataManager(wide, cache=False, compact=False)
+        compact.data = DataManager(compact, cache=False, compact=True)
+
+        for frame, view in VIEWS.items():
+            wide_data, compact_data = getattr(wide.data, view)(), getattr(compact.data, view)()
+            error = max_relative_error(wide_data, compact_data)
+            assert error <= tolerance, f"{wide.name} {frame}: relative error {error:.2e} above {tolerance:.0e}"
+
+            before, after = memory_usage(wide_data), memory_usage(compact_data)
+            totals[0], totals[1] = totals[0] + before, totals[1] + after
+            print(f"{wide.name:<16}{frame:<12}{before / 1e6:>13.1f}{after / 1e6:>14.1f}{1 - after / before:>8.0%}{error:>16.1e}")
+
+    print(f"{'total':<28}{totals[0] / 1e6:>13.1f}{totals[1] / 1e6:>14.1f}{1 - totals[1] / totals[0]:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+""" DataManager views without cache, from the on-disk dataset cache (new process) and from memory.
+
+Run from the repository root:  python -m benchmarks.bench_dataset_cache
+The cache is written to a temporary folder, storage/dataset_cache is left untouched.
+"""
+
+import tempfile
+import time
+
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from storage.dataset_cache import DatasetCache
+
+
+VIEWS = ["get_data", "get_data_with_features", "get_data_for_prediction", "get_data_for_future_prediction"]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache = DatasetCache(folder)
+
+        print(f"\n{'League':<16}{'View':<32}{'No cache (ms)':>14}{'Disk (ms)':>11}{'Memory (ms)':>13}")
+
+        for league in [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]:
+            for view in VIEWS:
+                league.data.cache = None
+                uncached_time, reference = timed(getattr(league.data, view))
+
+                league.data.cache = cache
+                getattr(league.data, view)()
+                cache.memory.clear()
+                cache.memory_bytes = 0
+                disk_time, from_disk = timed(getattr(league.data, view))
+                memory_time, from_memory = timed(getattr(league.data, view))
+
+                pd.testing.assert_frame_equal(from_disk, reference)
+                pd.testing.assert_frame_equal(from_memory, reference)
+                print(f"{league.name:<16}{view:<32}{uncached_time * 1000:>14.1f}{disk_time * 1000:>11.1f}{memory_time * 1000:>13.1f}")
+
+        print(f"\n{cache.hits}, {cache.memory_bytes / 1024 ** 2:.0f} MB in memory")
+
+
+if __name__ == '__main__':
+    main()
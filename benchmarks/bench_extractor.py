@@ -0,0 +1,98 @@
+""" Parse time of the fbref pages scraped for a team: pd.read_html + BeautifulSoup (former Downloader) against the
+single lxml parse of FbrefPage, on saved fixture pages.
+
+Run from the repository root:  python -m benchmarks.bench_extractor [folder]
+Without folder, a team page and its match logs pages are generated by the fbref stand-in and saved to a temporary
+folder. With a folder of pages saved from fbref (*.html), those are used instead.
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from benchmarks.fbref_standin import FbrefSite, STATS_PAGES
+from downloader.extractor import FbrefPage
+
+
+def save_fixtures(folder, season="2022-2023", team="Club 01"):
+    site = FbrefSite()
+    pages = {"team": site.team_page(season, team)}
+    pages.update({page: site.stats_page(season, team, page) for page in STATS_PAGES})
+    for name, content in pages.items():
+        with open(os.path.join(folder, f"{name}.html"), "w", encoding="utf-8") as file:
+            file.write(content)
+
+
+def former_parse(text):
+
+    """ What the Downloader did per page: read_html of the scores / first table, and for the team page a
+    BeautifulSoup parse for the logo and match logs links.
+    """
+
+    if "Scores" in text:
+        data = pd.read_html(StringIO(text), match="Scores")[0]
+        soup = BeautifulSoup(text, 'html.parser')
+        soup.find('img', {'class': 'teamlogo'})
+        [a.get('href') for a in soup.find_all("a") if "matchlogs/all_comps" in a.get('href', '')]
+    else:
+        data = pd.read_html(StringIO(text))[0]
+
+    if data.columns.nlevels > 1:
+        data.columns = [f"{col}_{branch}" if "For" not in col and "Unnamed:" not in col else f"{branch}"
+                        for col, branch in data.columns]
+    return data
+
+
+def lxml_parse(text):
+    page = FbrefPage(text)
+    page.image('teamlogo')
+    page.links("matchlogs/all_comps/")
+    return page.table("matchlogs_for")
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(folder=None, repeat=5):
+
+    with tempfile.TemporaryDirectory() as fixtures:
+        if folder is None:
+            save_fixtures(fixtures)
+            folder = fixtures
+
+        print(f"\n{'Page':<28}{'Size (kB)':>10}{'read_html (ms)':>16}{'lxml (ms)':>11}{'Speedup':>9}")
+        total_former, total_lxml = 0, 0
+
+        for path in sorted(glob.glob(os.path.join(folder, "*.html"))):
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+
+            former_time, former = best_of(lambda: former_parse(text), repeat)
+            lxml_time, extracted = best_of(lambda: lxml_parse(text), repeat)
+            total_former, total_lxml = total_former + former_time, total_lxml + lxml_time
+
+            name = os.path.basename(path)
+            print(f"{name:<28}{len(text) / 1000:>10.0f}{former_time * 1000:>16.1f}{lxml_time * 1000:>11.1f}"
+                  f"{former_time / lxml_time:>8.1f}x")
+
+            assert extracted is not None, f"No matchlogs_for table in {name}"
+            pd.testing.assert_frame_equal(former, extracted, check_dtype=False, obj=name)
+
+        print(f"{'total':<28}{'':>10}{total_former * 1000:>16.1f}{total_lxml * 1000:>11.1f}"
+              f"{total_former / total_lxml:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
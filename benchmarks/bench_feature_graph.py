@@ -0,0 +1,137 @@
+""" Feature stages of features_processing: the feature graph (one canonical sort, one preallocated block, one
+assembly) against the former chain of stages, each sorting the frame again and concatenating its columns. Time,
+Python allocation peak and the MB copied by the graph run; also counts the rows whose rolling features changed:
+the matches of the teams with a postponed match, now averaged in kickoff order. Then prediction_processing for the
+features of a small model only (lazy columns) against all the features.
+
+Run from the repository root:  python -m benchmarks.bench_feature_graph
+"""
+
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_rolling_features import engine_rolling
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from processing.processing import ProcessingFootball, BOOKMAKER_LINES
+
+# a small model: rankings and a few statistics of both teams
+MODEL_COLUMNS = [f'{column}_{side}' for side in ['Home', 'Away'] for column in
+                 ['Ranking_Lag', 'Points_Cum_Lag', 'Total Shots_5_Last_Matches_Average', 'Total Shots_5_Last_Matches_Std',
+                  'Goals per Shot_Scaled_Season_Average']]
+SINGLE_COLUMNS = ['Ranking_Lag_Away', 'GD_Cum_Lag_Home', 'Total Shots_5_Last_Matches_Sum_Home']
+
+
+def legacy_features(processer, data):
+
+    """ Cumulatives, ranking, bookmaker, lags and rolling features as they were chained before the feature graph.
+    """
+
+    lag_cols = ['Points_Cum', 'GD_Cum', 'GF_Cum', 'GA_Cum']
+
+    data.sort_values(by=['Season', 'Round', 'Team'], inplace=True)
+    data.reset_index(drop=True, inplace=True)
+    cumulatives = data.groupby(['Season', 'Team'], observed=True)[['Points', 'GD', 'GF', 'GA']].cumsum()
+    data = pd.concat([data, cumulatives.add_suffix('_Cum')], axis=1)
+
+    data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
+    data['Ranking'] = data.groupby(['Season', 'Round'], observed=True).cumcount() + 1
+
+    for col, line in BOOKMAKER_LINES.items():
+        data[col] = (data["Total_Goals"] <= line).fillna(False).astype(int)
+
+    data.sort_values(by=['Season', 'Round', 'Team'], inplace=True)
+    data.reset_index(drop=True, inplace=True)
+    data[[f'{col}_Lag' for col in lag_cols]] = data.groupby(['Season', 'Team'], observed=True)[lag_cols].shift(1)
+    data['Ranking_Lag'] = data.groupby(['Team'], observed=True)['Ranking'].shift(1)
+
+    data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
+    new_columns = engine_rolling(processer.rolling_engine, data, processer.list_columns, dtype=processer.float_dtype)
+    return pd.concat([data, new_columns], axis=1)
+
+
+def graph_features(processer, data):
+    return processer.feature_graph.run(data, ["cumulatives", "ranking", "bookmaker", "lags", "rolling"])
+
+
+def measure(function, repeat):
+
+    """ Best wall time of `repeat` calls, Python allocation peak of one more call and its result.
+    """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def main(repeat=3):
+
+    warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
+    warnings.filterwarnings('ignore', category=pd.errors.PerformanceWarning)
+
+    print(f"{'League':<16}{'Rows':>7}{'Legacy (ms)':>13}{'Graph (ms)':>12}{'Speedup':>9}{'Legacy peak (MB)':>18}"
+          f"{'Graph peak (MB)':>17}{'Graph copied (MB)':>19}{'Rolling changed':>17}")
+
+    for league in [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]:
+        processer = ProcessingFootball(league.data.schema)
+        raw = league.data.get_raw_data(columns=processer.model_raw_columns())
+        data = processer._rename_and_drop_columns(processer._prepare_basic_columns(raw))
+
+        legacy_time, legacy_peak, legacy = measure(lambda: legacy_features(processer, data.copy()), repeat)
+        graph_time, graph_peak, graph = measure(lambda: graph_features(processer, data.copy()), repeat)
+        copied = processer.feature_graph.last_run.report().loc['total', 'MB copied']
+
+        assert set(legacy.columns) == set(graph.columns) and len(legacy) == len(graph), "Feature mismatch"
+        key = ['Season', 'Team', 'DateTime', 'Round']
+        legacy = legacy.sort_values(by=key, kind='stable').reset_index(drop=True)
+        graph = graph.sort_values(by=key, kind='stable').reset_index(drop=True)
+        rolling = processer.rolling_engine.columns(processer.list_columns)
+        changed = (~np.isclose(legacy[rolling].to_numpy(dtype=np.float64), graph[rolling].to_numpy(dtype=np.float64),
+                               rtol=1e-5, equal_nan=True)).any(axis=1).sum()
+
+        print(f"{league.name:<16}{len(data):>7}{legacy_time * 1000:>13.1f}{graph_time * 1000:>12.1f}"
+              f"{legacy_time / graph_time:>8.1f}x{legacy_peak / 1024 ** 2:>18.1f}{graph_peak / 1024 ** 2:>17.1f}"
+              f"{copied:>19.1f}{changed:>17}")
+
+    print("\nFeature graph stages of the last league")
+    print(processer.feature_graph.last_run.report().to_string())
+
+    lazy_columns(processer, league.data.get_raw_data(columns=processer.model_raw_columns()), repeat)
+
+
+def lazy_columns(processer, raw, repeat, columns=MODEL_COLUMNS):
+
+    """ prediction_processing of all the features against the features of `columns` only (same values).
+    """
+
+    full_time, full_peak, full = measure(lambda: processer.prediction_processing(raw.copy()), repeat)
+    lazy_time, lazy_peak, lazy = measure(lambda: processer.prediction_processing(raw.copy(), columns=columns), repeat)
+    for column in columns:
+        assert np.allclose(full[column].to_numpy(dtype=np.float64, na_value=np.nan),
+                           lazy[column].to_numpy(dtype=np.float64, na_value=np.nan), equal_nan=True), f"{column} differs"
+
+    # one column at a time: a stage asked for one of its columns only
+    for column in SINGLE_COLUMNS:
+        single = processer.prediction_processing(raw.copy(), columns=[column])
+        assert np.allclose(full[column].to_numpy(dtype=np.float64, na_value=np.nan),
+                           single[column].to_numpy(dtype=np.float64, na_value=np.nan), equal_nan=True), f"{column} differs"
+
+    print(f"\nprediction_processing of {len(columns)} model columns")
+    print(f"{'Features':<10}{'Columns':>9}{'Time (ms)':>11}{'Peak (MB)':>11}")
+    print(f"{'all':<10}{full.shape[1]:>9}{full_time * 1000:>11.1f}{full_peak / 1024 ** 2:>11.1f}")
+    print(f"{'lazy':<10}{lazy.shape[1]:>9}{lazy_time * 1000:>11.1f}{lazy_peak / 1024 ** 2:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
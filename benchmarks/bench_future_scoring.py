@@ -0,0 +1,63 @@
+""" Upcoming fixtures of the stored leagues, end to end through DataManager.get_data_for_future_prediction: the full
+path (the history read and processed again with the fixtures, no dataset cache) against the incremental one (the
+state loaded and refreshed by update_state, the fixtures read from it). The state path is timed on its first call
+(the state file loaded) and once loaded. The raw fixtures go to both paths as stored: both must return the same
+fixtures with the same features.
+
+Run from the repository root:  python -m benchmarks.bench_future_scoring
+"""
+
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from leagues.league import DataManager
+from models.models import upcoming
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(repeat=5):
+
+    warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
+    warnings.filterwarnings('ignore', category=pd.errors.PerformanceWarning)
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    print(f"{'League':<16}{'Fixtures':>10}{'Full (ms)':>11}{'State 1st (ms)':>16}{'State (ms)':>12}{'Speedup':>9}")
+
+    for league in [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]:
+        # (the state file is built and refreshed once, outside the timings)
+        DataManager(league, cache=False).get_data_for_future_prediction(incremental=True)
+
+        full_time, full = best_of(lambda: DataManager(league, cache=False).get_data_for_future_prediction(), repeat)
+        first_time, _ = best_of(lambda: DataManager(league, cache=False).get_data_for_future_prediction(incremental=True), repeat)
+        manager = DataManager(league, cache=False)
+        manager.get_state()
+        state_time, scored = best_of(lambda: manager.get_data_for_future_prediction(incremental=True), repeat)
+
+        key = ['DateTime', 'Team Home', 'Team Away']
+        full = full[upcoming(full)].sort_values(by=key).reset_index(drop=True)
+        scored = scored[upcoming(scored)].sort_values(by=key).reset_index(drop=True)
+        assert list(full.columns) == list(scored.columns) and full[key].astype(str).equals(scored[key].astype(str)), "Fixtures mismatch"
+        numeric = [col for col in full.columns if pd.api.types.is_numeric_dtype(full[col])]
+        assert np.allclose(full[numeric].to_numpy(dtype=np.float64, na_value=np.nan),
+                           scored[numeric].to_numpy(dtype=np.float64, na_value=np.nan), rtol=1e-4, equal_nan=True), \
+            "Fixture features differ"
+
+        print(f"{league.name:<16}{len(scored):>10}{full_time * 1000:>11.1f}{first_time * 1000:>16.1f}"
+              f"{state_time * 1000:>12.1f}{full_time / state_time:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+""" Wall time of every stage of prediction_processing per league (the stages of the feature graph with the
+MB they copied), and the vectorized transforms of _prepare_basic_columns / _merge_2_rows_in_one against the
+former row-wise apply calls.
+
+Run from the repository root:  python -m benchmarks.bench_processing_stages [--compact]
+"""
+
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from leagues.league import DataManager
+from processing.processing import ProcessingFootball
+
+
+GRAPH_STAGES = ["cumulatives", "ranking", "bookmaker", "lags", "rolling"]
+
+
+def stages(processer):
+
+    """ (name, function) of the stages of prediction_processing, in order (the feature graph is timed per stage
+    from its report).
+    """
+
+    def dropna(data):
+        return data.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'])
+
+    return [
+        ("prepare basic columns", processer._prepare_basic_columns),
+        ("rename and drop", processer._rename_and_drop_columns),
+        ("feature graph", lambda data: processer.feature_graph.run(data, GRAPH_STAGES)),
+        ("keep columns", processer._keep_columns_for_model),
+        ("merge 2 rows in one", processer._merge_2_rows_in_one),
+        ("dropna", dropna),
+    ]
+
+
+def seasons(first_year):
+    return first_year.map({year: f"{year}-{year + 1}" for year in first_year.unique()})
+
+
+def sorted_teams(data):
+    team, opponent = data['Team'].astype(str), data['Opponent'].astype(str)
+    team_first = team <= opponent
+    return team.where(team_first, opponent) + '-vs-' + opponent.where(team_first, team)
+
+
+# Season, Formation, Points and MatchID as they were computed before (row-wise), and now
+LEGACY_TRANSFORMS = {
+    "Season": lambda data: data['DateTime'].apply(lambda x: f"{x.year}-{x.year + 1}" if x.month >= 8 else f"{x.year - 1}-{x.year}"),
+    "Formation": lambda data: data['Formation'].apply(lambda x: x.replace('◆', '') if pd.notnull(x) else x),
+    "Points": lambda data: data.apply(lambda row: {'W': 3, 'D': 1, 'L': 0}.get(row['Result']) if pd.notnull(row['Result']) else np.nan, axis=1),
+    "MatchID": lambda data: data['DateTime'].astype(str) + '-' + data[['Team', 'Opponent']].apply(sorted, axis=1).str.join('-vs-'),
+}
+
+VECTORIZED_TRANSFORMS = {
+    "Season": lambda data: seasons(data['DateTime'].dt.year - (data['DateTime'].dt.month < 8)),
+    "Formation": lambda data: data['Formation'].astype(object).str.replace('◆', '', regex=False),
+    "Points": lambda data: data['Result'].astype(object).map({'W': 3, 'D': 1, 'L': 0}),
+    "MatchID": lambda data: data['DateTime'].astype(str) + '-' + sorted_teams(data),
+}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main(compact=False, repeat=3):
+
+    warnings.filterwarnings('ignore')
+    leagues = [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]
+    timings, copied = {}, {}
+
+    for league in leagues:
+        league.data = DataManager(league, cache=False, compact=compact)
+        processer = ProcessingFootball(league.data.schema)
+        raw = league.data.get_raw_data(columns=processer.model_raw_columns())
+
+        best = {}
+        for _ in range(repeat):
+            data = raw.copy()
+            for name, stage in stages(processer):
+                elapsed, data = timed(stage, data)
+                best[name] = min(best.get(name, np.inf), elapsed)
+                if name == "feature graph":
+                    report = processer.feature_graph.last_run.report().drop(index="total")
+                    for graph_stage, seconds in report['seconds'].items():
+                        best[f"  {graph_stage}"] = min(best.get(f"  {graph_stage}", np.inf), seconds)
+        timings[league.name] = best
+        copied[league.name] = report['MB copied']
+
+    timings = pd.DataFrame(timings)
+    timings.loc["total"] = timings.drop(index=[name for name in timings.index if name.startswith("  ")]).sum()
+    print(f"\nStage wall time (ms, best of {repeat}){' with the compact schema' if compact else ''}")
+    print((timings * 1000).round(1).to_string())
+
+    copied = pd.DataFrame(copied)
+    copied.loc["total"] = copied.sum()
+    print("\nMB copied by the stages of the feature graph")
+    print(copied.round(2).to_string())
+
+    print(f"\n{'League':<16}{'Transform':<12}{'apply (ms)':>12}{'vectorized (ms)':>17}{'Speedup':>9}")
+    for league in leagues:
+        data = league.data.get_raw_data()
+        data['DateTime'] = pd.to_datetime(data['Date'] + ' ' + data['Time'])
+
+        for name, legacy_transform in LEGACY_TRANSFORMS.items():
+            legacy_time, legacy = timed(legacy_transform, data)
+            vectorized_time, vectorized = timed(VECTORIZED_TRANSFORMS[name], data)
+            pd.testing.assert_series_equal(vectorized, legacy, check_dtype=False, check_names=False)
+            print(f"{league.name:<16}{name:<12}{legacy_time * 1000:>12.1f}{vectorized_time * 1000:>17.2f}"
+                  f"{legacy_time / vectorized_time:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main(compact="--compact" in sys.argv)
@@ -0,0 +1,97 @@
+""" Scraping through the ProxyPool on the local fbref stand-in and stand-in proxies: requests per second on the
+site as healthy proxies are added (one token bucket per host for all of them: the site must not see more requests
+than without proxies), then a pool mixing healthy, slow, flaky, down and dead proxies: the dead ones must be
+evicted, the slow and flaky ones avoided, without losing any page.
+
+Run from the repository root:  python -m benchmarks.bench_proxies
+"""
+
+import contextlib
+import tempfile
+import time
+
+from benchmarks.fbref_standin import FbrefStandIn, StandInLeague
+from benchmarks.proxy_standin import StandInProxy, dead_address
+from downloader.downloader import Downloader
+from downloader.proxy import ProxyPool
+
+
+def scrape(site, pool, workers, request_interval):
+    downloader = Downloader(workers=workers, request_interval=request_interval, base_url=site.base_url, cache=False,
+                            proxies=pool)
+    downloader.max_seasons = 1
+    downloader.logos_folder = tempfile.mkdtemp()
+    downloader.checkpoints_folder = tempfile.mkdtemp()
+
+    site.egresses.clear()
+    start = time.perf_counter()
+    data = downloader.all_data(StandInLeague(site))
+    elapsed = time.perf_counter() - start
+    return data.sort_values(by=['Team', 'Date']).reset_index(drop=True), elapsed
+
+
+def scaling(site, request_interval, reference):
+
+    print(f"\nToken bucket {1 / request_interval:.0f} requests/s per host for the pool, 2 workers per proxy")
+    print(f"{'Proxies':>8}{'Requests':>10}{'Time (s)':>10}{'Requests/s':>12}{'Busiest proxy (req/s)':>23}")
+
+    for count in [1, 2, 4, 8]:
+        with contextlib.ExitStack() as stack:
+            proxies = [stack.enter_context(StandInProxy(latency=0.005, name=f"proxy-{number}"))
+                       for number in range(count)]
+            pool = ProxyPool([proxy.address for proxy in proxies])
+            data, elapsed = scrape(site, pool, 2 * count, request_interval)
+
+        requests = sum(site.egresses.values())
+        busiest = max(site.egresses.values()) / elapsed
+        print(f"{count:>8}{requests:>10}{elapsed:>10.2f}{requests / elapsed:>12.1f}{busiest:>23.1f}")
+
+        assert data[reference.columns].equals(reference), "Scraping through the proxies changed the data"
+        assert requests / elapsed <= 1.1 / request_interval, "The proxies went over the token bucket of the site"
+
+
+def health(site, request_interval, reference):
+
+    with contextlib.ExitStack() as stack:
+        healthy = [stack.enter_context(StandInProxy(latency=0.005, name=f"healthy-{number}")) for number in range(4)]
+        slow = stack.enter_context(StandInProxy(latency=0.3, name="slow"))
+        flaky = stack.enter_context(StandInProxy(latency=0.005, failure_rate=0.7, name="flaky"))
+        down = stack.enter_context(StandInProxy(name="down"))
+        down.down = True
+        dead = dead_address()
+
+        proxies = healthy + [slow, flaky, down]
+        pool = ProxyPool([proxy.address for proxy in proxies] + [dead])
+        data, elapsed = scrape(site, pool, 8, request_interval)
+
+        names = {proxy.address: proxy.name for proxy in proxies}
+        report = pool.report()
+        report.insert(1, 'Stand-in', report['Proxy'].map(names).fillna("dead"))
+        report.insert(3, 'Served', report['Stand-in'].map(site.egresses).fillna(0).astype(int))
+
+    print(f"\nMixed pool: {sum(site.egresses.values())} pages served in {elapsed:.2f} s")
+    print(report.to_string(index=False))
+
+    evicted = set(report.loc[report['Evicted'], 'Stand-in'])
+    assert data[reference.columns].equals(reference), "Failing proxies lost pages"
+    # (the pool sends the requests to the proxy answering first: the healthy ones share them unevenly)
+    healthy_average = sum(site.egresses[proxy.name] for proxy in healthy) / len(healthy)
+    assert {"down", "dead"} <= evicted, "A dead proxy was not evicted"
+    assert not evicted & {proxy.name for proxy in healthy}, "A healthy proxy was evicted"
+    assert "flaky" in evicted or site.egresses["flaky"] < healthy_average, "The flaky proxy was not avoided"
+    assert site.egresses["slow"] < healthy_average, "The slow proxy was not avoided"
+
+
+def main(latency=0.02, request_interval=0.05, teams=20):
+
+    with FbrefStandIn(latency=latency, teams=teams, seasons=1) as site:
+        print(f"Stand-in latency {latency * 1000:.0f} ms, {teams} teams")
+        reference, elapsed = scrape(site, None, 1, request_interval)
+        print(f"Direct, 1 worker: {sum(site.egresses.values())} requests in {elapsed:.2f} s")
+
+        scaling(site, request_interval, reference)
+        health(site, request_interval, reference)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+""" Cost of keeping the ratings of all the stored leagues up to date: a full replay of the history for every new
+match day against RatingEngine.update with only the matches of the day, over the last `days` match days (the
+incremental ratings must equal the replayed ones).
+
+Run from the repository root:  python -m benchmarks.bench_ratings
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from processing.ratings import RatingEngine, matches_from_rows, MATCH_COLUMNS, RATING_COLUMNS
+
+
+def main(days=30):
+
+    leagues = [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]
+    matches = pd.concat([matches_from_rows(league.data.get_raw_data(columns=MATCH_COLUMNS), league.name)
+                         for league in leagues], ignore_index=True)
+    match_days = np.sort(matches['Kickoff'].dt.normalize().unique())[-days:]
+    before = matches[matches['Kickoff'] < match_days[0]]
+    print(f"{len(matches)} matches, {matches['Home'].nunique()} teams, last {days} match days "
+          f"({len(matches) - len(before)} matches)")
+
+    replay = 0.0
+    for day in match_days:
+        start = time.perf_counter()
+        replayed = RatingEngine()
+        replayed.update(matches[matches['Kickoff'] < day + pd.Timedelta(days=1)])
+        replay += time.perf_counter() - start
+
+    engine = RatingEngine()
+    engine.update(before)
+    incremental = 0.0
+    for day in match_days:
+        start = time.perf_counter()
+        engine.update(matches[(matches['Kickoff'] >= day) & (matches['Kickoff'] < day + pd.Timedelta(days=1))])
+        incremental += time.perf_counter() - start
+
+    print(f"{'Update':<14}{'Per match day (ms)':>20}")
+    print(f"{'full replay':<14}{replay / days * 1000:>20.2f}")
+    print(f"{'incremental':<14}{incremental / days * 1000:>20.2f}")
+
+    key = ['Kickoff', 'Home', 'Away']
+    replayed_history = replayed.history.sort_values(by=key).reset_index(drop=True)
+    history = engine.history.sort_values(by=key).reset_index(drop=True)
+    assert np.allclose(replayed_history[RATING_COLUMNS], history[RATING_COLUMNS]), "Incremental ratings differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+""" Rolling features: RollingFeatureEngine against the former per-column groupby/lambda transforms.
+
+Run from the repository root:  python -m benchmarks.bench_rolling_features
+"""
+
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from processing.processing import ProcessingFootball
+
+
+def legacy_rolling_features(data, list_columns):
+
+    """ The rolling steps of calculate_features_for_model as they were before the RollingFeatureEngine.
+    """
+
+    new_columns = pd.DataFrame(index=data.index)
+    for col in list_columns:
+        new_columns[f'{col}_5_Last_Matches_Average'] = data.groupby(['Season', 'Team'])[col].transform(lambda x: x.shift(1).rolling(window=5, min_periods=5).mean())
+    data = pd.concat([data, new_columns], axis=1)
+
+    data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
+
+    for stat in ['Sum', 'Std']:
+        new_columns = pd.DataFrame(index=data.index)
+        for col in list_columns:
+            rolling = lambda x: x.shift(1).rolling(window=5, min_periods=5)
+            new_columns[f'{col}_5_Last_Matches_{stat}'] = data.groupby(['Season', 'Team'])[col].transform(
+                (lambda x: rolling(x).sum()) if stat == 'Sum' else (lambda x: rolling(x).std()))
+        data = pd.concat([data, new_columns], axis=1)
+
+    data["5_Last_Matches_Win"] = data.groupby(['Season', 'Team'])['Result'].transform(
+                                lambda x: (x == "W").shift(1).rolling(window=5, min_periods=1).sum().fillna(0))
+    data["5_Last_Matches_Loose"] = data.groupby(['Season', 'Team'])['Result'].transform(
+                                lambda x: (x == "L").shift(1).rolling(window=5, min_periods=1).sum().fillna(0))
+
+    new_columns = pd.DataFrame(index=data.index)
+    for col in list_columns:
+        new_columns[f'{col}_Scaled_Season_Average'] = data.groupby(['Season', 'Team'])[col].transform(lambda x: x.expanding().mean())
+    data = pd.concat([data, new_columns], axis=1)
+
+    return data
+
+
+def engine_rolling(engine, data, columns, group_keys=['Season', 'Team'], dtype=np.float64):
+
+    """ All the statistics of engine.columns(columns) over the (group_keys) groups, each group in the current row
+    order of `data` (not the kickoff order of the feature graph), as the legacy transforms. Float64, returned as `dtype`.
+    """
+
+    groups = data.groupby(group_keys, sort=False, observed=True)
+    codes, positions = groups.ngroup().to_numpy(), groups.cumcount().to_numpy()
+    form = np.column_stack([(data['Result'] == 'W').to_numpy(dtype=float), (data['Result'] == 'L').to_numpy(dtype=float)])
+    block = engine.scatter(np.column_stack([data[columns].to_numpy(dtype=np.float64, na_value=np.nan), form]), codes, positions)
+
+    every = list(range(len(columns)))
+    selection = {'Average': every, 'Sum': every, 'Std': every, 'Form': [0, 1], 'Scaled_Season_Average': every}
+    results = engine.select(block[:, :, :len(columns)], block[:, :, len(columns):], selection)
+    values = np.concatenate([results[statistic][codes, positions] for statistic in selection], axis=1)
+    return pd.DataFrame(values.astype(dtype, copy=False), index=data.index, columns=engine.columns(columns))
+
+
+def engine_rolling_features(processer, data):
+
+    """ The RollingFeatureEngine over the same row order as the legacy transforms (the rolling stage of the
+    feature graph runs it in the kickoff order of every team).
+    """
+
+    data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
+    new_columns = engine_rolling(processer.rolling_engine, data, processer.list_columns, dtype=processer.float_dtype)
+    return pd.concat([data, new_columns], axis=1)
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(repeat=3):
+
+    warnings.filterwarnings('ignore', category=pd.errors.PerformanceWarning)
+    warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
+    processer = ProcessingFootball()
+
+    print(f"{'League':<16}{'Rows':>7}{'Legacy (s)':>12}{'Engine (s)':>12}{'Speedup':>9}  Max rel. diff")
+
+    for league in [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]:
+        data = processer.feature_graph.run(processer.initial_processing(league.data.get_raw_data()), ["lags"])
+        data = data.sort_values(by=['Season', 'Round', 'Team', 'Points_Cum'], ascending=[True, True, True, False]).reset_index(drop=True)
+
+        legacy_time, legacy = best_of(lambda: legacy_rolling_features(data.copy(), processer.list_columns), repeat)
+        engine_time, engine = best_of(lambda: engine_rolling_features(processer, data.copy()), repeat)
+
+        assert list(legacy.columns) == list(engine.columns), "Column mismatch"
+        assert legacy.index.equals(engine.index), "Row order mismatch"
+        features = [col for col in engine.columns if col not in data.columns]
+        reference = legacy[features].to_numpy(dtype=np.float64)
+        difference = np.nanmax(np.abs(engine[features].to_numpy(dtype=np.float64) - reference) / (1 + np.abs(reference)))
+        assert np.array_equal(np.isnan(reference), np.isnan(engine[features].to_numpy(dtype=np.float64))), "NaN mismatch"
+
+        print(f"{league.name:<16}{len(data):>7}{legacy_time:>12.3f}{engine_time:>12.3f}{legacy_time / engine_time:>8.1f}x  {difference:.1e}")
+
+
+if __name__ == '__main__':
+    main()
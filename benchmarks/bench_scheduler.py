@@ -0,0 +1,105 @@
+""" Requests spent to keep a league up to date over simulated match days on the local fbref stand-in: the
+historic blind poll (the update_data full refresh, checked every hour) against the RefreshScheduler rescraping
+only the teams whose match is over, and the played matches each one has stored at the end. In between, the delta
+refresh every hour (Downloader.refresh_league: only the stale teams, stats pages only for new matches).
+
+Run from the repository root:  python -m benchmarks.bench_scheduler
+"""
+
+import datetime
+import tempfile
+
+from benchmarks.fbref_standin import FbrefStandIn, StandInLeague
+from downloader.downloader import Downloader
+from downloader.scheduler import RefreshScheduler
+from leagues.league import DataManager
+from storage.backends import CsvBackend
+
+
+class SimulatedClock:
+
+    def __init__(self, site, now):
+        self.site = site
+        self.now = now
+        site.site.set_now(now)
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+        self.site.site.set_now(self.now)
+
+
+def setup(site, start):
+
+    """ Stand-in league stored in a temporary folder as a scrape at `start` leaves it, and a Downloader on
+    the simulated clock.
+    """
+
+    clock = SimulatedClock(site, start)
+    downloader = Downloader(workers=8, request_interval=0.002, base_url=site.base_url, cache=False)
+    downloader.clock = clock
+    downloader.logos_folder = tempfile.mkdtemp()
+
+    league = StandInLeague(site)
+    league.data = DataManager(league, backend=CsvBackend(tempfile.mkdtemp()), cache=False, compact=False)
+    downloader.refresh_league(league, delta=False)
+    return downloader, league, clock
+
+
+def stored_matches(league) -> set:
+    data = league.data.backend.read(league.name, "data", columns=['Date', 'Team', 'Result'])
+    return set(data.dropna(subset=['Result'])[['Date', 'Team']].itertuples(index=False, name=None))
+
+
+def played_matches(site) -> set:
+    return {(date.isoformat(), team) for _, date, home, away, goals, _ in site.site.schedule(site.site.seasons[-1])
+            if goals is not None for team in (home, away)}
+
+
+def main(days=14, teams=20, round_days=3):
+
+    start = datetime.datetime(2024, 1, 1)
+    end = start + datetime.timedelta(days=days)
+    results = {}
+
+    with FbrefStandIn(latency=0.005, teams=teams, round_days=round_days) as site:
+        downloader, league, clock = setup(site, start)
+        requests_before, refreshes = site.requests, 0
+        while clock.now < end:
+            clock.sleep(3600)
+            futur_matches = league.data.backend.read(league.name, "futur_matches")
+            if (futur_matches['Date'] + ' ' + futur_matches['Time']).min() < f"{clock.now + datetime.timedelta(hours=2):%Y-%m-%d %H:%M}":
+                downloader.refresh_league(league, delta=False)
+                refreshes += 1
+        results["hourly poll"] = (site.requests - requests_before, f"{refreshes} full refreshes", stored_matches(league))
+
+        downloader, league, clock = setup(site, start)
+        requests_before, refreshes = site.requests, 0
+        while clock.now < end:
+            clock.sleep(3600)
+            refreshes += bool(downloader.stale_teams(league))
+            downloader.refresh_league(league)
+        results["hourly delta"] = (site.requests - requests_before, f"{refreshes} delta refreshes", stored_matches(league))
+
+        downloader, league, clock = setup(site, start)
+        scheduler = RefreshScheduler(downloader, [league], sleep=clock.sleep)
+        requests_before = site.requests
+        scheduler.run(until=end)
+        teams_scraped = sum(len(entry[2]) for entry in scheduler.history if entry[2] is not None)
+        results["scheduler"] = (site.requests - requests_before,
+                                f"{len(scheduler.history)} wake-ups, {teams_scraped} team scrapes", stored_matches(league))
+
+        played = played_matches(site)
+
+    print(f"\n{days} simulated days, {teams} teams, rounds over {round_days} days, {len(played)} team matches played")
+    print(f"{'Strategy':<14}{'Requests':>10}{'Missing':>9}   Work")
+    for strategy, (requests, work, matches) in results.items():
+        print(f"{strategy:<14}{requests:>10}{len(played - matches):>9}   {work}")
+
+    assert not played - results["scheduler"][2], "The scheduler missed matches"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+""" Scraping throughput on the local fbref stand-in: serial against concurrent Downloader (same per-host token
+bucket, only the number of workers changes), then cold against warm response cache, then a multi-season backfill
+stopped by rate limiting and resumed from its checkpoints.
+
+Run from the repository root:  python -m benchmarks.bench_scraping
+"""
+
+import tempfile
+import time
+
+from benchmarks.fbref_standin import FbrefStandIn, StandInLeague
+from downloader.cache import ResponseCache
+from downloader.downloader import Downloader
+
+
+def scrape(site, workers, request_interval, seasons=1, cache_folder=None, checkpoints_folder=None):
+    downloader = Downloader(workers=workers, request_interval=request_interval, base_url=site.base_url, cache=False)
+    downloader.max_seasons = seasons
+    downloader.logos_folder = tempfile.mkdtemp()
+    downloader.checkpoints_folder = checkpoints_folder or tempfile.mkdtemp()
+    if cache_folder is not None:
+        downloader.fetcher.cache = ResponseCache(cache_folder)
+
+    requests_before = site.requests
+    start = time.perf_counter()
+    data = downloader.all_data(StandInLeague(site))
+    elapsed = time.perf_counter() - start
+
+    return data, elapsed, site.requests - requests_before
+
+
+def backfill(latency, request_interval, teams, seasons=3):
+
+    """ Backfill of `seasons` seasons once in a row, then rate limited after half of its requests and resumed.
+    """
+
+    with FbrefStandIn(latency=latency, teams=teams, seasons=seasons) as site:
+        reference, _, total = scrape(site, 8, request_interval, seasons)
+        checkpoints_folder = tempfile.mkdtemp()
+
+        print(f"\n{'Backfill':>10}{'Requests':>10}{'Rows':>9}")
+        print(f"{'one run':>10}{total:>10}{len(reference):>9}")
+
+        site.rate_limit = site.requests + total // 2
+        try:
+            scrape(site, 8, request_interval, seasons, checkpoints_folder=checkpoints_folder)
+        except RuntimeError as e:
+            print(f"{'stopped':>10}{total // 2:>10}   {e}")
+        site.rate_limit = None
+
+        data, _, requests = scrape(site, 8, request_interval, seasons, checkpoints_folder=checkpoints_folder)
+        print(f"{'resumed':>10}{requests:>10}{len(data):>9}")
+
+        key = ['Team', 'Date']
+        data = data.sort_values(by=key).reset_index(drop=True)
+        reference = reference.sort_values(by=key).reset_index(drop=True)
+        assert data[reference.columns].equals(reference), "Resumed backfill changed the data"
+
+
+def main(latency=0.1, request_interval=0.02, teams=20):
+
+    with FbrefStandIn(latency=latency, teams=teams, seasons=1) as site:
+
+        print(f"Stand-in latency {latency * 1000:.0f} ms, token bucket {1 / request_interval:.0f} requests/s per host")
+        print(f"{'Workers':>8}{'Requests':>10}{'Time (s)':>10}{'Requests/s':>12}")
+
+        reference = None
+        for workers in [1, 2, 4, 8, 16]:
+            data, elapsed, requests = scrape(site, workers, request_interval)
+            print(f"{workers:>8}{requests:>10}{elapsed:>10.2f}{requests / elapsed:>12.1f}")
+
+            data = data.sort_values(by=['Team', 'Date']).reset_index(drop=True)
+            reference = data if reference is None else reference
+            assert data[reference.columns].equals(reference), "Concurrent scraping changed the data"
+
+        print(f"\n{'Cache':>8}{'Requests':>10}{'304':>6}{'Time (s)':>10}")
+        cache_folder = tempfile.mkdtemp()
+        for run in ["cold", "warm"]:
+            not_modified = site.not_modified
+            data, elapsed, requests = scrape(site, 8, request_interval, cache_folder=cache_folder)
+            print(f"{run:>8}{requests:>10}{site.not_modified - not_modified:>6}{elapsed:>10.2f}")
+
+            data = data.sort_values(by=['Team', 'Date']).reset_index(drop=True)
+            assert data[reference.columns].equals(reference), "Cached pages changed the data"
+
+    backfill(latency, request_interval, teams)
+
+
+if __name__ == '__main__':
+    main()
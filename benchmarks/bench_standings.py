@@ -0,0 +1,78 @@
+""" Rankings and lags: the StandingsEngine tables against the former ranking of the rows of each round (sort of the
+whole frame and cumcount) and groupby shifts of the lags, on the stored leagues. Also counts the rows whose
+ranking changed: the rounds with a postponed match, ranked on their rows only before.
+
+Run from the repository root:  python -m benchmarks.bench_standings
+"""
+
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from processing.processing import ProcessingFootball
+
+
+def legacy_ranking_and_lags(data):
+
+    """ _calculate_ranking and _calculate_lagged_features as they were before the StandingsEngine.
+    """
+
+    data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
+    data['Ranking'] = data.groupby(['Season', 'Round'], observed=True).cumcount() + 1
+
+    data.sort_values(by=['Season', 'Round', 'Team'], inplace=True)
+    data.reset_index(drop=True, inplace=True)
+    lag_cols = ['Points_Cum', 'GD_Cum', 'GF_Cum', 'GA_Cum']
+    data[[f'{col}_Lag' for col in lag_cols]] = data.groupby(['Season', 'Team'], observed=True)[lag_cols].shift(1)
+    data['Ranking_Lag'] = data.groupby(['Team'], observed=True)['Ranking'].shift(1)
+    return data
+
+
+def engine_ranking_and_lags(processer, data):
+    return processer.feature_graph.run(data, ["ranking", "lags"])
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(repeat=3):
+
+    warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
+    processer = ProcessingFootball()
+
+    print(f"{'League':<16}{'Rows':>7}{'Legacy (ms)':>13}{'Engine (ms)':>13}{'Speedup':>9}{'Ranking changed':>17}"
+          f"{'Lag changed':>13}")
+
+    for league in [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]:
+        raw = league.data.get_raw_data()
+        data = processer.feature_graph.run(processer._rename_and_drop_columns(processer._prepare_basic_columns(raw)), ["cumulatives"])
+
+        legacy_time, legacy = best_of(lambda: legacy_ranking_and_lags(data.copy()), repeat)
+        engine_time, engine = best_of(lambda: engine_ranking_and_lags(processer, data.copy()), repeat)
+
+        # every table ranks all the teams of the season once
+        teams = engine.groupby('Season')['Team'].nunique()
+        for (season, round_), rows in engine.drop_duplicates(subset=['Season', 'Round', 'Team']).groupby(['Season', 'Round']):
+            assert rows['Ranking'].is_unique and rows['Ranking'].max() <= teams[season], f"Ranking of {season} round {round_}"
+
+        key = ['Season', 'Round', 'Team', 'DateTime']
+        legacy = legacy.sort_values(by=key).reset_index(drop=True)
+        engine = engine.sort_values(by=key).reset_index(drop=True)
+        ranking_changed = (legacy['Ranking'] != engine['Ranking']).sum()
+        lag_changed = (~np.isclose(legacy['Ranking_Lag'], engine['Ranking_Lag'], equal_nan=True)).sum()
+
+        print(f"{league.name:<16}{len(data):>7}{legacy_time * 1000:>13.1f}{engine_time * 1000:>13.1f}"
+              f"{legacy_time / engine_time:>8.1f}x{ranking_changed:>17}{lag_changed:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""" Storage: CSV against partitioned Parquet for full reads, model column projection, DateTime filters and writes,
+then the update of a league with the last scrape: CSV rewrite against an append to the segment backend.
+
+Run from the repository root:  python -m benchmarks.bench_storage
+The Parquet copy is written to a temporary folder, storage/ is left untouched.
+"""
+
+import tempfile
+import time
+
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from processing.processing import ProcessingFootball
+from storage.backends import CsvBackend, ParquetBackend
+from storage.migrate import migrate_csv_to_parquet
+from storage.segments import SegmentBackend
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(repeat=5):
+
+    model_columns = ProcessingFootball().model_raw_columns()
+
+    with tempfile.TemporaryDirectory() as folder:
+        migrate_csv_to_parquet('storage', folder)
+        csv, parquet = CsvBackend('storage'), ParquetBackend(folder)
+
+        print(f"\n{'League':<16}{'Operation':<22}{'CSV (ms)':>10}{'Parquet (ms)':>14}{'Speedup':>9}")
+
+        for league in [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]:
+            name = league.name
+            last_season = pd.Timestamp(csv.read(name, columns=['Date'])['Date'].max()) - pd.DateOffset(months=6)
+            data = csv.read(name)
+
+            operations = {
+                "full read": lambda backend: backend.read(name),
+                "model columns": lambda backend: backend.read(name, columns=model_columns),
+                "last 6 months": lambda backend: backend.read(name, start=last_season),
+                "write": lambda backend: backend.write(data, name) if backend is parquet else
+                         data.to_csv(f"{folder}/{name}_data.csv", index=False),
+            }
+
+            for operation, function in operations.items():
+                csv_time = best_of(lambda: function(csv), repeat)
+                parquet_time = best_of(lambda: function(parquet), repeat)
+                print(f"{name:<16}{operation:<22}{csv_time * 1000:>10.1f}{parquet_time * 1000:>14.1f}{csv_time / parquet_time:>8.1f}x")
+
+            league.data.backend = parquet
+            from_parquet = league.data.get_data_for_prediction()
+            league.data.backend = csv
+            from_csv = league.data.get_data_for_prediction()
+            assert from_parquet.shape == from_csv.shape, "Prediction data differs between the backends"
+
+        appends(folder)
+
+
+def appends(folder, updates=10):
+
+    """ `updates` scrapes of the last rounds (a scrape also returns the already stored matches of the season)
+    appended to a copy of the Premier League history, with each backend.
+    """
+
+    name = 'Premier League'
+    data = CsvBackend('storage').read(name)
+    dates = sorted(data['Date'].unique())
+    history = data[data['Date'] < dates[-updates]]
+
+    print(f"\n{updates} updates of {name}{'':<8}{'CSV (ms)':>10}{'Segments (ms)':>15}{'Speedup':>9}")
+    timings = {}
+    for backend in [CsvBackend(f"{folder}/csv"), SegmentBackend(f"{folder}/segments", max_segments=updates + 1)]:
+        backend.write(history, name)
+        start = time.perf_counter()
+        for date in dates[-updates:]:
+            backend.append(data[(data['Date'] <= date) & (data['Date'] >= dates[-updates - 40])], name)
+        timings[type(backend).__name__] = (time.perf_counter() - start) / updates
+        rows = len(backend.read(name, columns=['Date']))
+
+    csv_time, segment_time = timings['CsvBackend'], timings['SegmentBackend']
+    print(f"{'append, per update':<32}{csv_time * 1000:>10.1f}{segment_time * 1000:>15.1f}{csv_time / segment_time:>8.1f}x"
+          f"   ({rows} rows stored)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+""" Wall time and peak memory of the processing stages on synthetic leagues (benchmarks.synthetic), against the
+baseline stored in benchmarks/baselines/synthetic.json: exits with status 1 when a stage is slower or takes more
+memory than its baseline by more than the threshold.
+
+Run from the repository root:
+    python -m benchmarks.bench_synthetic [--leagues 4] [--seasons 10] [--teams 20] [--repeat 3] [--compact]
+                                         [--threshold 0.25] [--update-baseline]
+
+The first run of a scale (leagues x seasons x teams, compact or not) records its baseline, --update-baseline
+replaces it after an intended change. Wall times depend on the machine: compare runs of the same machine.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_league
+from processing.processing import ProcessingFootball
+from storage.schema import CompactSchema
+
+
+BASELINE_PATH = os.path.join('benchmarks', 'baselines', 'synthetic.json')
+
+STAGES = {
+    "initial_processing": lambda processer, data, future: processer.initial_processing(data),
+    "features_processing": lambda processer, data, future: processer.features_processing(data),
+    "prediction_processing": lambda processer, data, future: processer.prediction_processing(data),
+    "futur_prediciton_processing": lambda processer, data, future: processer.futur_prediciton_processing(data, future),
+}
+
+
+def leagues(count, seasons, teams, schema=None) -> list:
+
+    """ (raw data, future matches) of `count` synthetic leagues, restricted to the columns the processing
+    reads from the storage (and with the compact dtypes with a schema), as DataManager gives them.
+    """
+
+    columns = ProcessingFootball().model_raw_columns()
+    generated = []
+    for number in range(count):
+        data, future = synthetic_league(f"League {number + 1:02d}", seasons=seasons, teams=teams, seed=number)
+        data = data[[col for col in columns if col in data.columns]]
+        if schema is not None:
+            data, future = schema.apply(data), schema.apply(future)
+        generated.append((data, future))
+    return generated
+
+
+def measure(generated, schema=None, repeat=3) -> dict:
+
+    """ {stage: {"seconds", "peak_mb"}}: best wall time of `repeat` runs over all the leagues, and the largest
+    peak of the Python allocations of a league (measured in another run, tracemalloc slows the code down).
+    """
+
+    results = {}
+    for stage, run in STAGES.items():
+        best = np.inf
+        for _ in range(repeat):
+            elapsed = 0.0
+            for data, future in generated:
+                processer = ProcessingFootball(schema)
+                data, future = data.copy(), future.copy()
+                start = time.perf_counter()
+                run(processer, data, future)
+                elapsed += time.perf_counter() - start
+            best = min(best, elapsed)
+
+        peak = 0
+        tracemalloc.start()
+        for data, future in generated:
+            processer = ProcessingFootball(schema)
+            data, future = data.copy(), future.copy()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            run(processer, data, future)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+
+        results[stage] = {"seconds": round(best, 4), "peak_mb": round(peak / 1024 ** 2, 2)}
+    return results
+
+
+def compare(results, baseline, threshold) -> list:
+
+    """ (stage, metric, value, baseline) of every measure above its baseline by more than `threshold`.
+    """
+
+    regressions = []
+    for stage, measures in results.items():
+        for metric, value in measures.items():
+            reference = baseline.get(stage, {}).get(metric)
+            if reference and value > reference * (1 + threshold):
+                regressions.append((stage, metric, value, reference))
+    return regressions
+
+
+def load_baselines(path=BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baselines(baselines, path=BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def main(arguments=None) -> int:
+
+    parser = argparse.ArgumentParser(description="Processing benchmark on synthetic leagues")
+    parser.add_argument("--leagues", type=int, default=4)
+    parser.add_argument("--seasons", type=int, default=10)
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    arguments = parser.parse_args(arguments)
+
+    warnings.filterwarnings('ignore')
+    schema = CompactSchema() if arguments.compact else None
+    scale = f"{arguments.leagues}x{arguments.seasons}x{arguments.teams}{'-compact' if arguments.compact else ''}"
+
+    start = time.perf_counter()
+    generated = leagues(arguments.leagues, arguments.seasons, arguments.teams, schema)
+    rows = sum(len(data) for data, _ in generated)
+    print(f"{arguments.leagues} leagues x {arguments.seasons} seasons x {arguments.teams} teams: {rows} rows "
+          f"generated in {time.perf_counter() - start:.1f} s")
+
+    results = measure(generated, schema, arguments.repeat)
+    baselines = load_baselines(arguments.baseline)
+    baseline = baselines.get(scale, {})
+
+    print(f"\n{'Stage':<30}{'Time (s)':>10}{'Baseline':>10}{'Peak (MB)':>11}{'Baseline':>10}")
+    for stage, measures in results.items():
+        reference = baseline.get(stage, {})
+        print(f"{stage:<30}{measures['seconds']:>10.3f}{reference.get('seconds', np.nan):>10.3f}"
+              f"{measures['peak_mb']:>11.1f}{reference.get('peak_mb', np.nan):>10.1f}")
+
+    if not baseline or arguments.update_baseline:
+        baselines[scale] = results
+        save_baselines(baselines, arguments.baseline)
+        print(f"\nBaseline of {scale} saved in {arguments.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, arguments.threshold)
+    for stage, metric, value, reference in regressions:
+        print(f"REGRESSION {stage} {metric}: {value} against {reference} (+{value / reference - 1:.0%})")
+    if not regressions:
+        print(f"\nNo stage above its baseline by more than {arguments.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+""" Local stand-in for fbref.com: a threaded HTTP server generating fbref-shaped league, team and match log
+pages (same URLs layout, table ids, two-level stats headers, `button2 prev` season links, player tables and
+tables hidden in HTML comments around the one scraped), so the Downloader can be run and benchmarked offline.
+
+    with FbrefStandIn(latency=0.05) as site:
+        Downloader(base_url=site.base_url).all_data(StandInLeague(site))
+"""
+
+import datetime
+import hashlib
+import html
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from leagues.league import League
+
+
+BASE_COLUMNS = ["Date", "Time", "Comp", "Round", "Day", "Venue", "Result", "GF", "GA", "Opponent"]
+
+FIXTURE_COLUMNS = BASE_COLUMNS + ["xG", "xGA", "Poss", "Attendance", "Captain", "Formation", "Referee", "Match Report", "Notes"]
+
+STATS_PAGES = {
+    "defense": ["Tackles_Tkl", "Tackles_TklW", "Tackles_Def 3rd", "Tackles_Mid 3rd", "Tackles_Att 3rd", "Challenges_Tkl",
+                "Challenges_Att", "Challenges_Tkl%", "Challenges_Lost", "Blocks_Blocks", "Blocks_Sh", "Blocks_Pass", "Int",
+                "Tkl+Int", "Clr", "Err"],
+    "possession": ["Touches_Touches", "Touches_Def Pen", "Touches_Def 3rd", "Touches_Mid 3rd", "Touches_Att 3rd",
+                   "Touches_Att Pen", "Touches_Live", "Take-Ons_Att", "Take-Ons_Succ", "Take-Ons_Succ%", "Take-Ons_Tkld",
+                   "Take-Ons_Tkld%", "Carries_Carries", "Carries_TotDist", "Carries_PrgDist", "Carries_PrgC", "Carries_1/3",
+                   "Carries_CPA", "Carries_Mis", "Carries_Dis", "Receiving_Rec", "Receiving_PrgR"],
+    "shooting": ["Standard_Gls", "Standard_Sh", "Standard_SoT", "Standard_SoT%", "Standard_G/Sh", "Standard_G/SoT",
+                 "Standard_Dist", "Standard_FK", "Standard_PK", "Standard_PKatt", "Expected_xG", "Expected_npxG",
+                 "Expected_npxG/Sh", "Expected_G-xG", "Expected_np:G-xG"],
+    "passing": ["Total_Cmp", "Total_Att", "Total_Cmp%", "Total_TotDist", "Total_PrgDist", "Short_Cmp", "Short_Att",
+                "Short_Cmp%", "Medium_Cmp", "Medium_Att", "Medium_Cmp%", "Long_Cmp", "Long_Att", "Long_Cmp%", "Ast", "xAG",
+                "xA", "KP", "1/3", "PPA", "CrsPA", "PrgP"],
+    "keeper": ["Performance_SoTA", "Performance_GA", "Performance_Saves", "Performance_Save%", "Performance_CS",
+               "Performance_PSxG", "Performance_PSxG+/-", "Penalty Kicks_PKatt", "Penalty Kicks_PKA", "Penalty Kicks_PKsv",
+               "Penalty Kicks_PKm", "Launched_Cmp", "Launched_Att", "Launched_Cmp%", "Passes_Att (GK)", "Passes_Thr",
+               "Passes_Launch%", "Passes_AvgLen", "Goal Kicks_Att", "Goal Kicks_Launch%", "Goal Kicks_AvgLen",
+               "Crosses_Opp", "Crosses_Stp", "Crosses_Stp%", "Sweeper_#OPA", "Sweeper_AvgDist"],
+}
+
+PLAYER_TABLES = ["standard", "keeper", "shooting", "passing", "defense", "possession"]
+
+# 1x1 transparent PNG
+LOGO = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                     "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082")
+
+
+def seed(*parts):
+    return int(hashlib.sha1("/".join(parts).encode()).hexdigest()[:8], 16)
+
+
+def slug(name):
+    return name.replace(" ", "-")
+
+
+class StandInLeague(League):
+
+    """ League whose fbref_url points to a running FbrefStandIn.
+    """
+
+    def __init__(self, site):
+        super().__init__(country='Nowhere', name=site.league_name, fbref_url=site.league_url)
+
+    def mapping(self):
+        return {}
+
+
+class FbrefSite:
+
+    """ Deterministic content of the stand-in: `teams` clubs playing a double round robin every season,
+    the last season being played up to `played_rounds`. The matches of a round are spread over `round_days`
+    days. Once set_now() is called, the matches of the last season are played two hours after their kickoff
+    instead (simulated time).
+    """
+
+    def __init__(self, league_name="Stand-in League", teams=20, seasons=6, played_rounds=20, last_season=2023,
+                 round_days=1):
+        self.league_name = league_name
+        self.teams = [f"Club {i:02d}" for i in range(1, teams + 1)]
+        self.seasons = [f"{year}-{year + 1}" for year in range(last_season - seasons + 1, last_season + 1)]
+        self.played_rounds = played_rounds
+        self.round_days = round_days
+        self.now = None
+
+    def set_now(self, now):
+        self.now = now
+        FbrefSite.schedule.cache_clear()
+        FbrefSite.team_matches.cache_clear()
+
+    def current(self, season):
+        return season == self.seasons[-1]
+
+    def league_path(self, season):
+        if self.current(season):
+            return f"/en/comps/99/{slug(self.league_name)}-Stats"
+        return f"/en/comps/99/{season}/{season}-{slug(self.league_name)}-Stats"
+
+    def team_path(self, season, team):
+        if self.current(season):
+            return f"/en/squads/{slug(team)}/{slug(team)}-Stats"
+        return f"/en/squads/{slug(team)}/{season}/{slug(team)}-Stats"
+
+    def matchlog_path(self, season, team, page):
+        return f"/en/squads/{slug(team)}/{season}/matchlogs/all_comps/{page}/{slug(team)}-Match-Logs-All-Competitions"
+
+    @lru_cache(maxsize=None)
+    def schedule(self, season):
+
+        """ [(round, date, home, away, home goals, away goals)] of the season, goals None when not played.
+        """
+
+        rng = np.random.default_rng(int(season[:4]))
+        teams = list(self.teams)
+        n = len(teams)
+        start = datetime.date(int(season[:4]), 8, 12)
+        matches = []
+
+        for round_ in range(2 * (n - 1)):
+            rotation = teams[:1] + teams[1:][round_ % (n - 1):] + teams[1:][:round_ % (n - 1)]
+            for i in range(n // 2):
+                date = start + datetime.timedelta(days=7 * round_ + i % self.round_days)
+                if not self.current(season):
+                    played = True
+                elif self.now is None:
+                    played = round_ < self.played_rounds
+                else:
+                    played = datetime.datetime.combine(date, datetime.time(23)) <= self.now
+                home, away = rotation[i], rotation[n - 1 - i]
+                if round_ >= n - 1:
+                    home, away = away, home
+                # drawn for every match, so that the results do not depend on the matches played so far
+                goals = (int(rng.poisson(1.5)), int(rng.poisson(1.1)))
+                matches.append((round_ + 1, date, home, away) + (goals if played else (None, None)))
+
+        return matches
+
+    @lru_cache(maxsize=None)
+    def team_matches(self, season, team):
+        rows = []
+        for round_, date, home, away, home_goals, away_goals in self.schedule(season):
+            if team not in (home, away):
+                continue
+            venue = "Home" if team == home else "Away"
+            gf, ga = (home_goals, away_goals) if venue == "Home" else (away_goals, home_goals)
+            result = "" if gf is None else ("W" if gf > ga else "D" if gf == ga else "L")
+            rows.append({
+                "Date": date.isoformat(), "Time": "21:00", "Comp": self.league_name, "Round": f"Matchweek {round_}",
+                "Day": date.strftime("%a"), "Venue": venue, "Result": result, "GF": "" if gf is None else gf,
+                "GA": "" if ga is None else ga, "Opponent": away if venue == "Home" else home,
+            })
+        return rows
+
+    def league_page(self, season):
+        index = self.seasons.index(season)
+        previous = f'<a class="button2 prev" href="{self.league_path(self.seasons[index - 1])}">Previous Season</a>' if index else ''
+        rows = "".join(f'<tr><th>{rank}</th><td><a href="{self.team_path(season, team)}">{html.escape(team)}</a></td></tr>'
+                       for rank, team in enumerate(self.teams, 1))
+        return (f'<html><body><h1>{season} {self.league_name} Stats</h1>{previous}'
+                f'<table class="stats_table" id="results{season}_overall"><thead><tr><th>Rk</th><th>Squad</th></tr></thead>'
+                f'<tbody>{rows}</tbody></table></body></html>')
+
+    def team_page(self, season, team):
+
+        rng = np.random.default_rng(seed(season, team))
+        rows = []
+        for match in self.team_matches(season, team):
+            played = match["Result"] != ""
+            extra = {
+                "xG": round(rng.uniform(0.2, 3), 1) if played else "", "xGA": round(rng.uniform(0.2, 3), 1) if played else "",
+                "Poss": int(rng.integers(30, 70)) if played else "", "Attendance": f"{int(rng.integers(5000, 60000)):,}" if played else "",
+                "Captain": "Some Player" if played else "", "Formation": "4-3-3" if played else "",
+                "Referee": "Some Referee", "Match Report": "Match Report" if played else "Head-to-Head", "Notes": "",
+            }
+            rows.append({**match, **extra})
+
+        links = "".join(f'<a href="{self.matchlog_path(season, team, page)}">{page}</a>'
+                        for page in list(STATS_PAGES) + ["passing_types", "misc"])
+
+        # fbref only sends the first player table as HTML, the others are in comments filled in by javascript
+        players = "".join(hidden(table, index > 0) for index, table in
+                          enumerate(players_table(rng, f"stats_{name}_99", f"{name.title()} Stats") for name in PLAYER_TABLES))
+
+        return (f'<html><body><img class="teamlogo" src="/logos/{slug(team)}.png">'
+                f'<div class="filter">{links}</div>{players}'
+                f'{table("matchlogs_for", "Scores & Fixtures Table", [(None, col) for col in FIXTURE_COLUMNS], rows)}'
+                f'</body></html>')
+
+    def stats_page(self, season, team, page):
+
+        rng = np.random.default_rng(seed(season, team, page))
+        columns = [(None, col) for col in BASE_COLUMNS] + \
+                  [tuple(col.split("_", 1)) if "_" in col else (None, col) for col in STATS_PAGES[page]] + [(None, "Match Report")]
+
+        rows = []
+        for match in self.team_matches(season, team):
+            if match["Result"] == "":
+                continue
+            row = dict(match, **{"Match Report": "Match Report"})
+            for col in STATS_PAGES[page]:
+                row[col] = round(float(rng.gamma(2.0, 10.0)), 1) if "%" in col or "Dist" in col or "x" in col \
+                    else int(rng.poisson(8))
+            rows.append(row)
+
+        stats_columns = [col for col in BASE_COLUMNS] + STATS_PAGES[page] + ["Match Report"]
+        against = [dict(row, Opponent=f"vs {row['Opponent']}") for row in rows]
+        return (f'<html><body><h1>{team} Match Logs</h1>'
+                f'{table("matchlogs_for", f"{page.title()} Table", columns, rows, stats_columns)}'
+                f'{hidden(table("matchlogs_against", f"{page.title()} Against Table", columns, against, stats_columns))}'
+                f'</body></html>')
+
+    def route(self, path):
+
+        """ Body and content type of `path`, None when it does not exist.
+        """
+
+        for season in self.seasons:
+            if path == self.league_path(season):
+                return self.league_page(season).encode(), "text/html"
+            for team in self.teams:
+                if path == self.team_path(season, team):
+                    return self.team_page(season, team).encode(), "text/html"
+                for page in STATS_PAGES:
+                    if path == self.matchlog_path(season, team, page):
+                        return self.stats_page(season, team, page).encode(), "text/html"
+        if path.startswith("/logos/"):
+            return LOGO, "image/png"
+        return None
+
+
+def table(table_id, caption, columns, rows, keys=None):
+
+    """ fbref-like stats table. `columns` are (group, name) pairs, a two-level header is written when a
+    group is set; `keys` are the row dict keys of the columns (default: the names).
+    """
+
+    keys = keys or [name for _, name in columns]
+    header = ""
+    if any(group for group, _ in columns):
+        groups, previous = [], object()
+        for group, _ in columns:
+            if groups and group == previous:
+                groups[-1][1] += 1
+            else:
+                groups.append([group, 1])
+            previous = group
+        header += "<tr class=\"over_header\">" + "".join(
+            f'<th colspan="{span}">{html.escape(group or "")}</th>' for group, span in groups) + "</tr>"
+    header += "<tr>" + "".join(f'<th data-stat="{html.escape(name)}">{html.escape(name)}</th>' for _, name in columns) + "</tr>"
+
+    # as on fbref, the first cell of a row is a <th>
+    body = "".join("<tr>" + "".join(f"<{tag}>{html.escape(str(row.get(key, '')))}</{tag}>"
+                                    for tag, key in zip(["th"] + ["td"] * (len(keys) - 1), keys)) + "</tr>" for row in rows)
+
+    return (f'<table class="stats_table" id="{table_id}"><caption>{html.escape(caption)}</caption>'
+            f'<thead>{header}</thead><tbody>{body}</tbody></table>')
+
+
+def players_table(rng, table_id, caption, players=25, columns=30):
+    names = ["Player", "Nation", "Pos"] + [f"Stat {i}" for i in range(columns - 3)]
+    rows = [dict({"Player": f"Player {i}", "Nation": "xx", "Pos": "MF"},
+                 **{name: round(float(value), 1) for name, value in zip(names[3:], rng.gamma(2.0, 10.0, columns - 3))})
+            for i in range(players)]
+    return table(table_id, caption, [(None, name) for name in names], rows)
+
+
+def hidden(content, commented=True):
+    table_id = content.split('id="', 1)[1].split('"', 1)[0]
+    return f'<div id="all_{table_id}"><!--\n{content}\n--></div>' if commented else f'<div id="all_{table_id}">{content}</div>'
+
+
+class FbrefStandIn:
+
+    """ Serves an FbrefSite on localhost in a background thread. Every response waits `latency` seconds
+    (network round trip). `requests` counts the served requests, `not_modified` the 304 answers to
+    conditional requests (If-None-Match on the ETag). Once `rate_limit` requests are served, the next ones are
+    answered 429 Too Many Requests (as fbref does with too fast clients) until it is set back to None.
+    `egresses` counts the requests per proxy they came through (their Via header, "direct" without).
+    """
+
+    def __init__(self, latency=0.05, **site_options):
+        self.site = FbrefSite(**site_options)
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self.rate_limit = None
+        self.egresses = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def league_name(self):
+        return self.site.league_name
+
+    @property
+    def league_url(self):
+        return self.base_url + self.site.league_path(self.site.seasons[-1])
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests += 1
+                    standin.egresses[self.headers.get("Via", "direct").split(" ")[-1]] += 1
+                    limited = standin.rate_limit is not None and standin.requests > standin.rate_limit
+                time.sleep(standin.latency)
+
+                if limited:
+                    self.send_error(429)
+                    return
+
+                page = standin.site.route(self.path)
+                if page is None:
+                    self.send_error(404)
+                    return
+
+                body, content_type = page
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    with standin._lock:
+                        standin.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type + "; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
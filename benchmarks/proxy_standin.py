@@ -0,0 +1,105 @@
+""" Local stand-in HTTP proxies, to run the ProxyPool of the Downloader offline against the FbrefStandIn.
+
+    with FbrefStandIn() as site, StandInProxy(latency=0.02) as proxy:
+        Downloader(base_url=site.base_url, proxies=ProxyPool([proxy.address])).all_data(StandInLeague(site))
+"""
+
+import http.client
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+FORWARDED_HEADERS = ["User-Agent", "If-None-Match", "Accept", "Accept-Encoding"]
+
+
+def dead_address() -> str:
+
+    """ Address of a local port nobody listens on (the connections to it are refused).
+    """
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+class StandInProxy:
+
+    """ Forward HTTP proxy on localhost in a background thread (plain http only, no CONNECT): every request
+    waits `latency` seconds more, and `failure_rate` of them are answered 502 Bad Gateway. Once `down` is set,
+    the connections are closed without answer. The forwarded requests carry a `Via` header with the name of the
+    proxy, so that the site can tell the egresses apart. `requests` counts the requests received.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, name=None, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.name = name
+        self.down = False
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self._server.server_address[1]}"
+
+    def _handler(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                with proxy._lock:
+                    proxy.requests += 1
+                    failed = proxy._random.random() < proxy.failure_rate
+                if proxy.down:
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                time.sleep(proxy.latency)
+                if failed:
+                    self.send_error(502)
+                    return
+
+                target = urlsplit(self.path)
+                headers = {header: self.headers[header] for header in FORWARDED_HEADERS if header in self.headers}
+                headers["Via"] = f"1.1 {proxy.name or proxy.address}"
+                connection = http.client.HTTPConnection(target.netloc, timeout=30)
+                try:
+                    path = target.path + ("?" + target.query if target.query else "")
+                    connection.request("GET", path, headers=headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                except OSError:
+                    self.send_error(504)
+                    return
+                finally:
+                    connection.close()
+
+                self.send_response(response.status)
+                for header, value in response.getheaders():
+                    if header.lower() not in ("connection", "transfer-encoding", "content-length"):
+                        self.send_header(header, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
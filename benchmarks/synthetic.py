@@ -0,0 +1,133 @@
+""" Synthetic fbref-shaped leagues, to benchmark the processing at scales the scraped storage does not reach.
+
+A league is a double round robin per season (every team once per round, home and away legs), one row per team
+and match with the raw fbref columns of storage/data: both rows of a match agree (goals, xG, possession,
+attendance, referee), the stats are random around the averages of the Premier League storage. The last season
+is played up to `played_rounds`, its next rounds are the future matches (as in storage/futur_matches).
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage.schema import FLOAT_COLUMNS
+
+
+MATCH_COLUMNS = ['Date', 'Time', 'Comp', 'Round', 'Day', 'Venue', 'Result', 'GF', 'GA', 'Opponent', 'xG', 'xGA',
+                 'Poss', 'Attendance', 'Captain', 'Formation', 'Referee', 'Match Report', 'Notes', 'Team']
+
+# Average per team and match of the stats of the match logs (Premier League storage)
+STAT_MEANS = {
+    'Touches_Touches': 615.7, 'Touches_Def Pen': 63.5, 'Touches_Def 3rd': 194.0, 'Touches_Mid 3rd': 276.4,
+    'Touches_Att 3rd': 151.1, 'Touches_Att Pen': 22.5, 'Touches_Live': 615.6, 'Take-Ons_Att': 16.9,
+    'Take-Ons_Succ': 9.1, 'Take-Ons_Succ%': 53.8, 'Take-Ons_Tkld': 7.2, 'Take-Ons_Tkld%': 42.7,
+    'Carries_Carries': 344.5, 'Carries_TotDist': 1827.1, 'Carries_PrgDist': 945.1, 'Carries_PrgC': 18.2,
+    'Carries_1/3': 13.4, 'Carries_CPA': 4.8, 'Carries_Mis': 14.9, 'Carries_Dis': 9.4, 'Receiving_Rec': 394.2,
+    'Receiving_PrgR': 37.8, 'Standard_Gls': 1.4, 'Standard_Sh': 12.5, 'Standard_SoT': 4.2, 'Standard_SoT%': 33.9,
+    'Standard_G/Sh': 0.1, 'Standard_G/SoT': 0.3, 'Standard_Dist': 17.4, 'Standard_FK': 0.4, 'Standard_PK': 0.1,
+    'Standard_PKatt': 0.1, 'Expected_xG': 1.4, 'Expected_npxG': 1.3, 'Expected_npxG/Sh': 0.1,
+    'Expected_G-xG': -0.0, 'Expected_np:G-xG': -0.0, 'Total_Cmp': 397.3, 'Total_Att': 504.5, 'Total_Cmp%': 77.0,
+    'Total_TotDist': 6882.7, 'Total_PrgDist': 2446.1, 'Short_Cmp': 185.6, 'Short_Att': 211.0, 'Short_Cmp%': 86.8,
+    'Medium_Cmp': 159.4, 'Medium_Att': 187.7, 'Medium_Cmp%': 83.1, 'Long_Cmp': 39.4, 'Long_Att': 74.8,
+    'Long_Cmp%': 52.3, 'Ast': 1.0, 'xAG': 1.0, 'xA': 0.9, 'KP': 9.3, '1/3': 29.9, 'PPA': 8.0, 'CrsPA': 1.9,
+    'PrgP': 38.2, 'Performance_SoTA': 4.3, 'Performance_GA': 1.4, 'Performance_Saves': 2.9,
+    'Performance_Save%': 69.4, 'Performance_CS': 0.3, 'Performance_PSxG': 1.3, 'Performance_PSxG+/-': -0.1,
+    'Penalty Kicks_PKatt': 0.1, 'Penalty Kicks_PKA': 0.1, 'Penalty Kicks_PKsv': 0.0, 'Penalty Kicks_PKm': 0.0,
+    'Launched_Cmp': 5.1, 'Launched_Att': 14.4, 'Launched_Cmp%': 36.9, 'Passes_Att (GK)': 25.6, 'Passes_Thr': 4.5,
+    'Passes_Launch%': 40.8, 'Passes_AvgLen': 35.4, 'Goal Kicks_Att': 7.3, 'Goal Kicks_Launch%': 55.1,
+    'Goal Kicks_AvgLen': 42.9, 'Crosses_Opp': 13.9, 'Crosses_Stp': 0.7, 'Crosses_Stp%': 5.5, 'Sweeper_#OPA': 1.1,
+    'Sweeper_AvgDist': 14.1, 'Tackles_Tkl': 16.6, 'Tackles_TklW': 9.6, 'Tackles_Def 3rd': 8.1,
+    'Tackles_Mid 3rd': 6.4, 'Tackles_Att 3rd': 2.0, 'Challenges_Tkl': 7.1, 'Challenges_Att': 16.3,
+    'Challenges_Tkl%': 44.4, 'Challenges_Lost': 9.1, 'Blocks_Blocks': 11.3, 'Blocks_Sh': 3.5, 'Blocks_Pass': 7.8,
+    'Int': 10.0, 'Tkl+Int': 26.6, 'Clr': 20.7, 'Err': 0.4,
+}
+
+FORMATIONS = ['4-3-3', '4-2-3-1', '3-4-3', '4-4-2', '4-1-2-1-2◆', '3-5-2', '5-4-1']
+
+
+def round_robin(teams) -> np.ndarray:
+
+    """ (rounds, teams / 2, 2) home and away team of every match of a double round robin (circle method, the
+    second half is the first one with the venues swapped).
+    """
+
+    assert teams % 2 == 0, "An even number of teams is needed"
+    order = np.arange(teams)
+    first_half = []
+    for round_ in range(teams - 1):
+        pairs = np.stack([order[:teams // 2], order[::-1][:teams // 2]], axis=1)
+        # alternate the venue of the fixed team
+        first_half.append(pairs[:, ::-1] if round_ % 2 else pairs)
+        order = np.concatenate([order[:1], np.roll(order[1:], 1)])
+    first_half = np.array(first_half)
+    return np.concatenate([first_half, first_half[:, :, ::-1]])
+
+
+def synthetic_league(name="Synthetic League", seasons=6, teams=20, first_year=2000, played_rounds=None,
+                     future_rounds=2, seed=0) -> (pd.DataFrame, pd.DataFrame):
+
+    """ (raw data, future matches) of a league of `teams` teams over `seasons` seasons starting in August of
+    `first_year`. The last season is played up to `played_rounds` (all but the last 8 rounds by default),
+    the `future_rounds` next rounds are the future matches.
+    """
+
+    rng = np.random.default_rng(seed)
+    schedule = round_robin(teams)
+    rounds = len(schedule)
+    played_rounds = rounds - 8 if played_rounds is None else played_rounds
+    team_names = np.array([f"{name} Club {number:02d}" for number in range(1, teams + 1)], dtype=object)
+
+    # one line per match: season, round, home, away
+    season = np.repeat(np.arange(seasons), rounds * (teams // 2))
+    round_ = np.tile(np.repeat(np.arange(rounds), teams // 2), seasons)
+    home, away = np.tile(schedule.reshape(-1, 2), (seasons, 1)).T
+    last_round = np.where(season == seasons - 1, played_rounds + future_rounds, rounds)
+    keep = round_ < last_round
+    season, round_, home, away = season[keep], round_[keep], home[keep], away[keep]
+    future = (season == seasons - 1) & (round_ >= played_rounds)
+    matches = len(season)
+
+    kick_off = (pd.to_datetime([datetime.date(first_year + year, 8, 10) for year in range(seasons)])[season]
+                + pd.to_timedelta(7 * round_, unit="D") + pd.Timedelta(hours=15))
+    home_xg, away_xg = rng.gamma(4, 0.4, matches).round(1), rng.gamma(4, 0.3, matches).round(1)
+    home_goals, away_goals = rng.poisson(home_xg), rng.poisson(away_xg)
+    home_possession = rng.integers(30, 71, matches)
+    attendance = rng.integers(8000, 75000, matches)
+    referee = rng.integers(0, 30, matches)
+
+    sides = []
+    for venue, team, opponent, gf, ga, xg, xga, possession in [
+            ('Home', home, away, home_goals, away_goals, home_xg, away_xg, home_possession),
+            ('Away', away, home, away_goals, home_goals, away_xg, home_xg, 100 - home_possession)]:
+        sides.append(pd.DataFrame({
+            'Date': kick_off.strftime('%Y-%m-%d'), 'Time': kick_off.strftime('%H:%M'), 'Comp': name,
+            'Round': 'Matchweek ' + pd.Series(round_ + 1).astype(str), 'Day': kick_off.strftime('%a'),
+            'Venue': venue, 'Result': np.select([gf > ga, gf < ga], ['W', 'L'], 'D'),
+            'GF': gf.astype(float), 'GA': ga.astype(float), 'Opponent': team_names[opponent],
+            'xG': xg, 'xGA': xga, 'Poss': possession.astype(float), 'Attendance': attendance.astype(float),
+            'Captain': team_names[team] + ' Captain', 'Formation': rng.choice(FORMATIONS, matches),
+            'Referee': 'Referee ' + pd.Series(referee).astype(str), 'Match Report': 'Match Report',
+            'Notes': np.nan, 'Team': team_names[team],
+        }))
+    data = pd.concat(sides, ignore_index=True)
+    is_future = np.concatenate([future, future])
+
+    stats = {}
+    for col, mean in STAT_MEANS.items():
+        if col in FLOAT_COLUMNS:
+            stats[col] = (mean + rng.normal(0, max(abs(mean) * 0.3, 0.1), len(data))).round(1 if abs(mean) >= 1 else 2)
+        else:
+            stats[col] = rng.poisson(mean, len(data)).astype(float)
+    data = pd.concat([data, pd.DataFrame(stats)], axis=1)
+
+    data = data.sort_values(by=['Date', 'Team'], kind='stable')
+    futur_matches = data[is_future[data.index]][MATCH_COLUMNS].reset_index(drop=True)
+    data = data[~is_future[data.index]].reset_index(drop=True)
+
+    unplayed = ['Result', 'GF', 'GA', 'xG', 'xGA', 'Poss', 'Attendance', 'Captain', 'Formation', 'Referee', 'Notes']
+    futur_matches[unplayed] = np.nan
+    futur_matches['Match Report'] = 'Head-to-Head'
+    futur_matches['DateTime'] = futur_matches['Date'] + ' ' + futur_matches['Time'] + ':00'
+
+    return data, futur_matches
@@ -0,0 +1,148 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+
+SEASON_IN_URL = re.compile(r"/(\d{4})-(\d{4})/")
+
+
+def current_season(today=None) -> str:
+    today = today or datetime.date.today()
+    year = today.year if today.month >= 8 else today.year - 1
+    return f"{year}-{year + 1}"
+
+
+def finished_season(url, today=None) -> bool:
+
+    """ True when the url is a page of a season that is over (fbref puts the season in the path of past
+    seasons and of the match logs): its content will never change.
+    """
+
+    match = SEASON_IN_URL.search(url)
+    return match is not None and f"{match.group(1)}-{match.group(2)}" < current_season(today)
+
+
+class ResponseCache:
+
+    """ On-disk HTTP response cache. Bodies are stored zlib-compressed under their sha256 (identical pages are
+    stored once), index.json maps every url to its body, validators (ETag / Last-Modified) and timestamps.
+
+    - pages of finished seasons are pinned: served forever without any request,
+    - other pages are served without request for `max_age` seconds, then revalidated with a conditional GET,
+    - unpinned entries unused for `ttl` seconds are evicted, and the least recently used ones when the bodies
+      take more than `max_bytes`.
+    """
+
+    def __init__(self, folder, max_age=0, ttl=30 * 24 * 3600, max_bytes=512 * 1024 ** 2):
+        self.folder = folder
+        self.max_age = max_age
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = self._load_index()
+
+    def _index_path(self):
+        return os.path.join(self.folder, "index.json")
+
+    def _body_path(self, digest):
+        return os.path.join(self.folder, "bodies", digest[:2], digest + ".zz")
+
+    def _load_index(self) -> dict:
+        if os.path.exists(self._index_path()):
+            with open(self._index_path(), "r", encoding="utf-8") as file:
+                return json.load(file)
+        return {}
+
+    def _save_index(self):
+        os.makedirs(self.folder, exist_ok=True)
+        temporary = self._index_path() + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.index, file)
+        os.replace(temporary, self._index_path())
+
+    def lookup(self, url):
+
+        """ (body, encoding, fresh, validators) of the cached url, None when it is not cached. `fresh` entries
+        can be used without request, the others need a conditional GET with the `validators` headers.
+        """
+
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                return None
+            try:
+                with open(self._body_path(entry["sha"]), "rb") as file:
+                    body = zlib.decompress(file.read())
+            except (OSError, zlib.error):
+                del self.index[url]
+                return None
+
+            entry["used"] = time.time()
+            fresh = entry["pinned"] or time.time() - entry["fetched"] < self.max_age
+            validators = {}
+            if entry.get("etag"):
+                validators["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                validators["If-Modified-Since"] = entry["last_modified"]
+
+            return body, entry["encoding"], fresh, validators
+
+    def store(self, url, body, encoding, headers):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._body_path(digest)
+
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "wb") as file:
+                    file.write(zlib.compress(body, 6))
+                os.replace(path + ".tmp", path)
+
+            now = time.time()
+            previous = self.index.get(url)
+            self.index[url] = {
+                "sha": digest, "encoding": encoding, "size": os.path.getsize(path),
+                "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                "fetched": now, "used": now, "pinned": finished_season(url),
+            }
+            if previous is not None:
+                self._remove_bodies([previous])
+            self._evict()
+            self._save_index()
+
+    def revalidated(self, url):
+
+        """ The server answered 304 Not Modified: the cached body is fresh again.
+        """
+
+        with self.lock:
+            if url in self.index:
+                self.index[url]["fetched"] = time.time()
+                self.index[url]["pinned"] = finished_season(url)
+                self._save_index()
+
+    def _evict(self):
+        now = time.time()
+        removed = [self.index.pop(url) for url, entry in list(self.index.items())
+                   if not entry["pinned"] and now - entry["used"] > self.ttl]
+
+        unpinned = sorted((entry["used"], url) for url, entry in self.index.items() if not entry["pinned"])
+        total = sum({entry["sha"]: entry["size"] for entry in self.index.values()}.values())
+        while total > self.max_bytes and unpinned:
+            _, url = unpinned.pop(0)
+            removed.append(self.index.pop(url))
+            if all(other["sha"] != removed[-1]["sha"] for other in self.index.values()):
+                total -= removed[-1]["size"]
+
+        self._remove_bodies(removed)
+
+    def _remove_bodies(self, entries):
+        referenced = {entry["sha"] for entry in self.index.values()}
+        for digest in {entry["sha"] for entry in entries} - referenced:
+            if os.path.exists(self._body_path(digest)):
+                os.remove(self._body_path(digest))
@@ -0,0 +1,54 @@
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+
+class BackfillCheckpoint:
+
+    """ Completed units of a league backfill, one file per (season, team, stat type) unit:
+    storage/checkpoints/{league}/{season}/{team}/{stat type}.pkl ("scores" for the fixtures of the team page),
+    plus json units for the links found on the pages (team urls of a season, match log urls of a team).
+    Files are written atomically, so a crashed or rate-limited run can resume by loading the completed units
+    instead of downloading them again.
+    """
+
+    def __init__(self, folder, league_name):
+        self.folder = os.path.join(folder, league_name)
+
+    def _path(self, season, team, unit, extension="pkl"):
+        parts = [self.folder, season] + ([re.sub(r'[\\/:*?"<>|]', '_', team)] if team else []) + [f"{unit}.{extension}"]
+        return os.path.join(*parts)
+
+    def _write(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def load(self, season, team, unit):
+        path = self._path(season, team, unit)
+        return pd.read_pickle(path) if os.path.exists(path) else None
+
+    def save(self, season, team, unit, data):
+        self._write(self._path(season, team, unit), lambda path: data.to_pickle(path))
+
+    def load_json(self, season, team, unit):
+        path = self._path(season, team, unit, "json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def save_json(self, season, team, unit, content):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(content, file)
+        self._write(self._path(season, team, unit, "json"), write)
+
+    def completed_units(self) -> int:
+        return sum(file_name.endswith(".pkl") for _, _, files in os.walk(self.folder) for file_name in files)
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
@@ -1,188 +1,412 @@
 from leagues.league import League
+from downloader.fetcher import Fetcher
+from downloader.cache import ResponseCache, SEASON_IN_URL, current_season
+from downloader.checkpoint import BackfillCheckpoint
+from downloader.extractor import FbrefPage
+from downloader.proxy import ProxyPool
+from storage.backends import match_season
+from profiling.trace import tracer, traced
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 import datetime
-import time
 import os
+from urllib.parse import urljoin
 
 class Downloader:
-    def __init__(self):
-        self.headers = {'User-Agent': 'Mozilla/5.0'}
-        self.last_request_time = None
-        self.request_interval = 3
-        self.max_seasons = 6
+    def __init__(self, workers=4, request_interval=3, burst=1, base_url="https://fbref.com", cache=True, proxies=None):
 
+        """ `workers` teams are scraped at the same time, every host sharing one token bucket of one request
+        per `request_interval` seconds (`burst` requests at most at once), as the former serial rate limit.
+        With `cache`, pages are kept in storage/http_cache (finished seasons are never downloaded again).
+        With `proxies` (a ProxyPool, or the path of a csv of proxies such as downloader/proxy.csv), the requests
+        go out through the proxies, within the same budget: a failing proxy does not stop the scrape.
+        A 429 answer of the site stops the requests to it (see Fetcher): the backfill stops and checkpoints.
+        """
 
-    def scrape_or_update(self, league: League) -> pd.DataFrame:
+        if isinstance(proxies, str):
+            proxies = ProxyPool.from_csv(proxies)
 
-        csv_file_path = os.path.join('storage/data', f"{league.name}_data.csv")
+        self.headers = {'User-Agent': 'Mozilla/5.0'}
+        self.request_interval = request_interval
+        self.max_seasons = 6
+        self.workers = workers
+        self.base_url = base_url
+        self.logos_folder = os.path.join('storage', 'logos')
+        self.cache_folder = os.path.join('storage', 'http_cache')
+        self.checkpoints_folder = os.path.join('storage', 'checkpoints')
+        self.clock = datetime.datetime.now
+        # time after the kickoff from which the match logs of a match are expected on fbref
+        self.result_delay = datetime.timedelta(hours=2)
+        self.fetcher = Fetcher(self.headers, rate=1 / request_interval, capacity=burst,
+                               cache=ResponseCache(self.cache_folder) if cache else None, proxies=proxies)
+
+
+    @traced()
+    def scrape_or_update(self, league: League) -> pd.DataFrame:
 
-        if os.path.exists(csv_file_path):
+        if league.data.backend.exists(league.name, "data"):
             self.update_data(league)
 
         else:
             data = self.all_data(league)
-            self.save_data(data, csv_file_path)
+            league.data.save_raw_data(data)
 
+    @traced()
     def update_data(self, league: League) -> pd.DataFrame:
 
-        path_data = os.path.join('storage/data', f"{league.name}_data.csv")
-        path_futur_matches = os.path.join('storage/futur_matches', f"{league.name}_futur_data.csv")
-        data = pd.read_csv(path_data)
-        futur_matches = pd.read_csv(path_futur_matches)
-        now = datetime.datetime.now()
+        futur_matches = league.data.backend.read(league.name, "futur_matches")
+        now = self.clock()
 
         first_futur_match = pd.to_datetime((futur_matches['Date'] + ' ' + futur_matches['Time']).min())
 
         if first_futur_match < now + datetime.timedelta(hours = 2):
-            scrapping = self.latest_data_and_futur_matches(league)
-            data = pd.concat([data, scrapping[0].copy()])
-            data.drop_duplicates(subset=['Date', 'Team', 'Opponent'], inplace=True)
-            data.to_csv(path_data)
-
-            futur_matches = self._futur_matches_process(scrapping[1].copy())
-            self.save_data(futur_matches, path_futur_matches)
+            self.refresh_league(league)
 
         else:
             print("No need to update")
             return
 
+    @traced()
+    def refresh_league(self, league: League, delta=True) -> pd.DataFrame:
+
+        """ Bring the current season of the league up to date: the matches not stored yet are appended to the
+        stored data, the future matches replaced. With `delta`, only the stale teams are scraped (see
+        stale_teams), and their stats pages only when they have new matches: the cost follows the matches
+        played since the last refresh. Returns the scraped rows (only the new ones with `delta`).
+        """
+
+        if delta:
+            return self.update_teams(league, self.stale_teams(league))
+
+        data, fixtures = self.latest_data_and_futur_matches(league)
+        # only the played matches not stored yet are written (a stored unplayed match would hide its result)
+        data = data.dropna(subset=['Result'])
+        league.data.append_raw_data(data.copy())
+
+        futur_matches = self._futur_matches_process(fixtures.copy(), league)
+        league.data.save_raw_future_matches(futur_matches)
+        return data
+
+    @traced()
+    def update_teams(self, league: League, teams) -> pd.DataFrame:
+
+        """ Scrape only `teams` (e.g. the ones which just played): their matches not stored yet are appended to
+        the stored data and their future matches replaced, the other teams are left as they are. The stats
+        pages of a team are only downloaded when its team page has matches played after its last stored one.
+        Returns the scraped rows of these new matches.
+        """
+
+        if not teams:
+            return pd.DataFrame()
+
+        teams_urls = [url for url in self._fetch_team_urls(league.fbref_url) if self._team_name(url) in teams]
+        scraped = self._scrape_teams(teams_urls, league, since=self._last_match_dates(league))
+
+        if not scraped:
+            # (none of the teams is on the league page)
+            return pd.DataFrame()
+
+        data = pd.concat([team_data for team_data, _ in scraped], ignore_index=True)
+        if not data.empty:
+            data = data.dropna(subset=['Result'])
+            league.data.append_raw_data(data.copy())
+
+        # teams which could not be scraped, or with a match over but without result yet, keep their calendar
+        updated = [self._team_name(url) for url, (_, fixtures) in zip(teams_urls, scraped)
+                   if not fixtures.empty and not self._awaiting_result(fixtures).any()]
+        futur_matches = pd.concat([pd.DataFrame()] + [fixtures for url, (_, fixtures) in zip(teams_urls, scraped)
+                                                       if self._team_name(url) in updated], ignore_index=True)
+        if not futur_matches.empty:
+            futur_matches = self._futur_matches_process(futur_matches, league)
+        if league.data.backend.exists(league.name, "futur_matches"):
+            stored = league.data.backend.read(league.name, "futur_matches")
+            futur_matches = pd.concat([stored[~stored['Team'].isin(updated)], futur_matches], ignore_index=True)
+        if not futur_matches.empty:
+            futur_matches['DateTime'] = pd.to_datetime(futur_matches['Date'] + ' ' + futur_matches['Time'])
+            league.data.save_raw_future_matches(futur_matches.sort_values(by="DateTime", kind='stable'))
+
+        return data
+
+    @traced()
     def all_data(self, league: League) -> pd.DataFrame:
+
+        """ Backfill of the last `max_seasons` seasons, following the "Previous Season" link of the league page.
+        Every completed (season, team, stat type) unit is checkpointed in storage/checkpoints: when a run stops
+        (crash, rate limiting, missing page), the next one only scrapes the missing units.
+        """
+
+        checkpoint = BackfillCheckpoint(self.checkpoints_folder, league.name)
         all_seasons_data = []
-        
-        for saison in range(self.max_seasons):
-            teams_urls = self._fetch_team_urls(league.fbref_url)
-
-            for team_url in teams_urls:
-                self.scrape_and_save_logo(team_url, league.name)
-                team_data = self._scrape_team_data(team_url)
-                team_data = self._scrape_detailed_stats(team_data, requests.get(team_url, headers=self.headers).text)
-                team_data = team_data[team_data['Comp'] == league.name]
+        season_url = league.fbref_url
+        complete = True
+
+        for _ in range(self.max_seasons):
+            try:
+                season, teams_urls, season_url = self._fetch_season(season_url, checkpoint)
+            except requests.RequestException as e:
+                print(f"League page not downloaded: {season_url} - Erreur: {e}")
+                complete = False
+                break
+
+            for team_data, _ in self._scrape_teams(teams_urls, league, logos=True, checkpoint=checkpoint, season=season):
                 all_seasons_data.append(team_data)
+                complete = complete and not team_data.empty
 
-        return pd.concat(all_seasons_data, ignore_index=True)
+            if season_url is None:
+                break
+
+        if not complete:
+            raise RuntimeError(f"Backfill of {league.name} incomplete ({checkpoint.completed_units()} units "
+                               f"checkpointed in {checkpoint.folder}), run it again to resume")
 
+        checkpoint.clear()
+        return pd.concat(all_seasons_data, ignore_index=True)
 
+    @traced()
+    def _fetch_season(self, league_url: str, checkpoint: BackfillCheckpoint) -> (str, list, str):
+
+        """ (season, teams urls, previous season url or None) of a league page. The links of past seasons are
+        checkpointed, the current season page is always downloaded again (its url does not contain the season).
+        """
+
+        match = SEASON_IN_URL.search(league_url)
+        if match is not None:
+            season = f"{match.group(1)}-{match.group(2)}"
+            links = checkpoint.load_json(season, None, "season")
+            if links is not None:
+                return season, links["teams"], links["previous"]
+
+        page = FbrefPage(self.fetcher.get(league_url))
+        teams_urls = self._team_urls(page)
+        previous = page.link('button2 prev')
+        previous_url = self.base_url + previous if previous is not None else None
+
+        if match is None:
+            title = SEASON_IN_URL.search(f"/{page.title().split(' ')[0]}/")
+            season = f"{title.group(1)}-{title.group(2)}" if title else current_season()
+
+        checkpoint.save_json(season, None, "season", {"teams": teams_urls, "previous": previous_url})
+        return season, teams_urls, previous_url
+
+    @traced()
+    def stale_teams(self, league: League) -> set:
+
+        """ Teams of the league which may have played since their last stored match, from the stored calendar
+        (no request): a match after it is over (kickoff + result_delay), or the calendar does not have any
+        match after it (window of the calendar passed, team not stored yet). Only the teams of the season of the
+        last stored match and of the calendar are candidates: relegated teams of past seasons are not.
+        """
+
+        last_dates = self._last_match_dates(league)
+        seasons = match_season(pd.to_datetime(pd.Series(last_dates, dtype=object), errors='coerce'))
+        teams = set(seasons[seasons == seasons.max()].index) if len(seasons) else set()
+        calendar = pd.DataFrame(columns=['Team', 'Date', 'Time'])
+        if league.data.backend.exists(league.name, "futur_matches"):
+            calendar = league.data.backend.read(league.name, "futur_matches", columns=['Team', 'Date', 'Time'])
+            teams |= set(calendar['Team'].dropna())
+
+        calendar = calendar.dropna(subset=['Team', 'Date'])
+        calendar = calendar[calendar['Date'] > calendar['Team'].map(last_dates).fillna('')]
+        over = pd.to_datetime(calendar['Date'] + ' ' + calendar['Time'].fillna('00:00'), errors='coerce') \
+            + self.result_delay <= self.clock()
+
+        waiting = set(calendar['Team'])
+        return (teams - waiting) | set(calendar.loc[over, 'Team'])
+
+    def _awaiting_result(self, fixtures) -> pd.Series:
+        kickoff = pd.to_datetime(fixtures['Date'] + ' ' + fixtures['Time'].fillna('00:00'), errors='coerce')
+        return fixtures['Result'].isna() & (kickoff + self.result_delay <= self.clock())
+
+    def _last_match_dates(self, league: League) -> dict:
+
+        """ Date of the last stored match with a result of every team (raw fbref team names).
+        """
+
+        if not league.data.backend.exists(league.name, "data"):
+            return {}
+        stored = league.data.backend.read(league.name, "data", columns=['Date', 'Team', 'Result'])
+        return stored.dropna(subset=['Result']).groupby('Team')['Date'].max().to_dict()
+
+    def _scrape_teams(self, teams_urls, league: League, logos=False, checkpoint=None, season=None, since=None) -> list:
+
+        """ Scrape the teams in parallel (each worker chains team page -> stats pages, so parsing overlaps the
+        network waits of the others). Returns (detailed data, fixtures) per team, in the order of teams_urls.
+        `since` maps team names to the date of their last stored match, only their later matches are scraped.
+        """
+
+        since = since or {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            scrape_team = tracer.propagate(lambda team_url: self._scrape_team(
+                team_url, league, logos, checkpoint, season, since.get(self._team_name(team_url))))
+            return list(executor.map(scrape_team, teams_urls))
+
+    @traced()
+    def _scrape_team(self, team_url: str, league: League, logos=False, checkpoint=None, season=None, since=None) -> (pd.DataFrame, pd.DataFrame):
+
+        """ Team page and match logs of a team. With a checkpoint, the units already scraped for this season are
+        loaded from it and the new ones saved in it. With `since` (a date), only the league matches played after
+        it are returned, and the match logs are not downloaded when there is none.
+        Returns empty frames when a page could not be scraped.
+        """
+
+        team = self._team_name(team_url)
+        units = {}
+        stats_urls = None
+        if checkpoint is not None:
+            stats_urls = checkpoint.load_json(season, team, "links")
+            for unit in ["scores"] + sorted(stats_urls or []):
+                units[unit] = checkpoint.load(season, team, unit)
+
+        if stats_urls is None or any(data is None for data in units.values()):
+            try:
+                team_response_text = self.fetcher.get(team_url)
+            except requests.RequestException as e:
+                print(f"Team page not downloaded: {team_url} - Erreur: {e}")
+                return pd.DataFrame(), pd.DataFrame()
+            team_page = FbrefPage(team_response_text)
+
+            if logos:
+                self.scrape_and_save_logo(team_url, team, team_page)
+            if units.get("scores") is None:
+                units["scores"] = self._checkpointed(checkpoint, season, team, "scores",
+                                                     self._scrape_team_data(team_url, team_page))
+
+            if since is not None and not units["scores"].empty:
+                scores = units["scores"]
+                fixtures = scores[scores['Comp'] == league.name]
+                if not (fixtures['Result'].notna() & (fixtures['Date'] > since)).any():
+                    return fixtures.iloc[:0], fixtures
+
+            stats_urls = self._stats_urls(team_page)
+            if checkpoint is not None and not units["scores"].empty:
+                checkpoint.save_json(season, team, "links", stats_urls)
+
+            for unit, stats_url in sorted(stats_urls.items()):
+                if units.get(unit) is None:
+                    units[unit] = self._checkpointed(checkpoint, season, team, unit, self._scrape_stats(stats_url))
+
+        team_data = units["scores"]
+        if team_data.empty or any(units[unit].empty for unit in stats_urls):
+            return pd.DataFrame(), pd.DataFrame()
+
+        fixtures = team_data[team_data['Comp'] == league.name]
+        if since is not None:
+            team_data = team_data[team_data['Date'] > since]
+        for unit in sorted(stats_urls):
+            team_data = team_data.merge(units[unit], on="Date", how='left')
+        team_data = team_data[team_data['Comp'] == league.name]
+
+        return team_data, fixtures
+
+
+    @traced()
+    def _checkpointed(self, checkpoint, season, team, unit, data) -> pd.DataFrame:
+        if checkpoint is not None and not data.empty:
+            checkpoint.save(season, team, unit, data)
+        return data
+
+    @traced()
     def latest_data_and_futur_matches(self, league: League) -> (pd.DataFrame, pd.DataFrame):
 
-        futur_matches = []
-        all_data = []
         teams_urls = self._fetch_team_urls(league.fbref_url)
+        scraped = self._scrape_teams(teams_urls, league)
 
-        for team_url in teams_urls:
-            team_data = self._scrape_team_data(team_url)
-            futur_matches.append(team_data[team_data['Comp']==league.name])
-            team_data = self._scrape_detailed_stats(team_data, requests.get(team_url, headers=self.headers).text)
-            team_data = team_data[team_data['Comp'] == league.name]
-            all_data.append(team_data)
+        all_data = [team_data for team_data, _ in scraped]
+        futur_matches = [fixtures for _, fixtures in scraped]
 
-        return pd.concat(all_seasons_data, ignore_index=True), pd.concat(futur_matches, ignore_index=True)
+        return pd.concat(all_data, ignore_index=True), pd.concat(futur_matches, ignore_index=True)
 
+    @traced()
     def save_data(self, data, file_path):
         data.to_csv(file_path, index=False)
 
+    @traced()
     def _fetch_team_urls(self, league_url: str) -> list:
-        self._rate_limit()
-        response = requests.get(league_url, headers=self.headers)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        teams_urls = ["https://fbref.com" + equipe.get("href")
-                    for equipe in soup.select("table.stats_table")[0].find_all("a")
-                    if "squads" in equipe.get("href", "")]
+        return self._team_urls(FbrefPage(self.fetcher.get(league_url)))
+
+    def _team_urls(self, page: FbrefPage) -> list:
+        teams_urls = [self.base_url + href
+                    for href in page.first_table("stats_table").xpath(".//a/@href")
+                    if "squads" in href]
         return teams_urls
 
-    def _scrape_team_data(self, team_url: str) -> pd.DataFrame:
-        self._rate_limit()
-        team_response = requests.get(team_url, headers=self.headers)
+    @traced()
+    def _scrape_team_data(self, team_url: str, team_page: FbrefPage) -> pd.DataFrame:
 
-        try:
-            team_data = pd.read_html(team_response.text, match="Scores")[0]
-        except ValueError as e:
-            print(f"No tables found with this URL: {team_url} - Erreur: {e}")
+        team_data = team_page.table("matchlogs_for")
+        if team_data is None:
+            print(f"No tables found with this URL: {team_url}")
             return pd.DataFrame()
 
-        team_name = team_url.split("/")[-1].replace("-Stats", "").replace("-", " ")
-        team_data["Team"] = team_name
+        team_data["Team"] = self._team_name(team_url)
 
         return team_data
 
-    def _scrape_detailed_stats(self, team_data: pd.DataFrame, team_response_text: str) -> pd.DataFrame:
-        url_stats = {
-            f"https://fbref.com{a.get('href')}"
-            for a in BeautifulSoup(team_response_text, 'html.parser').find_all("a")
-            if "matchlogs/all_comps" in a.get('href', '') and
-            any(substring in a.get('href', '') for substring in ["passing/", "shooting", "possession/", "defense/", "keeper"])
-        }
+    def _team_name(self, team_url: str) -> str:
+        return team_url.split("/")[-1].replace("-Stats", "").replace("-", " ")
 
-        for stats_url in url_stats:
-            self._rate_limit()
-            stats_response = requests.get(stats_url, headers=self.headers)
-            try:
-                detailed_stats = pd.read_html(stats_response.text)[0]
-            except ValueError as e:
-                print(f"No tables found with this URL: {stats_url} - Erreur: {e}")
-                return pd.DataFrame()
+    def _stats_urls(self, team_page: FbrefPage) -> dict:
+
+        """ Match logs urls of a team page by stat type (the path segment after matchlogs/all_comps).
+        """
+
+        return {
+            href.split("matchlogs/all_comps/")[1].split("/")[0]: f"{self.base_url}{href}"
+            for href in team_page.links("matchlogs/all_comps/")
+            if any(substring in href for substring in ["passing/", "shooting", "possession/", "defense/", "keeper"])
+        }
 
-            if detailed_stats.columns.nlevels > 1:
-                detailed_stats.columns = [f"{col}_{branch}"
-                                        if "For" not in col and "Unnamed:" not in col
-                                        else f"{branch}"
-                                        for col, branch in detailed_stats.columns]
+    @traced()
+    def _scrape_stats(self, stats_url: str) -> pd.DataFrame:
 
-            columns_to_drop = ["Time", "Comp", "Round", "Day", "Venue", "Result", "GF", "GA", "Opponent", "Poss"] + [col for col in detailed_stats.columns if 'Report' in col]
-            columns_to_drop = [col for col in columns_to_drop if col in detailed_stats.columns]
+        try:
+            detailed_stats = FbrefPage(self.fetcher.get(stats_url)).table("matchlogs_for")
+        except requests.RequestException as e:
+            print(f"Match logs not downloaded: {stats_url} - Erreur: {e}")
+            return pd.DataFrame()
+        if detailed_stats is None:
+            print(f"No tables found with this URL: {stats_url}")
+            return pd.DataFrame()
 
-            detailed_stats.drop(columns_to_drop, axis=1, inplace=True)
+        columns_to_drop = ["Time", "Comp", "Round", "Day", "Venue", "Result", "GF", "GA", "Opponent", "Poss"] + [col for col in detailed_stats.columns if 'Report' in col]
+        columns_to_drop = [col for col in columns_to_drop if col in detailed_stats.columns]
 
-            team_data = team_data.merge(detailed_stats, on="Date", how='left')
+        detailed_stats.drop(columns_to_drop, axis=1, inplace=True)
 
-        return team_data
+        return detailed_stats
 
         
-    def _rate_limit(self):
-        if self.last_request_time is not None:
-            elapsed_time = time.time() - self.last_request_time
-            if elapsed_time < self.request_interval:
-                time.sleep(self.request_interval - elapsed_time)
-        self.last_request_time = time.time()
-
-    
+    @traced()
     def _futur_matches_process(self, futur_matches, league:League) -> pd.DataFrame:
 
         futur_matches.dropna(subset=["Date", "Time", "Round"], inplace=True)
         futur_matches['DateTime'] = pd.to_datetime((futur_matches['Date'] + ' ' + futur_matches['Time']))
         futur_matches = futur_matches[futur_matches["Comp"] == league.name]
-        futur_matches = futur_matches[futur_matches['DateTime'] >= datetime.datetime.now()].sort_values(by="DateTime")
+        futur_matches = futur_matches[futur_matches['DateTime'] >= self.clock()].sort_values(by="DateTime")
         
-        ten_days = datetime.timedelta(days=10) + first_date
+        ten_days = datetime.timedelta(days=10) + futur_matches['DateTime'].min()
         futur_matches = futur_matches[futur_matches['DateTime'] <= ten_days]
 
         return futur_matches
 
-    def scrape_and_save_logo(self, team_url, team_name):
+    @traced()
+    def scrape_and_save_logo(self, team_url, team_name, team_page: FbrefPage):
 
-            file_path = os.path.join(self.logos_folder, file_name + '.png')
+            file_path = os.path.join(self.logos_folder, team_name + '.png')
             if os.path.exists(file_path):
-                print(f"Le logo existe déjà à {file_path}")
                 return
 
             try:
-                self.rate_limit()
-                response = requests.get(page_url, headers=self.headers)
-                soup = BeautifulSoup(response.text, 'html.parser')
-                logo_img = soup.find('img', {'class': 'teamlogo'})
+                logo_src = team_page.image('teamlogo')
 
-                if logo_img and logo_img.get('src'):
-                    logo_url = logo_img['src']
-                    self.rate_limit()
-                    img_response = requests.get(logo_url)
+                if logo_src:
+                    img_response = self.fetcher.response(urljoin(team_url, logo_src))
 
                     if img_response.status_code == 200:
-                        image = Image.open(io.BytesIO(img_response.content))
-                        file_path = os.path.join(self.logos_folder, file_name)
-                        if not file_path.endswith('.png'):
-                            file_path += '.png'
-                        image.save(file_path, 'PNG')
+                        os.makedirs(self.logos_folder, exist_ok=True)
+                        with open(file_path, 'wb') as file:
+                            file.write(img_response.content)
                         print(f"Logo saved at {file_path}")
                     else:
                         print("Error during logo download")
@@ -0,0 +1,100 @@
+import lxml.etree
+import lxml.html
+import numpy as np
+import pandas as pd
+
+from profiling.trace import traced
+
+
+class FbrefPage:
+
+    """ An fbref document parsed once with lxml. Tables are looked up by id instead of converting every table
+    of the page as pd.read_html does, including the ones fbref ships inside HTML comments (the page javascript
+    uncomments them), and come back with typed columns: numbers (thousands separators removed) as int64 /
+    float64, text as object, empty cells as NaN.
+    """
+
+    @traced("FbrefPage.parse")
+    def __init__(self, text):
+        self.root = lxml.html.fromstring(text)
+
+    @traced()
+    def table(self, table_id) -> pd.DataFrame:
+
+        """ Table `table_id` as a DataFrame, None when the page does not have it. Two-level headers are flattened
+        as "{group}_{column}", except the ungrouped and the "For {team}" columns which keep their own name.
+        """
+
+        table = self._find_table(table_id)
+        if table is None:
+            return None
+
+        columns = self._columns(table)
+        rows = [[cell.text_content().strip() for cell in row if cell.tag in ("th", "td")]
+                for row in table.xpath("./tbody/tr | ./tr[td]")
+                if "thead" not in row.get("class", "") and "spacer" not in row.get("class", "")]
+
+        values = list(zip(*[row for row in rows if len(row) == len(columns)])) or [()] * len(columns)
+        return pd.DataFrame({column: self._typed(cells) for column, cells in zip(columns, values)}, columns=columns)
+
+    def links(self, contains="") -> list:
+        return [href for href in self.root.xpath("//a/@href") if contains in href]
+
+    def link(self, css_class) -> str:
+
+        """ href of the first link having all the classes of `css_class` ("button2 prev"), None when absent.
+        """
+
+        condition = " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+                                 for name in css_class.split())
+        hrefs = self.root.xpath(f"//a[{condition}]/@href")
+        return hrefs[0] if hrefs else None
+
+    def first_table(self, css_class="stats_table"):
+        tables = self.root.xpath(f"//table[contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')]")
+        return tables[0] if tables else None
+
+    def image(self, css_class) -> str:
+        sources = self.root.xpath(f"//img[contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')]/@src")
+        return sources[0] if sources else None
+
+    def title(self) -> str:
+        titles = self.root.xpath("//h1")
+        return titles[0].text_content().strip() if titles else ""
+
+    def _find_table(self, table_id):
+        tables = self.root.xpath("//table[@id=$table_id]", table_id=table_id)
+        if tables:
+            return tables[0]
+
+        marker = f'id="{table_id}"'
+        for comment in self.root.iter(lxml.etree.Comment):
+            if comment.text and marker in comment.text:
+                tables = lxml.html.fromstring(f"<div>{comment.text}</div>").xpath("//table[@id=$table_id]", table_id=table_id)
+                if tables:
+                    return tables[0]
+        return None
+
+    def _columns(self, table) -> list:
+        header_rows = table.xpath("./thead/tr")
+        names = [cell.text_content().strip() for cell in header_rows[-1]] if header_rows else []
+        if len(header_rows) < 2:
+            return names
+
+        groups = []
+        for cell in header_rows[-2]:
+            groups += [cell.text_content().strip()] * int(cell.get("colspan", 1))
+        groups += [""] * (len(names) - len(groups))
+
+        return [f"{group}_{name}" if group and "For" not in group else name for group, name in zip(groups, names)]
+
+    @staticmethod
+    def _typed(cells) -> np.ndarray:
+        try:
+            numbers = np.array([cell.replace(",", "") or "nan" for cell in cells], dtype="float64")
+        except ValueError:
+            return np.array([cell if cell else np.nan for cell in cells], dtype=object)
+
+        if len(numbers) and not np.isnan(numbers).any() and (numbers % 1 == 0).all():
+            return numbers.astype("int64")
+        return numbers
@@ -0,0 +1,207 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from profiling.trace import tracer, traced
+
+
+class TokenBucket:
+
+    """ Thread-safe token bucket: `rate` requests per second on average, at most `capacity` at once.
+    With capacity=1 it is the historic fixed gap of 1 / rate seconds between two requests.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+
+        """ Block until a token is available and take it. Returns the time spent waiting.
+        """
+
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def try_acquire(self) -> float:
+
+        """ Take a token if one is available (returns 0), else returns the seconds until the next one.
+        """
+
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def wait_time(self) -> float:
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimited(requests.HTTPError):
+
+    """ Raised instead of sending a request to a host which answered 429 Too Many Requests, until its back-off
+    is over.
+    """
+
+
+class Fetcher:
+
+    """ HTTP GET shared by the Downloader threads: one token bucket per host, so concurrent workers keep the
+    same politeness budget per site, and one requests.Session per thread for connection reuse.
+    `host_rates` overrides the default rate (requests per second) for some hosts.
+    With a ResponseCache, get() serves cached pages without request (or with a conditional one).
+    With a ProxyPool (downloader.proxy), the requests go out through its proxies instead, within the same token
+    buckets and headers: a request failing through a proxy is tried through another one, `proxy_attempts` times.
+    A 429 answer stops every request to its host for its Retry-After seconds (`backoff` without one): they raise
+    RateLimited, so that a run stops (and a backfill checkpoints) instead of insisting.
+    """
+
+    def __init__(self, headers, rate=1 / 3, capacity=1, host_rates=None, timeout=30, cache=None, proxies=None,
+                 proxy_attempts=3, backoff=300):
+        self.headers = headers
+        self.cache = cache
+        self.proxies = proxies
+        self.proxy_attempts = proxy_attempts
+        self.rate = rate
+        self.capacity = capacity
+        self.host_rates = host_rates or {}
+        self.timeout = timeout
+        self.backoff = backoff
+        self._buckets = {}
+        self._blocked = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def bucket(self, url) -> TokenBucket:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.host_rates.get(host, self.rate), self.capacity)
+            return self._buckets[host]
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def response(self, url, headers=None) -> requests.Response:
+        self._check_backoff(url)
+        if self.proxies is not None:
+            return self._proxied_response(url, headers)
+
+        with tracer.span("Fetcher.rate_limit"):
+            self.bucket(url).acquire()
+        with tracer.span("Fetcher.http", url=url) as span:
+            response = self._session().get(url, headers=headers, timeout=self.timeout)
+            span.set(status=response.status_code, bytes=len(response.content))
+        self._back_off(url, response)
+        return response
+
+    def _proxied_response(self, url, headers=None) -> requests.Response:
+
+        """ Response through the proxy of the pool expected to answer first. Connection errors, timeouts and
+        the statuses of ProxyPool.failure_statuses count as failures of the proxy and the request is tried
+        with another one (with a token of the host too): the last failing response is returned, or the last
+        error raised. Any other answer is the site's, returned as it is.
+        """
+
+        error, response, tried = None, None, []
+        for _ in range(self.proxy_attempts):
+            self._check_backoff(url)
+            with tracer.span("Fetcher.rate_limit"):
+                self.bucket(url).acquire()
+            proxy = self.proxies.acquire(exclude=tried)
+            tried.append(proxy)
+            with tracer.span("Fetcher.http", url=url, proxy=proxy.name) as span:
+                start = time.monotonic()
+                try:
+                    response = self._session().get(url, headers=headers, proxies=proxy.proxies(), timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self.proxies.record(proxy, False, time.monotonic() - start)
+                    span.set(error=type(e).__name__)
+                    error, response = e, None
+                    continue
+                span.set(status=response.status_code, bytes=len(response.content))
+
+            success = response.status_code not in self.proxies.failure_statuses
+            self.proxies.record(proxy, success, time.monotonic() - start)
+            if success:
+                self._back_off(url, response)
+                return response
+
+        if response is None:
+            raise error
+        return response
+
+    def _back_off(self, url, response):
+        if response.status_code != 429:
+            return
+        try:
+            delay = float(response.headers.get("Retry-After", self.backoff))
+        except ValueError:
+            delay = self.backoff
+        with self._lock:
+            self._blocked[urlsplit(url).netloc] = time.monotonic() + delay
+
+    def blocked_for(self, url) -> float:
+
+        """ Seconds left of the back-off of the host of `url` after a 429 answer, 0 when it can be requested.
+        """
+
+        with self._lock:
+            return max(0.0, self._blocked.get(urlsplit(url).netloc, 0) - time.monotonic())
+
+    def _check_backoff(self, url):
+        remaining = self.blocked_for(url)
+        if remaining > 0:
+            raise RateLimited(f"{urlsplit(url).netloc} answered 429 Too Many Requests, no request for "
+                              f"{remaining:.0f} s more: {url}")
+
+    @traced()
+    def get(self, url) -> str:
+
+        """ Text of the page, requests.HTTPError on error statuses (e.g. 429 when the site rate limits us).
+        """
+
+        if self.cache is None:
+            response = self.response(url)
+            response.raise_for_status()
+            return response.text
+
+        cached = self.cache.lookup(url)
+        if cached is not None:
+            body, encoding, fresh, validators = cached
+            if fresh:
+                return body.decode(encoding, errors="replace")
+            response = self.response(url, headers=validators)
+            if response.status_code == 304:
+                self.cache.revalidated(url)
+                return body.decode(encoding, errors="replace")
+        else:
+            response = self.response(url)
+
+        response.raise_for_status()
+        if response.status_code == 200:
+            encoding = response.encoding or response.apparent_encoding or "utf-8"
+            self.cache.store(url, response.content, encoding, response.headers)
+        return response.text
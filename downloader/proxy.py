@@ -1,2 +1,206 @@
+""" Pool of HTTP proxies the Fetcher spreads its requests over, loaded from downloader/proxy.csv (one
+"host:port" per line under a Proxy header), so that a dead or slow proxy does not stop a scrape. The proxies
+share the politeness budget of the Fetcher (one token bucket per host) and its headers: they add egresses, not
+requests, and a rate limiting answer of the site is not a failure of the proxy (see Fetcher).
 
+Health check of the csv (and rewrite with the live ones only, --save), from the repository root:
+    python -m downloader.proxy [url] [--save]
+"""
 
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from downloader.fetcher import TokenBucket
+
+
+PROXY_CSV = os.path.join('downloader', 'proxy.csv')
+
+# statuses telling that the proxy itself failed (authentication, bad gateway, unavailable, gateway timeout): the
+# request is tried with another one. The answers of the site (403, 429...) are returned as they are.
+PROXY_FAILURES = {407, 502, 503, 504}
+
+
+class Proxy:
+
+    """ A proxy of the pool ("host:port", or None for the direct connection) and its health: moving averages
+    of its latency (successful requests) and of its success rate, and its consecutive failures.
+    """
+
+    def __init__(self, address, smoothing=0.2):
+        self.address = address
+        self.smoothing = smoothing
+        self.latency = None
+        self.success_rate = 1.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.evicted = False
+
+    @property
+    def name(self) -> str:
+        return self.address or "direct"
+
+    def proxies(self) -> dict:
+
+        """ `proxies` argument of requests for this proxy (None: the direct connection).
+        """
+
+        if self.address is None:
+            return None
+        url = self.address if "://" in self.address else "http://" + self.address
+        return {"http": url, "https": url}
+
+    def expected_time(self) -> float:
+
+        """ Expected seconds to get a successful answer through the proxy (latency / success rate), 0 before
+        its first success so that every proxy is tried.
+        """
+
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(self.success_rate, 0.05)
+
+    def record(self, success, latency):
+        self.requests += 1
+        self.success_rate += self.smoothing * (float(success) - self.success_rate)
+        if success:
+            self.consecutive_failures = 0
+            self.latency = latency if self.latency is None else self.latency + self.smoothing * (latency - self.latency)
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def reset(self):
+        self.latency = None
+        self.success_rate = 1.0
+        self.consecutive_failures = 0
+        self.evicted = False
+
+
+class ProxyPool:
+
+    """ Proxies of the pool: acquire() gives the live proxy with the lowest expected time to an answer
+    (Proxy.expected_time), record() updates its health after the request. The pool does not pace the requests,
+    the token bucket of the Fetcher does.
+
+    A proxy is evicted after `max_failures` consecutive failures, or when its success rate falls under
+    `min_success_rate` after `min_requests` requests. check() health checks the proxies (evicted ones
+    included: they are readmitted when they answer). With `direct`, the direct connection is an egress of the
+    pool too.
+    """
+
+    def __init__(self, addresses, direct=False, max_failures=3, min_success_rate=0.5, min_requests=10, smoothing=0.2):
+        addresses = ([None] if direct else []) + list(addresses)
+        self.proxies = [Proxy(address, smoothing) for address in addresses]
+        self.max_failures = max_failures
+        self.min_success_rate = min_success_rate
+        self.min_requests = min_requests
+        self.failure_statuses = PROXY_FAILURES
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path=PROXY_CSV, **options):
+        addresses = pd.read_csv(path)['Proxy'].dropna().astype(str).str.strip()
+        return cls(addresses.drop_duplicates(), **options)
+
+    def save_csv(self, path=PROXY_CSV):
+
+        """ Write the live proxies in the csv, the evicted ones are left out.
+        """
+
+        live = [proxy.address for proxy in self.live() if proxy.address is not None]
+        pd.DataFrame({'Proxy': live}).to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    def live(self) -> list:
+        return [proxy for proxy in self.proxies if not proxy.evicted]
+
+    def acquire(self, exclude=()) -> Proxy:
+
+        """ The live proxy expected to answer first, the proxies of `exclude` (already tried for this request)
+        only when no other one is live. Raises requests.exceptions.ProxyError when every proxy of the pool is
+        evicted.
+        """
+
+        with self._lock:
+            live = self.live()
+            if not live:
+                raise requests.exceptions.ProxyError("Every proxy of the pool is evicted")
+            live = [proxy for proxy in live if proxy not in exclude] or live
+            return min(live, key=lambda proxy: proxy.expected_time())
+
+    def record(self, proxy, success, latency):
+
+        """ Health of `proxy` after a request (`latency` seconds), evicted when it keeps failing.
+        """
+
+        with self._lock:
+            proxy.record(success, latency)
+            if proxy.evicted:
+                return
+            if proxy.consecutive_failures >= self.max_failures:
+                reason = f"failed {proxy.consecutive_failures} times in a row"
+            elif proxy.requests >= self.min_requests and proxy.success_rate < self.min_success_rate:
+                reason = f"success rate {proxy.success_rate:.0%}"
+            else:
+                return
+            proxy.evicted = True
+        print(f"Proxy {proxy.name} evicted ({reason})")
+
+    def check(self, url, timeout=10, workers=16, rate=1 / 3, headers=None) -> pd.DataFrame:
+
+        """ Request `url` once through every proxy in parallel, `rate` requests per second at most for all of
+        them, and record the answers: an evicted proxy which answers is readmitted. Returns the report().
+        """
+
+        bucket = TokenBucket(rate)
+        headers = headers or {'User-Agent': 'Mozilla/5.0'}
+
+        def check_proxy(proxy):
+            bucket.acquire()
+            start = time.monotonic()
+            try:
+                response = requests.get(url, proxies=proxy.proxies(), headers=headers, timeout=timeout)
+                success = response.status_code not in self.failure_statuses
+            except requests.RequestException:
+                success = False
+            if success and proxy.evicted:
+                with self._lock:
+                    proxy.reset()
+            self.record(proxy, success, time.monotonic() - start)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(check_proxy, self.proxies))
+        return self.report()
+
+    def report(self) -> pd.DataFrame:
+        with self._lock:
+            report = pd.DataFrame({
+                'Proxy': [proxy.name for proxy in self.proxies],
+                'Requests': [proxy.requests for proxy in self.proxies],
+                'Failures': [proxy.failures for proxy in self.proxies],
+                'Success rate': [round(proxy.success_rate, 3) for proxy in self.proxies],
+                'Latency (ms)': [round(proxy.latency * 1000, 1) if proxy.latency is not None else None
+                                 for proxy in self.proxies],
+                'Evicted': [proxy.evicted for proxy in self.proxies],
+            })
+        return report.sort_values(by=['Evicted', 'Latency (ms)'], kind='stable').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Health check of the proxies of downloader/proxy.csv")
+    parser.add_argument("url", nargs="?", default="https://fbref.com/en/")
+    parser.add_argument("--csv", default=PROXY_CSV)
+    parser.add_argument("--save", action="store_true", help="keep only the live proxies in the csv")
+    arguments = parser.parse_args()
+
+    pool = ProxyPool.from_csv(arguments.csv, max_failures=1)
+    print(pool.check(arguments.url).to_string())
+    if arguments.save:
+        pool.save_csv(arguments.csv)
@@ -0,0 +1,194 @@
+""" Refresh of the leagues driven by their calendar (storage futur_matches) instead of polling them.
+
+Run from the repository root:  python -m downloader.scheduler
+"""
+
+import datetime
+import heapq
+import itertools
+import logging
+import time
+
+import pandas as pd
+
+from downloader.downloader import Downloader
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+
+    """ Priority queue of the times the results of the scheduled matches can be on fbref (kickoff +
+    `match_duration` + `result_delay`). run() sleeps until the next one and rescrapes only the teams whose
+    match is over (Downloader.update_teams): every team costs several rate-limited requests, a blind poll of
+    a league costs them for all its teams.
+
+    A match whose result is not on fbref yet is tried again `retry_delay` later, `max_retries` times. A league
+    without scheduled matches (end of its calendar window, winter break) is fully refreshed every
+    `idle_interval` to get its new fixtures. Times are naive local times, as the Downloader compares them.
+    The refreshes are logged (logger of this module) and kept in `history`, the matches left out in `left_out`.
+    A refresh of a league that fails (network error, rate limiting...) is logged and its matches are queued
+    again `retry_delay` later, or at the end of the back-off of the site after a 429 answer.
+    """
+
+    def __init__(self, downloader=None, leagues=None, match_duration=datetime.timedelta(minutes=115),
+                 result_delay=datetime.timedelta(hours=1), retry_delay=datetime.timedelta(hours=2), max_retries=6,
+                 idle_interval=datetime.timedelta(days=1), sleep=time.sleep):
+        self.downloader = downloader or Downloader()
+        self.leagues = {league.name: league for league in (leagues or [PremierLeague(), Ligue1(), LaLiga(),
+                                                                       Bundesliga(), Eredivisie(), SerieA()])}
+        self.match_duration = match_duration
+        self.result_delay = result_delay
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.idle_interval = idle_interval
+        self.sleep = sleep
+
+        # heap of (time, sequence, league, team, kickoff), team None for a full refresh of the league
+        self.queue = []
+        # (league, team, kickoff) -> time of its valid queue entry (the others are stale)
+        self.pending = {}
+        # (league, team, kickoff) -> fbref Date of the match, as in the scraped rows
+        self.match_dates = {}
+        self.attempts = {}
+        self.done = set()
+        self.history = []
+        self.left_out = []
+        self._sequence = itertools.count()
+
+    def now(self) -> datetime.datetime:
+        return self.downloader.clock()
+
+    def schedule_league(self, league):
+
+        """ Queue the matches of the calendar of `league` not queued nor scraped yet, or a full refresh of the
+        league after `idle_interval` when it has none.
+        """
+
+        calendar = self._calendar(league)
+        for team, kickoff, date in zip(calendar['Team'], calendar['Kickoff'], calendar['Date']):
+            key = (league.name, team, kickoff)
+            if key not in self.pending and key not in self.done:
+                self.match_dates[key] = str(date)
+                self._push(key, kickoff + self.match_duration + self.result_delay)
+
+        if not any(key[0] == league.name for key in self.pending):
+            self._push((league.name, None, None), self.now() + self.idle_interval)
+
+    def run_pending(self) -> list:
+
+        """ Rescrape the teams whose results are due, league by league. Returns [(league, teams, new rows)].
+        """
+
+        now = self.now()
+        due, refresh = {}, set()
+        while self.queue and self.queue[0][0] <= now:
+            when, _, league_name, team, kickoff = heapq.heappop(self.queue)
+            key = (league_name, team, kickoff)
+            if self.pending.get(key) != when:
+                continue
+            del self.pending[key]
+            if team is None:
+                refresh.add(league_name)
+            else:
+                due.setdefault(league_name, set()).add((team, kickoff))
+
+        refreshed = []
+        for league_name in sorted(set(due) | refresh):
+            league = self.leagues[league_name]
+            matches = due.get(league_name, set())
+            teams = sorted({team for team, _ in matches})
+
+            try:
+                if league_name in refresh:
+                    data = self.downloader.refresh_league(league)
+                else:
+                    data = self.downloader.update_teams(league, set(teams))
+            except Exception:
+                retry = now + max(self.retry_delay, datetime.timedelta(
+                    seconds=self.downloader.fetcher.blocked_for(league.fbref_url)))
+                logger.exception("%s: refresh failed, tried again at %s", league_name, f"{retry:%Y-%m-%d %H:%M}")
+                for team, kickoff in matches:
+                    self._push((league_name, team, kickoff), retry)
+                if league_name in refresh:
+                    self._push((league_name, None, None), retry)
+                continue
+
+            self._check_results(league_name, matches, data)
+            self.schedule_league(league)
+            refreshed.append((league_name, teams if league_name not in refresh else None, len(data)))
+
+        self.history.extend((now, *entry) for entry in refreshed)
+        return refreshed
+
+    def run(self, until=None):
+
+        """ Refresh the leagues as their matches end, forever or until the datetime `until`.
+        """
+
+        for league in self.leagues.values():
+            self.schedule_league(league)
+
+        while self.queue:
+            next_time = self.queue[0][0]
+            if until is not None and next_time > until:
+                return
+            wait = (next_time - self.now()).total_seconds()
+            if wait > 0:
+                self.sleep(wait)
+            for league_name, teams, rows in self.run_pending():
+                scraped = "all teams" if teams is None else f"{len(teams)} teams ({', '.join(teams)})"
+                logger.info("%s: %s scraped, %d rows", league_name, scraped, rows)
+
+    def next_refresh(self) -> datetime.datetime:
+        valid = [when for when, _, league_name, team, kickoff in self.queue
+                 if self.pending.get((league_name, team, kickoff)) == when]
+        return min(valid) if valid else None
+
+    def _calendar(self, league) -> pd.DataFrame:
+        backend = league.data.backend
+        if not backend.exists(league.name, "futur_matches"):
+            return pd.DataFrame({'Team': [], 'Kickoff': []})
+        calendar = backend.read(league.name, "futur_matches", columns=['Date', 'Time', 'Team'])
+        calendar['Kickoff'] = pd.to_datetime(calendar['Date'] + ' ' + calendar['Time'], errors='coerce')
+        return calendar.dropna(subset=['Kickoff', 'Team'])
+
+    def _check_results(self, league_name, matches, data):
+
+        """ Matches of `matches` with a result in the scraped `data` (same team and fbref Date) are done, the
+        others tried again later.
+        """
+
+        played = set()
+        if not data.empty:
+            with_result = data[data['Result'].notna()]
+            played = set(zip(with_result['Team'], with_result['Date'].astype(str)))
+
+        for team, kickoff in matches:
+            key = (league_name, team, kickoff)
+            if (team, self.match_dates.get(key)) in played:
+                self.done.add(key)
+                self.attempts.pop(key, None)
+                self.match_dates.pop(key, None)
+                continue
+
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if self.attempts[key] > self.max_retries:
+                logger.warning("%s: no result of %s (%s) after %d retries, left out", league_name, team, kickoff,
+                               self.max_retries)
+                self.left_out.append(key)
+                self.done.add(key)
+                self.match_dates.pop(key, None)
+            else:
+                self._push(key, self.now() + self.retry_delay)
+
+    def _push(self, key, when):
+        self.pending[key] = when
+        heapq.heappush(self.queue, (when, next(self._sequence)) + key)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M")
+    RefreshScheduler().run()
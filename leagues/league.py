@@ -2,6 +2,10 @@ from abc import ABC, abstractmethod
 import pandas as pd
 import os
 from processing.processing import ProcessingFootball
+from processing.state import FeatureState, STATE_VERSION
+from storage.backends import default_backend
+from storage.dataset_cache import DatasetCache, code_fingerprint
+from storage.schema import CompactSchema
 class League(ABC):
     def __init__(self, country: str, name: str, fbref_url: str):
         self._country = country
@@ -26,46 +30,167 @@ class League(ABC):
         pass
 
 class DataManager:
-    def __init__(self, league: League):
+
+    # processed datasets shared by the DataManagers of the process, see _cached
+    dataset_cache = DatasetCache(os.path.join('storage', 'dataset_cache'))
+
+    def __init__(self, league: League, backend=None, cache=True, compact=True):
+
+        """ With `compact`, the raw data is read with the CompactSchema dtypes (float32 / nullable ints /
+        categories) and processed in them. `cache` is a DatasetCache, True for the shared one, False for none.
+        """
+
         self.league = league
         self._storage_folder = 'storage'
+        self.backend = backend or default_backend(self._storage_folder)
+        self.cache = DataManager.dataset_cache if cache is True else cache or None
+        self.schema = CompactSchema() if compact else None
+        self._state = None
 
     @property
     def storage_folder(self) -> str:
         return self._storage_folder
 
     def get_data(self) -> pd.DataFrame:
-        data = self.get_raw_data()
-        processer = ProcessingFootball()
-        return processer.initial_processing(data)
-
-    def get_data_with_features(self) -> pd.DataFrame:
-        data = self.get_raw_data()
-        processer = ProcessingFootball()
-        return processer.features_processing(data)
-
-    def get_data_for_prediction(self):
-        data = self.get_raw_data()
-        processer = ProcessingFootball()
-        return processer.prediction_processing(data)
-
-    def get_data_for_future_prediction(self) -> pd.DataFrame:
-        data = self.get_raw_data()
-        future_data = self.get_raw_future_matches()
-        processer = ProcessingFootball()
-        return processer.future_prediction_processing(data, future_data)
-
-    def get_raw_data(self) -> pd.DataFrame:
-        path = os.path.join(self.storage_folder, "data", f"{self.league.name}_data.csv")
-        data = pd.read_csv(path)
-        data = self._mapped_data(data)
+        return self._cached("initial", lambda: ProcessingFootball(self.schema).initial_processing(self.get_raw_data()))
+
+    def get_data_with_features(self, incremental=False) -> pd.DataFrame:
+        if incremental:
+            return self.update_state().data
+        return self._cached("features", lambda: ProcessingFootball(self.schema).features_processing(self.get_raw_data()))
+
+    def get_data_for_prediction(self, incremental=False):
+        if incremental:
+            return self.update_state().prediction
+
+        def compute():
+            processer = ProcessingFootball(self.schema)
+            data = self.get_raw_data(columns=processer.model_raw_columns())
+            return processer.prediction_processing(data)
+
+        return self._cached("prediction", compute)
+
+    def _cached(self, stage, compute, kinds=("data",)) -> pd.DataFrame:
+
+        """ Output of `stage`, computed only when the cache does not have it for the current raw files
+        (content hash of the `kinds` stored for the league), processing code, configuration and team mapping.
+        """
+
+        if self.cache is None:
+            return compute()
+
+        key = self.cache.key(self.league.name, stage, type(self.backend).__name__, self.schema is not None, code_fingerprint(),
+                             self.league.mapping(), [self.backend.fingerprint(self.league.name, kind) for kind in kinds])
+        data = self.cache.get(key)
+        if data is None:
+            data = compute()
+            self.cache.put(key, data)
         return data
 
+    def get_state(self) -> FeatureState:
+        if self._state is None and os.path.exists(self._state_path()):
+            self._state = pd.read_pickle(self._state_path())
+            if getattr(self._state, 'version', None) != STATE_VERSION:
+                self._state = None
+        if self._state is None:
+            self._state = self._build_state()
+        return self._state
+
+    def _build_state(self) -> FeatureState:
+        state = ProcessingFootball(self.schema).build_state(self.get_raw_data())
+        state.source = self.backend.fingerprint(self.league.name, "data")
+        self._state = state
+        self._save_state()
+        return state
+
+    def update_state(self, new_data=None) -> FeatureState:
+
+        """ Add the matches of `new_data` (default: the rows of the raw data not processed yet) to the
+        processed state, only the new matches are processed. The state is rebuilt from the raw data
+        when a postponed match has to be inserted in an already processed round.
+
+        By default only the raw rows from the kickoff of the last processed match on are read, and nothing
+        when the raw data did not change since the state was updated (backend fingerprint): a match stored
+        later with an earlier kickoff is only taken in by a rebuild (delete the state file).
+        """
+
+        state = self.get_state()
+        source = None
+        if new_data is None:
+            source = self.backend.fingerprint(self.league.name, "data")
+            if source == state.source:
+                return state
+            new_data = self.get_raw_data(start=state.last_kickoff)
+        else:
+            new_data = self._compact(self._mapped_data(new_data.copy()))
+        processer = ProcessingFootball(self.schema)
+
+        try:
+            new_rows = processer.incremental_processing(state, new_data)
+        except ValueError as e:
+            print(f"{self.league.name}: {e}")
+            return self._build_state()
+
+        if not new_rows.empty or source is not None:
+            state.source = state.source if source is None else source
+            self._save_state()
+        return state
+
+    def _state_path(self) -> str:
+        return os.path.join(self.storage_folder, "state", f"{self.league.name}_state.pkl")
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self._state_path()), exist_ok=True)
+        pd.to_pickle(self._state, self._state_path())
+
+    def get_data_for_future_prediction(self, incremental=False) -> pd.DataFrame:
+
+        """ Merged rows of the processed matches and of the upcoming fixtures (storage futur_matches). With
+        `incremental`, the fixtures only, read from the processed state (see update_state) without processing the
+        history again.
+        """
+
+        if incremental:
+            return ProcessingFootball(self.schema).futur_matches_processing(self.update_state(), self.get_raw_future_matches())
+
+        def compute():
+            processer = ProcessingFootball(self.schema)
+            data = self.get_raw_data(columns=processer.model_raw_columns())
+            future_data = self.get_raw_future_matches()
+            return processer.futur_prediciton_processing(data, future_data)
+
+        return self._cached("future prediction", compute, kinds=("data", "futur_matches"))
+
+    def get_raw_data(self, columns=None, start=None, end=None) -> pd.DataFrame:
+
+        """ Raw fbref rows of the league, optionally only `columns` and the matches played between
+        `start` and `end` (DateTime bounds, included).
+        """
+
+        data = self.backend.read(self.league.name, "data", columns=columns, start=start, end=end)
+        data = self._mapped_data(data)
+        return self._compact(data)
+
     def get_raw_future_matches(self) -> pd.DataFrame:
-        path = os.path.join(self.storage_folder, "future_matches", f"{self.league.name}_future_data.csv")
-        data = pd.read_csv(path)
+        data = self.backend.read(self.league.name, "futur_matches")
         data = self._mapped_data(data)
-        return data
+        return self._compact(data)
+
+    def _compact(self, data) -> pd.DataFrame:
+        return data if self.schema is None else self.schema.apply(data)
+
+    def save_raw_data(self, data):
+        self.backend.write(data, self.league.name, "data")
+
+    def append_raw_data(self, data) -> int:
+
+        """ Store the rows of `data` of the matches not stored yet, returns their number.
+        """
+
+        return self.backend.append(data, self.league.name, "data")
+
+    def save_raw_future_matches(self, data):
+        self.backend.write(data, self.league.name, "futur_matches")
 
     def _mapped_data(self, data) -> pd.DataFrame:
         mapping = self.league.mapping()
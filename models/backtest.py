@@ -0,0 +1,223 @@
+""" Walk-forward backtest of the models of models.models: every fold trains on the matches played before its
+first kickoff and scores its matches (a season, or `step` matchweeks of a season), for every target.
+
+The features of a league are computed once (get_data_for_prediction) into a matrix cached on disk for the
+current raw data and processing code: the folds only slice it, and the model configurations share it.
+
+Run from the repository root:
+    python -m models.backtest [--model catboost|xgboost] [--by season|round] [--step 1] [--workers N]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.models import MODELS, TARGETS, feature_columns, upcoming
+from storage.dataset_cache import DatasetCache, code_fingerprint
+
+
+CACHE_FOLDER = os.path.join('storage', 'backtest')
+
+# matrices memory-mapped by the worker process, see load_matrix
+_matrices = {}
+
+
+def feature_matrix(league, cache_folder=CACHE_FOLDER) -> str:
+
+    """ Folder of the feature matrix of the played matches of `league`, sorted by kickoff: features.npy (float32,
+    one row per match) and columns.npz (kickoff, season, round and the class code of every target, -1 when
+    unknown). Built only when the raw data, the team mapping or the processing code changed.
+    """
+
+    data_manager = league.data
+    key = DatasetCache.key(league.name, "backtest", type(data_manager.backend).__name__, code_fingerprint(),
+                           league.mapping(), data_manager.backend.fingerprint(league.name, "data"))
+    folder = os.path.join(cache_folder, f"{league.name}_{key[:16]}")
+    if os.path.exists(os.path.join(folder, "meta.json")):
+        return folder
+
+    data = data_manager.get_data_for_prediction()
+    data = data[~upcoming(data)].sort_values(by='DateTime', kind='stable').reset_index(drop=True)
+    features = feature_columns(data)
+
+    temporary = folder + ".tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    np.save(os.path.join(temporary, "features.npy"), data[features].to_numpy(dtype=np.float32, na_value=np.nan))
+    labels = {target: data[target].map({label: code for code, label in enumerate(classes)}).fillna(-1)
+              .to_numpy(dtype=np.int8) for target, classes in TARGETS.items()}
+    np.savez(os.path.join(temporary, "columns.npz"), kickoff=data['DateTime'].to_numpy(dtype='datetime64[ns]'),
+             season=data['Season'].astype(str).to_numpy(dtype=str), round=data['Round'].to_numpy(dtype=np.int16),
+             **labels)
+    with open(os.path.join(temporary, "meta.json"), "w") as file:
+        json.dump({"league": league.name, "features": features, "rows": len(data)}, file, indent=1)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(temporary, folder)
+    return folder
+
+
+def load_matrix(folder) -> (np.ndarray, dict):
+    if folder not in _matrices:
+        columns = np.load(os.path.join(folder, "columns.npz"))
+        _matrices[folder] = (np.load(os.path.join(folder, "features.npy"), mmap_mode='r'),
+                             {name: columns[name] for name in columns.files})
+    return _matrices[folder]
+
+
+def folds(columns, by="season", step=1) -> list:
+
+    """ (name, train rows, test rows) of the folds of a matrix: every season but the first, or every `step`
+    matchweeks of these seasons. The rows are sorted by kickoff, the training rows are the prefix of the
+    matches played before the first kickoff of the fold (a postponed match of an earlier round played after it
+    is left out as well).
+    """
+
+    kickoff, season, round_ = columns["kickoff"], columns["season"], columns["round"]
+    seasons = sorted(set(season))
+
+    result = []
+    for name in seasons[1:]:
+        in_season = season == name
+        if by == "season":
+            groups = [(name, in_season)]
+        else:
+            first_rounds = range(round_[in_season].min(), round_[in_season].max() + 1, step)
+            groups = [(f"{name} R{first}" + (f"-{first + step - 1}" if step > 1 else ""),
+                       in_season & (round_ >= first) & (round_ < first + step)) for first in first_rounds]
+
+        for fold_name, test in groups:
+            test = np.flatnonzero(test)
+            if len(test):
+                result.append((fold_name, int(np.searchsorted(kickoff, kickoff[test].min(), side='left')), test))
+    return result
+
+
+def run_fold(task) -> dict:
+
+    """ Train `task`'s model on the rows before its cut, score its test rows. Runs in a worker process.
+    """
+
+    features, columns = load_matrix(task["folder"])
+    labels = columns[task["target"]]
+    classes = TARGETS[task["target"]]
+
+    train = np.flatnonzero(labels[:task["cut"]] >= 0)
+    test = task["test"][labels[task["test"]] >= 0]
+    metrics = {"League": task["league"], "Target": task["target"], "Fold": task["fold"], "Train rows": len(train),
+               "Test rows": len(test)}
+    if len(train) < task["min_train_rows"] or len(test) == 0 or len(np.unique(labels[train])) < len(classes):
+        return metrics
+
+    start = time.perf_counter()
+    model = MODELS[task["model"]](target=task["target"], threads=task["threads"], params=task["params"])
+    fitted = model._fit(np.asarray(features[train]), labels[train])
+    probabilities = np.clip(model._predict_proba(fitted, np.asarray(features[test])), 1e-15, 1)
+
+    truth = labels[test]
+    one_hot = np.eye(len(classes))[truth]
+    prior = (np.bincount(labels[train], minlength=len(classes)) + 1) / (len(train) + len(classes))
+    metrics.update({
+        "Log loss": float(-np.log(probabilities[np.arange(len(test)), truth]).mean()),
+        "Prior log loss": float(-np.log(prior[truth]).mean()),
+        "Accuracy": float((probabilities.argmax(axis=1) == truth).mean()),
+        "Brier": float(((probabilities - one_hot) ** 2).sum(axis=1).mean()),
+        "Seconds": round(time.perf_counter() - start, 2),
+    })
+    return metrics
+
+
+class Backtester:
+
+    """ Walk-forward folds (`by` season, or round: `step` matchweeks at a time) of `leagues` for `targets`, run
+    in a pool of `workers` processes (each model on `threads` threads). Folds with less than `min_train_rows`
+    training matches, or without every class in them, are reported without metrics.
+
+    The feature matrices are built once per league (and kept in `cache_folder` for the next runs): run() can be
+    called for several models and parameters without computing any feature again.
+    """
+
+    def __init__(self, leagues, targets=("Result", "Minus 2.5 Goals"), by="season", step=1, min_train_rows=300,
+                 workers=None, threads=1, cache_folder=CACHE_FOLDER):
+        if by not in ("season", "round"):
+            raise ValueError(f"Folds by season or round, not {by}")
+        self.leagues = list(leagues)
+        self.targets = list(targets)
+        self.by = by
+        self.step = step
+        self.min_train_rows = min_train_rows
+        self.workers = workers or os.cpu_count()
+        self.threads = threads
+        self.cache_folder = cache_folder
+        self._folders = None
+
+    def matrices(self) -> dict:
+        if self._folders is None:
+            self._folders = {league.name: feature_matrix(league, self.cache_folder) for league in self.leagues}
+        return self._folders
+
+    def tasks(self, model, params) -> list:
+        tasks = []
+        for league_name, folder in self.matrices().items():
+            _, columns = load_matrix(folder)
+            for fold_name, cut, test in folds(columns, self.by, self.step):
+                for target in self.targets:
+                    tasks.append({"folder": folder, "league": league_name, "target": target, "fold": fold_name,
+                                  "cut": cut, "test": test, "model": model, "params": params or {},
+                                  "threads": self.threads, "min_train_rows": self.min_train_rows})
+        return tasks
+
+    def run(self, model="catboost", params=None) -> pd.DataFrame:
+
+        """ Metrics of every (league, target, fold) of `model` (a key of models.models.MODELS) with `params`.
+        """
+
+        tasks = self.tasks(model, params)
+        if self.workers == 1:
+            return pd.DataFrame([run_fold(task) for task in tasks])
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return pd.DataFrame(list(executor.map(run_fold, tasks)))
+
+    @staticmethod
+    def summary(results) -> pd.DataFrame:
+
+        """ Metrics per league and target, averaged over the scored folds weighted by their test rows.
+        """
+
+        scored = results.dropna(subset=["Log loss"])
+        metrics = ["Log loss", "Prior log loss", "Accuracy", "Brier"]
+        weighted = scored[metrics].mul(scored["Test rows"], axis=0).assign(**{"Test rows": scored["Test rows"]})
+        weighted[["League", "Target"]] = scored[["League", "Target"]]
+        grouped = weighted.groupby(["League", "Target"], sort=True)
+        summary = grouped[metrics].sum().div(grouped["Test rows"].sum(), axis=0)
+        summary["Folds"] = scored.groupby(["League", "Target"]).size()
+        summary["Test rows"] = grouped["Test rows"].sum()
+        return summary.round(4).reset_index()
+
+
+if __name__ == '__main__':
+    from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the models")
+    parser.add_argument("--model", choices=list(MODELS), default="catboost")
+    parser.add_argument("--by", choices=["season", "round"], default="season")
+    parser.add_argument("--step", type=int, default=1)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=["Result", "Minus 2.5 Goals"])
+    parser.add_argument("--workers", type=int, default=None)
+    arguments = parser.parse_args()
+
+    backtester = Backtester([PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()],
+                            arguments.targets, arguments.by, arguments.step, workers=arguments.workers)
+    start = time.perf_counter()
+    backtester.matrices()
+    print(f"Feature matrices ready in {time.perf_counter() - start:.1f} s")
+    start = time.perf_counter()
+    results = backtester.run(arguments.model)
+    print(f"{len(results)} folds in {time.perf_counter() - start:.1f} s")
+    print(Backtester.summary(results).to_string(index=False))
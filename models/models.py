@@ -1,17 +1,300 @@
+""" Match models trained on DataManager.get_data_for_prediction() (one row per played match) and scoring the
+upcoming fixtures of DataManager.get_data_for_future_prediction().
+
+    model = CatBoost(target="Result")
+    model.train([PremierLeague(), Ligue1()])
+    model.save_results(model.predict([PremierLeague(), Ligue1()]))
+
+Run from the repository root:  python -m models.models [--model catboost|xgboost] [--target Result] [--pooled]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+import warnings
 from abc import abstractmethod, ABC
+
+import numpy as np
 import pandas as pd
+
 from leagues.league import League
 
+
+# columns of the features among the ones ProcessingFootball._keep_columns_for_model keeps, all known before the
+# match (the _Scaled_Season_Average columns are left out: their season average includes the match itself)
+FEATURE_MARKERS = ("_Lag", "_5_Last_Matches")
+
+TARGETS = {
+    "Result": ["W_Home", "D", "W_Away"],
+    "Minus 1.5 Goals": [0, 1],
+    "Minus 2.5 Goals": [0, 1],
+    "Minus 3.5 Goals": [0, 1],
+}
+
+POOLED = "pooled"
+
+
+def feature_columns(data) -> list:
+    return [col for col in data.columns
+            if any(marker in col for marker in FEATURE_MARKERS) and pd.api.types.is_numeric_dtype(data[col])]
+
+
+def feature_matrix(data, features) -> pd.DataFrame:
+
+    """ `features` of `data` as float32, the missing values of the compact nullable ints as NaN (the boosting
+    libraries do not convert pd.NA), as the feature matrices of models.backtest.
+    """
+
+    return pd.DataFrame(data.reindex(columns=features).to_numpy(dtype=np.float32, na_value=np.nan),
+                        index=data.index, columns=features)
+
+
+def upcoming(data) -> pd.Series:
+
+    """ Rows of the matches not played yet (the fixtures of storage/futur_matches).
+    """
+
+    return data['Result_Home'].isna()
+
+
 class BaseModel(ABC):
+
+    """ Gradient boosting classifier of `target` (a column of TARGETS) on the feature_columns, one model per
+    league (its Comp) or, with `pooled`, one model on the matches of all the leagues. Boosting runs on `threads`
+    threads (all the cores by default).
+
+    Every model is saved in `artifacts_folder`/{name}/{target}/{league or pooled} (the model file and a json of
+    its features and classes). The loaded models are kept warm in memory, shared by the instances of the process
+    (a model file rewritten since is loaded again): predict() does not read the disk once they are loaded.
+    """
+
+    name = None
+    extension = None
+
+    # (path of the model file) -> (its mtime, model, meta), see _load
+    warm = {}
+    _warm_lock = threading.Lock()
+
+    def __init__(self, target="Result", pooled=False, threads=None, params=None,
+                 artifacts_folder=os.path.join('storage', 'models')):
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target {target}, one of {list(TARGETS)}")
+        self.target = target
+        self.classes = TARGETS[target]
+        self.pooled = pooled
+        self.threads = threads or os.cpu_count()
+        self.params = params or {}
+        self.artifacts_folder = artifacts_folder
+
+    def train(self, leagues) -> pd.DataFrame:
+
+        """ Train and save the model of every league of `leagues` (a League or a list), or the pooled model of
+        all of them. Returns one row per model trained: rows, features, training time.
+        """
+
+        leagues = [leagues] if isinstance(leagues, League) else list(leagues)
+        datasets = {league.name: league.data.get_data_for_prediction() for league in leagues}
+        if self.pooled:
+            datasets = {POOLED: pd.concat(list(datasets.values()), ignore_index=True)}
+
+        report = []
+        for key, data in datasets.items():
+            data = data[~upcoming(data) & data[self.target].isin(self.classes)]
+            features = feature_columns(data)
+            labels = data[self.target].map({label: code for code, label in enumerate(self.classes)}).to_numpy()
+
+            start = time.perf_counter()
+            model = self._fit(feature_matrix(data, features), labels)
+            elapsed = time.perf_counter() - start
+
+            meta = {"model": self.name, "target": self.target, "classes": self.classes, "features": features,
+                    "rows": len(data), "trained_at": datetime.datetime.now().isoformat(timespec="seconds")}
+            self._save(model, meta, key)
+            report.append({"Model": key, "Rows": len(data), "Features": len(features), "Seconds": round(elapsed, 2)})
+
+        return pd.DataFrame(report)
+
+    def predict(self, new_data, incremental=False) -> pd.DataFrame:
+
+        """ Probabilities of the classes of the target for the upcoming fixtures of `new_data` (a League or a
+        list of leagues, whose get_data_for_future_prediction is scored), or for all the rows of `new_data` (a
+        DataFrame shaped as get_data_for_prediction). One batched call per model: the fixtures of all the
+        leagues at once for the pooled model. With `incremental`, the fixtures are read from the processed state
+        of the leagues (DataManager.get_data_for_future_prediction). Both paths leave out the stored fixtures of
+        matches already played, so they score the same fixtures; a league without upcoming fixture is warned about.
+        """
+
+        if not isinstance(new_data, pd.DataFrame):
+            leagues = [new_data] if isinstance(new_data, League) else list(new_data)
+            future = {league.name: league.data.get_data_for_future_prediction(incremental) for league in leagues}
+            future = {name: data[upcoming(data)] for name, data in future.items()}
+            empty = [name for name, data in future.items() if data.empty]
+            if empty:
+                warnings.warn(f"No upcoming fixture to score for {', '.join(empty)}", stacklevel=2)
+            new_data = pd.concat(list(future.values()), ignore_index=True)
+
+        new_data = new_data.reset_index(drop=True)
+        groups = {POOLED: new_data.index} if self.pooled else new_data.groupby('Comp', observed=True).groups
+
+        probabilities = np.full((len(new_data), len(self.classes)), np.nan)
+        for key, index in groups.items():
+            model, meta = self._load(key)
+            rows = feature_matrix(new_data.loc[index], meta["features"])
+            probabilities[index] = self._predict_proba(model, rows)
+
+        predictions = new_data[['DateTime', 'Comp', 'Team Home', 'Team Away']].copy()
+        for code, label in enumerate(self.classes):
+            predictions[f"P({self.target} = {label})"] = probabilities[:, code]
+        return predictions
+
+    def save_results(self, predictions, folder=os.path.join('storage', 'predictions')):
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{self.name}_{self.target}.csv")
+        predictions.to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def path(self, key) -> str:
+        return os.path.join(self.artifacts_folder, self.name, self.target, f"{key}.{self.extension}")
+
+    def _save(self, model, meta, key):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._save_model(model, path + ".tmp")
+        with open(path + ".json.tmp", "w") as file:
+            json.dump(meta, file, indent=1)
+        os.replace(path + ".json.tmp", path + ".json")
+        os.replace(path + ".tmp", path)
+
+        with BaseModel._warm_lock:
+            BaseModel.warm[path] = (os.stat(path).st_mtime_ns, model, meta)
+
+    def _load(self, key):
+
+        """ (model, meta) of `key`, from memory when the model file did not change since it was loaded.
+        """
+
+        path = self.path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No {self.name} model of {self.target} for {key} in {self.artifacts_folder}, "
+                                    f"train it first")
+        mtime = os.stat(path).st_mtime_ns
+        with BaseModel._warm_lock:
+            cached = BaseModel.warm.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        with open(path + ".json") as file:
+            meta = json.load(file)
+        model = self._load_model(path)
+        with BaseModel._warm_lock:
+            BaseModel.warm[path] = (mtime, model, meta)
+        return model, meta
+
     @abstractmethod
-    def train(self, league : League()) -> pd.DataFrame:
+    def _fit(self, features, labels):
         pass
-    def predict(self, new_data):
+
+    @abstractmethod
+    def _predict_proba(self, model, features) -> np.ndarray:
         pass
-    def save_results(self, predictions):
+
+    @abstractmethod
+    def _save_model(self, model, path):
+        pass
+
+    @abstractmethod
+    def _load_model(self, path):
         pass
 
+
 class CatBoost(BaseModel):
-    def train(self, league : League()) -> pd.DataFrame:
 
+    name = "catboost"
+    extension = "cbm"
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import catboost
+        except ImportError as e:
+            raise ImportError("The CatBoost model needs catboost: pip install catboost") from e
+        super().__init__(*args, **kwargs)
+
+    def _fit(self, features, labels):
+        from catboost import CatBoostClassifier
+
+        params = {"iterations": 500, "learning_rate": 0.05, "depth": 6, "verbose": False, "allow_writing_files": False,
+                  "loss_function": "MultiClass" if len(self.classes) > 2 else "Logloss", **self.params}
+        model = CatBoostClassifier(thread_count=self.threads, **params)
+        model.fit(features, labels)
+        return model
+
+    def _predict_proba(self, model, features) -> np.ndarray:
+        return model.predict_proba(features, thread_count=self.threads)
+
+    def _save_model(self, model, path):
+        model.save_model(path, format="cbm")
+
+    def _load_model(self, path):
+        from catboost import CatBoostClassifier
+
+        return CatBoostClassifier().load_model(path, format="cbm")
+
+
+class XGBoost(BaseModel):
+
+    name = "xgboost"
+    extension = "ubj"
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import xgboost
+        except ImportError as e:
+            raise ImportError("The XGBoost model needs xgboost: pip install xgboost") from e
+        super().__init__(*args, **kwargs)
+
+    def _fit(self, features, labels):
+        from xgboost import XGBClassifier
+
+        params = {"n_estimators": 400, "learning_rate": 0.05, "max_depth": 4, "subsample": 0.8,
+                  "colsample_bytree": 0.8, "tree_method": "hist", **self.params}
+        model = XGBClassifier(n_jobs=self.threads, **params)
+        model.fit(features, labels)
+        return model
+
+    def _predict_proba(self, model, features) -> np.ndarray:
+        return model.predict_proba(features)
+
+    def _save_model(self, model, path):
+        model.save_model(path)
+
+    def _load_model(self, path):
+        from xgboost import XGBClassifier
+
+        model = XGBClassifier(n_jobs=self.threads)
+        model.load_model(path)
+        return model
+
+
+MODELS = {"catboost": CatBoost, "xgboost": XGBoost}
+
+
+if __name__ == '__main__':
+    from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+
+    parser = argparse.ArgumentParser(description="Train the models of the leagues and score their upcoming fixtures")
+    parser.add_argument("--model", choices=list(MODELS), default="catboost")
+    parser.add_argument("--target", choices=list(TARGETS), default="Result")
+    parser.add_argument("--pooled", action="store_true")
+    parser.add_argument("--incremental", action="store_true", help="score the fixtures from the processed state")
+    arguments = parser.parse_args()
 
+    leagues = [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]
+    model = MODELS[arguments.model](target=arguments.target, pooled=arguments.pooled)
+    print(model.train(leagues).to_string(index=False))
+    predictions = model.predict(leagues, incremental=arguments.incremental)
+    print(predictions.to_string(index=False))
+    print(f"Saved in {model.save_results(predictions)}")
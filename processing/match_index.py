@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+
+class MatchIndex:
+
+    """ Integer key of a match, the same from both of its rows: (day, home team id, away team id) packed in one
+    int64. Team ids are positions in a sorted team dictionary (the shared categories of Team and Opponent with
+    the compact schema). Pairing the home and away rows is then a hash join on integers.
+    """
+
+    def __init__(self, teams):
+        self.teams = pd.Index(sorted(teams))
+
+    @classmethod
+    def from_data(cls, data) -> "MatchIndex":
+        team, opponent = data['Team'], data['Opponent']
+        if isinstance(team.dtype, pd.CategoricalDtype) and team.dtype == opponent.dtype:
+            return cls(team.cat.categories)
+        return cls(pd.unique(pd.concat([team.dropna(), opponent.dropna()]).astype(str)))
+
+    @staticmethod
+    def rows(data) -> pd.MultiIndex:
+
+        """ (DateTime, Team, Opponent) of every row, one row of a team per match: a stored fixture and the played
+        row of its match share it, whatever the team dictionaries of their frames.
+        """
+
+        return pd.MultiIndex.from_arrays([data['DateTime'], data['Team'].astype(str), data['Opponent'].astype(str)])
+
+    def team_ids(self, values) -> np.ndarray:
+
+        """ Id of every team of `values`, -1 for the teams outside the dictionary.
+        """
+
+        if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.equals(self.teams):
+            return values.cat.codes.to_numpy()
+        return self.teams.get_indexer(np.asarray(values, dtype=object).astype(str))
+
+    def keys(self, data) -> np.ndarray:
+
+        """ Match key of every row, -1 when its day or one of its teams is unknown.
+        """
+
+        home = (data['Venue'] == 'Home').to_numpy()
+        team, opponent = self.team_ids(data['Team']), self.team_ids(data['Opponent'])
+        home_id, away_id = np.where(home, team, opponent), np.where(home, opponent, team)
+
+        days = data['DateTime'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+
+        n = max(len(self.teams), 1)
+        valid = ~np.isnat(days) & (home_id >= 0) & (away_id >= 0)
+        keys = np.full(len(data), -1, dtype=np.int64)
+        keys[valid] = (days[valid].astype(np.int64) * n + home_id[valid]) * n + away_id[valid]
+        return keys
+
+    def pair(self, data) -> (np.ndarray, np.ndarray, np.ndarray):
+
+        """ Positions of the home rows, of their away rows (same order) and of the unpaired rows: rows without
+        their opposite row, with an unknown key or a neutral venue. A key found twice on the same side (a stored
+        fixture of a match played since) keeps its played row, or its first one: the other rows are in none of
+        the three.
+        """
+
+        keys = self.keys(data)
+        venue = data['Venue'].to_numpy(dtype=object)
+        played = data['Result'].notna().to_numpy() if 'Result' in data.columns else np.zeros(len(data), dtype=bool)
+        home = self._first_of_keys(np.flatnonzero((venue == 'Home') & (keys >= 0)), keys, played)
+        away = self._first_of_keys(np.flatnonzero((venue == 'Away') & (keys >= 0)), keys, played)
+
+        partner = pd.Index(keys[away]).get_indexer(keys[home])
+        home_rows, away_rows = home[partner >= 0], away[partner[partner >= 0]]
+
+        paired, kept = np.zeros(len(data), dtype=bool), np.zeros(len(data), dtype=bool)
+        paired[home_rows] = paired[away_rows] = True
+        kept[home] = kept[away] = True
+        sided = ((venue == 'Home') | (venue == 'Away')) & (keys >= 0)
+
+        return home_rows, away_rows, np.flatnonzero(~paired & (kept | ~sided))
+
+    @staticmethod
+    def _first_of_keys(rows, keys, played) -> np.ndarray:
+
+        """ `rows` with one row per key: the played row of the key, else its first one (in `rows` order).
+        """
+
+        candidates = rows[np.argsort(~played[rows], kind='stable')]
+        return np.sort(candidates[~pd.Index(keys[candidates]).duplicated()])
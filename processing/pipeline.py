@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+from processing.processing import ProcessingFootball
+
+
+ALL_LEAGUES = [PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA]
+
+STAGES = ["raw load", "initial_processing", "features", "merge"]
+
+
+def process_league(league_class) -> (str, pd.DataFrame, dict):
+
+    """ Training rows of one league (same as DataManager.get_data_for_prediction) and the wall time of each
+    stage. Module-level so that it can be sent to the worker processes.
+    """
+
+    league = league_class()
+    processer = ProcessingFootball(league.data.schema)
+    timings = {}
+
+    start = time.perf_counter()
+    data = league.data.get_raw_data(columns=processer.model_raw_columns())
+    timings["raw load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = processer.initial_processing(data)
+    timings["initial_processing"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = processer.calculate_features_for_model(data)
+    timings["features"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = processer._keep_columns_for_model(data)
+    data = processer._merge_2_rows_in_one(data)
+    data.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'], inplace=True)
+    timings["merge"] = time.perf_counter() - start
+
+    return league.name, data, timings
+
+
+class MultiLeaguePipeline:
+
+    """ Rebuild of the training data of several leagues, one league per process (the leagues are independent,
+    so the rebuild scales with the cores). run() returns the leagues concatenated with a League column,
+    `timings` keeps the wall time of every stage per league.
+    """
+
+    def __init__(self, leagues=None, workers=None):
+        self.leagues = leagues or ALL_LEAGUES
+        self.workers = workers or min(len(self.leagues), os.cpu_count() or 1)
+        self.timings = None
+        self.wall_time = None
+
+    def run(self) -> pd.DataFrame:
+        start = time.perf_counter()
+
+        if self.workers == 1:
+            results = [process_league(league_class) for league_class in self.leagues]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(process_league, self.leagues))
+
+        frames = []
+        for name, data, _ in results:
+            data.insert(0, 'League', name)
+            frames.append(data)
+        data = pd.concat(frames, ignore_index=True)
+
+        self.wall_time = time.perf_counter() - start
+        self.timings = pd.DataFrame({name: timings for name, _, timings in results}).T[STAGES]
+        self.timings['total'] = self.timings.sum(axis=1)
+
+        return data
+
+    def report(self) -> str:
+        lines = [self.timings.to_string(float_format=lambda seconds: f"{seconds:.2f}"),
+                 f"\n{len(self.leagues)} leagues on {self.workers} processes: {self.wall_time:.2f} s "
+                 f"(sequential sum {self.timings['total'].sum():.2f} s)"]
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    pipeline = MultiLeaguePipeline(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    data = pipeline.run()
+    print(pipeline.report())
+    print(f"{len(data)} matches, {data.shape[1]} columns")
@@ -1,11 +1,29 @@
 import pandas as pd
 import json
+import warnings
 import numpy as np
+from processing.match_index import MatchIndex
+from processing.rolling import RollingFeatureEngine
+from processing.stages import CanonicalOrder, FeatureGraph, Stage
+from processing.standings import StandingsEngine, COLUMNS as STANDINGS_COLUMNS
+from processing.state import FeatureState, concat_parts
+from profiling.trace import traced
+
+
+# targets of the bookmaker columns: 1 when the total of goals is under the line
+BOOKMAKER_LINES = {"Minus 1.5 Goals": 1.5, "Minus 2.5 Goals": 2.5, "Minus 3.5 Goals": 3.5}
 
 
 class ProcessingFootball:
 
-    def __init__(self):
+    def __init__(self, schema=None):
+
+        """ With a storage.schema.CompactSchema, the compact dtypes of the raw data are kept (nullable ints,
+        categories) and the features are computed as schema.float_dtype.
+        """
+
+        self.schema = schema
+        self.float_dtype = np.float64 if schema is None else schema.float_dtype
 
         self.list_columns = [
             "Total Shots", "Shots on Target", "Shots on Target %", "Goals per Shot", "Total Touches", 
@@ -21,55 +39,314 @@ class ProcessingFootball:
 
         self.foundations_columns = ["DateTime", "Comp", "Season", "Round", "Day", "Venue", "Result", "GF", "GA", "Opponent", "xG", "xGA", "Poss", "Attendance", "Captain", "Formation", "Referee", "Match Report", "Notes", "Team", "Minus 1.5 Goals", "Minus 2.5 Goals", "Minus 3.5 Goals"]
 
-
+        self.rolling_engine = RollingFeatureEngine(window=5)
+        self.unpaired_rows = None
+
+        # the stages share one (Season, Team, DateTime) order and write into one block, see processing.stages
+        # (the lags read the standings built by the ranking stage of the same run, FeatureRun.context)
+        self.feature_graph = FeatureGraph([
+            Stage("cumulatives", self._calculate_cumulatives_features, [f'{col}_Cum' for col in STANDINGS_COLUMNS]),
+            Stage("ranking", self._calculate_ranking, ['Ranking']),
+            Stage("bookmaker", self._bookmaker_stage, list(BOOKMAKER_LINES)),
+            Stage("lags", self._calculate_lagged_features, [f'{col}_Cum_Lag' for col in STANDINGS_COLUMNS] + ['Ranking_Lag'],
+                  requires=["ranking"], dependencies=lambda column: ['Ranking']),
+            Stage("rolling", self._calculate_rolling_features, self.rolling_engine.columns(self.list_columns)),
+        ], dtype=self.float_dtype)
+
+    @traced()
     def initial_processing(self, data): 
         data = self._prepare_basic_columns(data)
         data = self._rename_and_drop_columns(data)
-        data = self._calculate_cumulatives_features(data)
-        data = self._calculate_ranking(data)
-        data = self._features_bookmaker_creation(data)
-        return data
+        return self.feature_graph.run(data, ["cumulatives", "ranking", "bookmaker"])
 
-    def features_processing(self, data):
-        data = self.initial_processing(data)
-        data = self.calculate_features_for_model(data)
-        return data
+    @traced()
+    def features_processing(self, data, columns=None):
 
+        """ All the features, or only the feature `columns` (names of feature_graph.registry) and the ones they
+        are computed from.
+        """
 
-    def prediction_processing(self, data):
-        data = self.features_processing(data)
+        data = self._prepare_basic_columns(data)
+        data = self._rename_and_drop_columns(data)
+        if columns is None:
+            return self.feature_graph.run(data, ["cumulatives", "ranking", "bookmaker", "lags", "rolling"])
+        return self.feature_graph.run(data, columns=columns)
+
+
+    @traced()
+    def prediction_processing(self, data, columns=None):
+
+        """ One row per match with the features of both teams. With `columns` (merged names as
+        'Total Shots_5_Last_Matches_Std_Home', or feature names), only the features they need are computed.
+        """
+
+        data = self.features_processing(data, columns=None if columns is None else self.model_features(columns))
         data = self._keep_columns_for_model(data)
         data = self._merge_2_rows_in_one(data)
         data.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'], inplace=True)
         return data
 
-    def futur_prediciton_processing(self,data, data_next_match):
+    def model_features(self, columns) -> list:
+
+        """ Feature columns to compute for the merged `columns` of a model (suffixes _Home / _Away removed,
+        other columns ignored), with the bookmaker targets and the column selecting the rows with 5 matches played.
+        """
+
+        features = [column[:-5] if column.endswith(('_Home', '_Away')) else column for column in columns]
+        features += list(BOOKMAKER_LINES) + ['Total Shots_5_Last_Matches_Average']
+        return [column for column in dict.fromkeys(features) if column in self.feature_graph.registry]
+
+    @traced()
+    def futur_prediciton_processing(self,data, data_next_match, columns=None):
+
+        """ Merged rows of the played matches of `data` and of the upcoming fixtures of `data_next_match`, the
+        fixtures of matches already in `data` (stored before the refresh of futur_matches) left out.
+        """
+
         data = self.initial_processing(data)
         data_next_match = self._prepare_basic_columns(data_next_match)
+        data_next_match = data_next_match[~MatchIndex.rows(data_next_match).isin(MatchIndex.rows(data))]
         glob_data = pd.concat([data, data_next_match], sort=False).reset_index(drop=True)
-        glob_data = self.calculate_features_for_model(glob_data)
+        if self.schema is not None:
+            # categories of the two frames differ, the concatenation fell back to objects
+            glob_data = self.schema.apply(glob_data)
+        glob_data = self.calculate_features_for_model(glob_data, None if columns is None else self.model_features(columns))
         glob_data = self._keep_columns_for_model(glob_data)
         glob_data = self._merge_2_rows_in_one(glob_data)
         glob_data.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'], inplace=True)
         return glob_data
 
-    def calculate_features_for_model(self, data):
-        data = self._calculate_lagged_features(data)
-        data = self._calculate_5_last_match_average(data, self.list_columns)
-        data = self._calculate_5_last_match_sum(data, self.list_columns)
-        data = self._calculate_5_last_match_std(data, self.list_columns)
-        data = self._calculate_5_last_match_form(data)
-        data = self._calculate_scaled_season_average(data, self.list_columns)
+    @traced()
+    def build_state(self, data):
+
+        """ Full processing of `data`, kept in a FeatureState so that the next matches can be added
+        with incremental_processing.
+        """
+
+        data = self.features_processing(data)
+        standings = self.feature_graph.last_run.context.get('standings')
+        prediction = self._merge_2_rows_in_one(self._keep_columns_for_model(data))
+        prediction.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'], inplace=True)
+        return FeatureState(data, prediction, self.list_columns, window=self.rolling_engine.window,
+                            standings=standings, unpaired=self.unpaired_rows.index)
+
+    @traced()
+    def incremental_processing(self, state, new_data):
+
+        """ Features of the matches of `new_data` not processed yet, computed from `state` only so the cost
+        is O(new matches), then appended to state.data (and their merged rows to state.prediction).
+        Returns the new feature rows.
+
+        A match in a round already processed for its team or played after a later round (postponed match)
+        changes the cumulatives of the following rounds, and a match of a round before the last one of the
+        standings changes the rankings already looked up: a ValueError is raised and the state has to be
+        rebuilt with build_state.
+        """
+
+        new_data = self._prepare_basic_columns(new_data)
+        new_data = self._rename_and_drop_columns(new_data)
+        new_data = new_data[~state.is_processed(new_data)]
+
+        if getattr(state, 'standings', None) is None:
+            raise ValueError("State saved without its standings, rebuild the state")
+
+        if new_data.empty:
+            return new_data.reindex(columns=state.empty().columns)
+
+        # (canonical order of the feature graph: the rows of a team follow each other, in kickoff order)
+        new_data = new_data.iloc[CanonicalOrder(new_data).order].reset_index(drop=True)
+
+        late = [key for key, round_, kickoff in zip(zip(new_data['Season'], new_data['Team']), new_data['Round'], new_data['DateTime'])
+                if round_ <= state.last_round.get(key, 0) or (key in state.last_date and kickoff <= state.last_date[key])]
+        postponed = new_data.groupby(['Season', 'Team'], observed=True)['Round'].diff() <= 0
+        late += list(zip(new_data.loc[postponed, 'Season'], new_data.loc[postponed, 'Team']))
+        if late:
+            raise ValueError(f"Matches of already processed rounds for {sorted(set(late))}, rebuild the state")
+        state.standings.update(new_data)
+
+        new_data.index += state.next_label()
+
+        new_data = self._calculate_incremental_features(state, new_data)
+        new_data = self._calculate_incremental_ranking(state, new_data)
+        new_data = self._features_bookmaker_creation(new_data)
+        dtypes = state.empty().dtypes
+        new_data = new_data.reindex(columns=dtypes.index)
+        new_data = new_data.astype({col: dtype for col, dtype in dtypes.items()
+                                    if pd.api.types.is_numeric_dtype(dtype) and new_data[col].dtype != dtype})
+
+        # the rows of the state still waiting for their opposite row are paired with the new ones
+        model_rows = self._keep_columns_for_model(new_data)
+        waiting = state.rows(state.unpaired, list(model_rows.columns)) if state.unpaired else model_rows.iloc[:0]
+        candidates = concat_parts([waiting, model_rows])
+        home_rows, away_rows, unpaired = MatchIndex.from_data(candidates).pair(candidates)
+        paired = np.concatenate([home_rows, away_rows])
+        # (the rows still waiting are already merged alone in state.prediction)
+        merged = np.sort(np.concatenate([paired, unpaired[unpaired >= len(waiting)]]))
+
+        new_prediction = self._merge_2_rows_in_one(candidates.iloc[merged].copy())
+        new_prediction.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'], inplace=True)
+        replaced = new_prediction['MatchID'] if (paired < len(waiting)).any() else ()
+
+        state.append(new_data, new_prediction, unpaired=candidates.index[unpaired], replaced=replaced)
+
+        return new_data
+
+    def _rolling_after_state(self, state, data, order, update=False) -> np.ndarray:
+
+        """ Rolling features of the rows of `data` (the columns of rolling_engine.columns(list_columns)), in the
+        canonical `order` of data (processing.stages.CanonicalOrder), as the continuation of the matches of
+        `state`: the last matches of every team are put before its rows in the block of the RollingFeatureEngine,
+        its season sums start the season averages. With `update`, the rows are played matches and become the
+        last matches and season sums of the state.
+        """
+
+        window, n_columns = state.window, len(self.list_columns)
+        groups = list(zip(data['Season'].to_numpy()[order.starts], data['Team'].to_numpy()[order.starts]))
+        history = [state.windows.get(key, np.empty((0, n_columns))) for key in groups]
+        past_results = [list(state.results.get(key, [])) for key in groups]
+        lengths = np.array([len(rows) for rows in history], dtype=np.int64)
+
+        values = data.reindex(columns=self.list_columns).to_numpy(dtype=np.float64, na_value=np.nan)
+        results = np.concatenate([np.asarray(rows, dtype=object) for rows in past_results]
+                                 + [data['Result'].astype(object).to_numpy()])
+        codes = np.concatenate([np.repeat(np.arange(len(groups)), lengths), order.codes])
+        positions = np.concatenate([np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths),
+                                    lengths[order.codes] + order.positions])
+        block = self.rolling_engine.scatter(np.column_stack([np.vstack(history + [values]), results == 'W', results == 'L']),
+                                            codes, positions)
+
+        every = list(range(n_columns))
+        statistics = self.rolling_engine.select(block[:, :, :n_columns], block[:, :, n_columns:],
+                                                {'Average': every, 'Sum': every, 'Std': every, 'Form': [0, 1]})
+        row = (order.codes, lengths[order.codes] + order.positions)
+        features = [statistics[name][row] for name in ['Average', 'Sum', 'Std', 'Form']]
+
+        sums = np.array([state.season_sums.get(key, (np.zeros(n_columns), np.zeros(n_columns)))[0] for key in groups]).reshape(-1, n_columns)
+        counts = np.array([state.season_sums.get(key, (np.zeros(n_columns), np.zeros(n_columns)))[1] for key in groups]).reshape(-1, n_columns)
+        season = self.rolling_engine.scatter(values, order.codes, order.positions)
+        features.append(self.rolling_engine.expanding_mean(season, sums, counts)[order.codes, order.positions])
+
+        if update:
+            for group, key in enumerate(groups):
+                played = lengths[group] + order.sizes[group]
+                state.windows[key] = block[group, max(played - window, 0):played, :n_columns]
+                new_results = list(data['Result'].iloc[order.starts[group]:order.starts[group] + order.sizes[group]])
+                state.results[key] = (past_results[group] + new_results)[-window:]
+                state.season_sums[key] = (sums[group] + np.nansum(season[group], axis=0),
+                                          counts[group] + (~np.isnan(season[group, :order.sizes[group]])).sum(axis=0))
+
+        return np.concatenate(features, axis=1)
+
+    @traced()
+    def _calculate_incremental_features(self, state, data):
+
+        """ Cumulatives, their lags and the rolling features of the new rows (in canonical order), updating the
+        per (Season, Team) cumulatives, last matches and season sums of the state.
+        """
+
+        order = CanonicalOrder(data)
+        groups = list(zip(data['Season'].to_numpy()[order.starts], data['Team'].to_numpy()[order.starts]))
+        increments = data[state.cumulative_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        counted = np.nan_to_num(increments)
+
+        # cumulatives before the row: the ones of the state, plus the rows of the team before it
+        previous = np.array([state.cumulatives.get(key, np.zeros(4)) for key in groups]).reshape(-1, 4)
+        before = previous[order.codes] + order.cumsum(counted) - counted
+        cumulatives = before + increments
+        first_known = np.array([key in state.cumulatives for key in groups], dtype=bool)
+        lags = np.where(((order.positions == 0) & ~first_known[order.codes])[:, None], np.nan, before)
+
+        last = order.starts + order.sizes - 1
+        rounds = data['Round'].to_numpy()
+        for group, key in enumerate(groups):
+            state.cumulatives[key] = before[last[group]] + counted[last[group]]
+            state.last_round[key] = max(state.last_round.get(key, 0), rounds[order.starts[group]:last[group] + 1].max())
+            state.last_date[key] = data['DateTime'].iat[last[group]]
+
+        rolling = self._rolling_after_state(state, data, order, update=True)
+
+        names = ([f'{col}_Cum' for col in state.cumulative_columns] + [f'{col}_Cum_Lag' for col in state.cumulative_columns]
+                 + self.rolling_engine.columns(self.list_columns))
+        features = np.concatenate([cumulatives, lags, rolling], axis=1)
+        return pd.concat([data, pd.DataFrame(features, index=data.index, columns=names)], axis=1)
+
+    @traced()
+    def _calculate_incremental_ranking(self, state, data):
+
+        """ Ranking and Ranking_Lag of the new rows from the standings of the state (already updated with them).
+        The processed rows of the rounds of the new rows are ranked again in state.data, their table changed.
+        """
+
+        data['Ranking'] = state.standings.ranking(data['Season'], data['Round'], data['Team'])
+        data['Ranking_Lag'] = state.standings.before(data['Season'], data['Round'], data['Team'])[0]
+
+        labels = [label for key in data.groupby(['Season', 'Round'], observed=True).groups for label in state.rounds.get(key, [])]
+        if labels:
+            old_rows = state.rows(labels, ['Season', 'Round', 'Team'])
+            state.update_rows(labels, 'Ranking', state.standings.ranking(old_rows['Season'], old_rows['Round'], old_rows['Team']))
+
         return data
 
+    @traced()
+    def futur_matches_processing(self, state, data_next_match):
+
+        """ Merged home / away rows of the matches of `data_next_match` (storage futur_matches), the upcoming rows
+        of futur_prediciton_processing read from `state` (last matches, season sums and standings of every team)
+        instead of processing the history again: O(fixtures). The fixtures follow the matches of the state, the
+        ones already played (stored before the refresh of futur_matches) are left out.
+        """
+
+        data = self._prepare_basic_columns(data_next_match)
+        if self.schema is not None:
+            data = self.schema.apply(data)
+        data = data[~state.is_processed(data)]
+        # (canonical order of the feature graph: a team's second fixture follows its first one)
+        data = data.iloc[CanonicalOrder(data).order].reset_index(drop=True)
+        order = CanonicalOrder(data)
+
+        # as played rows without stats nor result, after the last matches of the state
+        rolling = self._rolling_after_state(state, data, order)
+        ranking, cumulatives = state.standings.before(data['Season'], data['Round'], data['Team'])
+
+        # one block of the features, in the order of the incremental path
+        names = ([f'{col}_Cum_Lag' for col in STANDINGS_COLUMNS] + ['Ranking_Lag'] + self.rolling_engine.columns(self.list_columns))
+        features = np.concatenate([cumulatives, ranking[:, None], rolling], axis=1)
+        data = pd.concat([data, pd.DataFrame(features.astype(self.float_dtype), index=data.index, columns=names)], axis=1)
+
+        data = self._keep_columns_for_model(data)
+        data = self._merge_2_rows_in_one(data.copy())
+        data.dropna(subset=['Total Shots_5_Last_Matches_Average_Home'], inplace=True)
+
+        # dtypes of the played matches (a numpy int column, as the bookmaker lines, is missing for the fixtures)
+        dtypes = state.empty(prediction=True).dtypes
+        data = data.reindex(columns=dtypes.index)
+        # (column by column: astype of a dict goes through every column of the frame)
+        for col, dtype in dtypes[(data.dtypes != dtypes).to_numpy()].items():
+            if pd.api.types.is_numeric_dtype(dtype) and (not isinstance(dtype, np.dtype) or dtype.kind == 'f'):
+                data[col] = data[col].astype(dtype)
+        return data
+
+    @traced()
+    def calculate_features_for_model(self, data, columns=None):
+
+        """ Lags and rolling features of the output of initial_processing, or only the feature `columns` not in
+        `data` yet.
+        """
+
+        if columns is None:
+            return self.feature_graph.run(data, ["lags", "rolling"])
+        return self.feature_graph.run(data, columns=[column for column in columns if column not in data.columns])
+
+    @traced()
     def _prepare_basic_columns(self, data):
 
         if 'Date' in data.columns and 'Time' in data.columns:
             data['DateTime'] = pd.to_datetime(data['Date'] + ' ' + data['Time'])
             data.drop(["Date", "Time"], axis=1, inplace=True)
             data = data[['DateTime'] + [col for col in data.columns if col != 'DateTime']]
-            data['Season'] = data['DateTime'].apply(
-                lambda x: f"{x.year}-{x.year + 1}" if x.month >= 8 else f"{x.year - 1}-{x.year}")
+            # seasons start in August
+            first_year = data['DateTime'].dt.year - (data['DateTime'].dt.month < 8)
+            data['Season'] = first_year.map({year: f"{year}-{year + 1}" for year in first_year.unique()})
 
 
         if 'Round' in data.columns:
@@ -79,53 +356,56 @@ class ProcessingFootball:
 
 
         if 'Formation' in data.columns:
-            data['Formation'] = data['Formation'].apply(
-                lambda x: x.replace('◆', '') if pd.notnull(x) else x)
+            formation = data['Formation'].astype(object).str.replace('◆', '', regex=False)
+            data['Formation'] = formation if self.schema is None else formation.astype('category')
 
         if 'GF' in data.columns and 'GA' in data.columns:
             if data[['GF', 'GA']].notnull().all().all():
-                data[['GF', 'GA']] = data[['GF', 'GA']].astype(float).astype(int)
+                data[['GF', 'GA']] = data[['GF', 'GA']].astype(float).astype(int if self.schema is None else 'Int16')
             data['GD'] = data['GF'] - data['GA']
             data["Total_Goals"] = data["GF"] + data["GA"]
 
         if 'Result' in data.columns:
-            data['Points'] = data.apply(lambda row: {'W': 3, 'D': 1, 'L': 0}.get(row['Result']) if pd.notnull(row['Result']) else np.nan, axis=1)
+            points = data['Result'].astype(object).map({'W': 3, 'D': 1, 'L': 0})
+            data['Points'] = points if self.schema is None else points.astype(self.float_dtype)
             
         return data
 
 
-    def _calculate_cumulatives_features(self, data):
+    def _calculate_cumulatives_features(self, run):
 
         """ Creation of cumulatives columns per season (examle : Points cumulated at each date, goals for cumulated...)
+        The sums follow the rounds, as the table of the StandingsEngine: a postponed match counts in its round.
         """
 
-        data.sort_values(by=['Season', 'Round', 'Team'], inplace=True)
-        data.reset_index(drop=True, inplace=True)
+        columns = [col for col in STANDINGS_COLUMNS if f'{col}_Cum' in run.columns]
+        cumulatives = run.order.cumsum(run.values(columns), within=run.values(['Round'])[:, 0])
+        run.write([f'{col}_Cum' for col in columns], cumulatives, [run.dtype(col) for col in columns])
 
-        cumulative_cols = data.groupby(['Season', 'Team']).agg({
-            'Points': 'cumsum',
-            'GD': 'cumsum',
-            'GF': 'cumsum',
-            'GA': 'cumsum'
-        }).reset_index()
-
-        data[['Points_Cum', 'GD_Cum', 'GF_Cum', 'GA_Cum']] = cumulative_cols[['Points', 'GD', 'GF', 'GA']]
-        
-        return data
+    def _calculate_ranking(self, run):
 
+        """ Place of the team in the full table of the league after the round (StandingsEngine), the engine is
+        left in the context of the run for the lags.
+        """
 
-    def _calculate_ranking(self, data):
+        data = run.data
+        standings = run.context['standings'] = StandingsEngine.from_data(data)
+        ranking = standings.ranking(data['Season'], data['Round'], data['Team'])
+        run.write(['Ranking'], ranking[run.order.order], np.int64)
 
-        data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
-        data['Ranking'] = data.groupby(['Season', 'Round']).cumcount() + 1
+    def _bookmaker_stage(self, run):
 
-        return data
+        # (missing totals are not under the line)
+        columns = run.wanted(BOOKMAKER_LINES)
+        total_goals = run.values(['Total_Goals'])[:, 0]
+        run.write(columns, np.column_stack([total_goals <= BOOKMAKER_LINES[col] for col in columns]), np.int64)
 
+    @traced()
     def _features_bookmaker_creation(self, data):
 
-        data["Minus 1.5 Goals"] = (data["Total_Goals"] <= 1.5).astype(int)
-        data["Minus 2.5 Goals"] = (data["Total_Goals"] <= 2.5).astype(int)
-        data["Minus 3.5 Goals"] = (data["Total_Goals"] <= 3.5).astype(int)
+        # (missing totals are not under the line, also with nullable ints)
+        for col, line in BOOKMAKER_LINES.items():
+            data[col] = (data["Total_Goals"] <= line).fillna(False).astype(int)
 
         return data
 
@@ -142,6 +422,21 @@ class ProcessingFootball:
         print(sorted(problem_names_2))
 
 
+    def model_raw_columns(self):
+
+        """ Raw fbref columns needed by prediction_processing (foundations columns and the raw names of
+        list_columns), so the storage only has to read these.
+        """
+
+        with open('processing/mapping_columns.json', 'r', encoding='utf-8') as file:
+            mappings = json.load(file)
+
+        raw_names = {new_col: old_col for old_col, new_col in mappings.get("Columns", {}).items()}
+        foundations = ['Date', 'Time'] + [col for col in self.foundations_columns if col not in ['DateTime', 'Season']]
+
+        return foundations + [raw_names.get(col, col) for col in self.list_columns]
+
+    @traced()
     def _rename_and_drop_columns(self, data):
     
         with open('processing/mapping_columns.json', 'r', encoding='utf-8') as file:
@@ -168,89 +463,51 @@ class ProcessingFootball:
 
         return data
 
-    def _calculate_lagged_features(self, data):
-
-        data.sort_values(by=['Season', 'Round', 'Team'], inplace=True)
-        data.reset_index(drop=True, inplace=True)
-
-        lag_cols = ['Points_Cum', 'GD_Cum', 'GF_Cum', 'GA_Cum']
-        data[[f'{col}_Lag' for col in lag_cols]] = data.groupby(['Season', 'Team'])[lag_cols].shift(1)
-
-        # Décalage du classement pour chaque équipe
-        data['Ranking_Lag'] = data.groupby(['Team'])['Ranking'].shift(1)
-
-        return data
-
-    def _calculate_5_last_match_form(self, data):
-
-        data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
-        
-        data["5_Last_Matches_Win"] = data.groupby(['Season', 'Team'])['Result'].transform(
-                                    lambda x: (x == "W").shift(1).rolling(window=5, min_periods=1).sum().fillna(0))
-
-        data["5_Last_Matches_Loose"] = data.groupby(['Season', 'Team'])['Result'].transform(
-                                    lambda x: (x == "L").shift(1).rolling(window=5, min_periods=1).sum().fillna(0))
-
-        return data
-    
-    def _calculate_5_last_match_average(self, data, list_columns):
-
-        #data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
-
-        new_columns = pd.DataFrame(index=data.index)
-
-        for col in list_columns:
-            new_columns[f'{col}_5_Last_Matches_Average'] = data.groupby(['Season', 'Team'])[col].transform(lambda x: x.shift(1).rolling(window=5, min_periods=5).mean())
-
-        data = pd.concat([data, new_columns], axis=1)
-
-        return data
-
-    def _calculate_5_last_match_sum(self, data, list_columns):
-
-        data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
-
-        new_columns = pd.DataFrame(index=data.index)
-
-        for col in list_columns:
-            new_columns[f'{col}_5_Last_Matches_Sum'] = data.groupby(['Season', 'Team'])[col].transform(lambda x: x.shift(1).rolling(window=5, min_periods=5).sum())
-
-        data = pd.concat([data, new_columns], axis=1)
-
-        return data
-
-    def _calculate_5_last_match_std(self, data, list_columns):
-
-        data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
-
-        new_columns = pd.DataFrame(index=data.index)
-
-        for col in list_columns:
-            new_columns[f'{col}_5_Last_Matches_Std'] = data.groupby(['Season', 'Team'])[col].transform(lambda x: x.shift(1).rolling(window=5, min_periods=5).std())
+    def _calculate_lagged_features(self, run):
 
-        data = pd.concat([data, new_columns], axis=1)
-
-        return data
-    
-
-    def _calculate_scaled_season_average(self, data, list_columns):
-
-        data.sort_values(by=['Season', 'Round', 'Points_Cum', 'GD_Cum'], ascending=[True, True, False, False], inplace=True)
+        """ Cumulatives and ranking of the team before the match, looked up in the standings of the played rows
+        (the future matches of futur_prediciton_processing get the current table).
+        """
 
-        new_columns = pd.DataFrame(index=data.index)
+        data = run.data
+        standings = run.context.get('standings') or StandingsEngine.from_data(data)
 
-        for col in list_columns:
-            new_columns[f'{col}_Scaled_Season_Average' ] = data.groupby(['Season', 'Team'])[col].transform(lambda x: x.expanding().mean())
+        ranking, cumulatives = standings.before(data['Season'], data['Round'], data['Team'])
+        wanted = [j for j, col in enumerate(STANDINGS_COLUMNS) if f'{col}_Cum_Lag' in run.columns]
+        # (the dtype of the cumulated column, a shifted int column has missing values: float)
+        dtypes = [np.float64 if run.dtype(STANDINGS_COLUMNS[j]) == np.int64 else run.dtype(STANDINGS_COLUMNS[j]) for j in wanted]
+        if wanted:
+            run.write([f'{STANDINGS_COLUMNS[j]}_Cum_Lag' for j in wanted], cumulatives[run.order.order][:, wanted], dtypes)
+        if 'Ranking_Lag' in run.columns:
+            run.write(['Ranking_Lag'], ranking[run.order.order])
 
-        def minmax_scale(x):
-            return (x - x.min()) / (x.max() - x.min())
-            
-        data = pd.concat([data, new_columns], axis=1)
-        # Ensuite, utilisez cette fonction avec .transform() pour appliquer la normalisation à chaque groupe
-        #RRR = A.groupby(['Season', 'Round'])['Tackles'].transform(minmax_scale)
+    def _calculate_rolling_features(self, run):
 
-        return data
+        """ Last 5 matches average / sum / std, last 5 matches form and season average of the columns of
+        list_columns, computed per (Season, Team) in one pass by the RollingFeatureEngine (only the statistics
+        and the columns the run asks for).
+        """
 
+        names, selection = {}, {}
+        statistics = [self.rolling_engine.feature(name) for name in run.wanted(self.rolling_engine.columns(self.list_columns))]
+        columns = [col for col in self.list_columns if any(column == col for _, column in statistics)]
+        for name, (statistic, column) in zip(run.wanted(self.rolling_engine.columns(self.list_columns)), statistics):
+            key = 'Form' if column is None else statistic
+            names.setdefault(key, []).append(name)
+            selection.setdefault(key, []).append(['Win', 'Loose'].index(statistic) if column is None else columns.index(column))
+
+        values = run.values(columns)
+        if 'Form' in selection:
+            result = run.take('Result')
+            values = np.column_stack([values, result == 'W', result == 'L'])
+        order = run.order
+        block = self.rolling_engine.scatter(values, order.codes, order.positions)
+
+        results = self.rolling_engine.select(block[:, :, :len(columns)], block[:, :, len(columns):], selection)
+        for key, statistic in results.items():
+            run.write(names[key], statistic[order.codes, order.positions], self.float_dtype)
+
+    @traced()
     def _keep_columns_for_model(self, data):
 
         columns = self.foundations_columns
@@ -260,28 +517,58 @@ class ProcessingFootball:
 
         return data
 
+    @traced()
     def _merge_2_rows_in_one(self, data):
 
-        data['MatchID'] = data['DateTime'].astype(str) + '-' + data[['Team', 'Opponent']].apply(sorted, axis=1).str.join('-vs-')
+        """ One row per match: the columns of the home row suffixed _Home next to the ones of the away row
+        suffixed _Away. The rows are paired on their MatchIndex key (day, home team id, away team id). A row left
+        without its opposite row is kept with the columns of the missing side empty; these rows are also kept in
+        self.unpaired_rows and reported by a warning.
+        """
+
+        # same id from both sides of the match: teams in alphabetical order
+        team, opponent = data['Team'].astype(str), data['Opponent'].astype(str)
+        team_first = team <= opponent
+        data['MatchID'] = (data['DateTime'].astype(str) + '-' + team.where(team_first, opponent) + '-vs-'
+                           + opponent.where(team_first, team))
 
         fixed_columns = ['DateTime', 'Comp', 'Round', 'Day', 'MatchID', 'Season', 'Attendance', 'Referee', 'Match Report', 'Notes', "Minus 1.5 Goals", "Minus 2.5 Goals", "Minus 3.5 Goals"]
         
         moving_variables = [col for col in data.columns if col not in fixed_columns]
 
-        data_home = data[data['Venue'] == 'Home'].copy()
-        data_away = data[data['Venue'] == 'Away'].copy()
+        home_rows, away_rows, unpaired = MatchIndex.from_data(data).pair(data)
+        self.unpaired_rows = data.iloc[unpaired]
+        if len(unpaired):
+            examples = ", ".join(f"{row.DateTime:%Y-%m-%d} {row.Team} - {row.Opponent}"
+                                 for row in self.unpaired_rows.head(3).itertuples())
+            # (stacklevel 3: the caller, past the wrapper of @traced)
+            warnings.warn(f"{len(unpaired)} rows without their opposite row, merged with the other side empty "
+                          f"(e.g. {examples})", stacklevel=3)
+
+        # positions of the home and away side of every merged row, -1 for the missing side of an unpaired row
+        lone_away = unpaired[(data['Venue'].iloc[unpaired] == 'Away').to_numpy()]
+        lone_home = np.setdiff1d(unpaired, lone_away)
+        home_side = np.concatenate([home_rows, lone_home, np.full(len(lone_away), -1)])
+        away_side = np.concatenate([away_rows, np.full(len(lone_home), -1), lone_away])
 
         rename_dict_home = {col: f"{col}_Home" for col in moving_variables}
         rename_dict_away = {col: f"{col}_Away" for col in moving_variables}
-        data_home.rename(columns=rename_dict_home, inplace=True)
-        data_away.rename(columns=rename_dict_away, inplace=True)
-
-        data = pd.merge(data_home, data_away, on=fixed_columns, how='inner')
-
+        positional = data.reset_index(drop=True)
+        data_home = positional.reindex(home_side).rename(columns=rename_dict_home).reset_index(drop=True)
+        data_away = positional[moving_variables].reindex(away_side).rename(columns=rename_dict_away).reset_index(drop=True)
+        if len(lone_away):
+            # (the match columns of an away row without its home row)
+            present = np.where(home_side >= 0, home_side, away_side)
+            for col in [col for col in fixed_columns if col in positional.columns]:
+                data_home[col] = positional[col].iloc[present].reset_index(drop=True)
+
+        data = pd.concat([data_home, data_away], axis=1)
+
+        # (a side can be missing: the result is read from the other one)
         conditions = [
-            data['Result_Home'] == 'W',
-            data['Result_Away'] == 'W',
-            data['Result_Away'] == 'D'
+            (data['Result_Home'] == 'W') | (data['Result_Away'] == 'L'),
+            (data['Result_Away'] == 'W') | (data['Result_Home'] == 'L'),
+            (data['Result_Away'] == 'D') | (data['Result_Home'] == 'D')
         ]
         choices = ['W_Home', 'W_Away', 'D']
         data['Result'] = np.select(conditions, choices, default=np.nan)
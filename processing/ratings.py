@@ -0,0 +1,341 @@
+""" Team strength ratings (Elo and Glicko) over the matches of all the leagues, streamed in kickoff order.
+
+Unlike Ranking and the cumulated points, a rating carries over from one season to the next, so the pre-match
+ratings are features of the strength of both teams at any time of the season:
+
+    engine = RatingEngine.from_leagues([PremierLeague(), Ligue1()])
+    data = add_rating_features(PremierLeague().data.get_data_for_prediction(), engine.history)
+
+Build or update the stored ratings and print the strongest teams, from the repository root:
+    python -m processing.ratings
+"""
+
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+
+STATE_PATH = os.path.join('storage', 'state', 'ratings.pkl')
+
+MATCH_COLUMNS = ['Date', 'Time', 'Team', 'Opponent', 'Venue', 'GF', 'GA']
+
+RATING_COLUMNS = ['Elo_Home', 'Elo_Away', 'Elo_Expected_Home', 'Glicko_Home', 'Glicko_RD_Home', 'Glicko_Away',
+                  'Glicko_RD_Away', 'Glicko_Expected_Home']
+
+GLICKO_Q = math.log(10) / 400
+
+
+def matches_from_rows(data, league_name) -> pd.DataFrame:
+
+    """ One row per match (Kickoff, League, Season, Home, Away, GF_Home, GF_Away) from the raw rows of a league
+    (one per team and match, both rows of a match give the same match). An Opponent name differing from the
+    Team name of the same club (e.g. "Paris Saint-Germain" for "Paris Saint Germain") is resolved to the team
+    whose row of that day has the other team as opponent.
+    """
+
+    # goals stored as numbers, or as text ("2.0", "1 (4)" after penalties) in the csv storage
+    goals = {col: pd.to_numeric(data[col].astype(str).str.split(' ').str[0], errors='coerce') for col in ['GF', 'GA']}
+    data = pd.DataFrame({'Date': data['Date'].astype(str), 'Time': data['Time'].astype(object).fillna('00:00').astype(str),
+                         'Team': data['Team'].astype(str), 'Opponent': data['Opponent'].astype(str),
+                         'Home': data['Venue'].astype(str) == 'Home', **goals})
+    data = data[data['GF'].notna() & data['GA'].notna() & data['Team'].ne('nan') & data['Opponent'].ne('nan')]
+
+    teams = set(data['Team'])
+    unknown = data[~data['Opponent'].isin(teams)]
+    if not unknown.empty:
+        candidates = unknown.merge(data[['Date', 'Team', 'Opponent']], left_on=['Date', 'Team'],
+                                   right_on=['Date', 'Opponent'], suffixes=('', '_Candidate'))
+        resolved = candidates.groupby('Opponent')['Team_Candidate'].agg(lambda names: names.mode().iat[0])
+        data['Opponent'] = data['Opponent'].map(resolved).fillna(data['Opponent'])
+
+    home, away = data['Team'].where(data['Home'], data['Opponent']), data['Opponent'].where(data['Home'], data['Team'])
+    matches = pd.DataFrame({
+        'Kickoff': pd.to_datetime(data['Date'] + ' ' + data['Time'], errors='coerce'),
+        'League': league_name,
+        'Home': home, 'Away': away,
+        'GF_Home': data['GF'].where(data['Home'], data['GA']), 'GF_Away': data['GA'].where(data['Home'], data['GF']),
+    })
+    matches = matches.dropna(subset=['Kickoff']).drop_duplicates(subset=['Kickoff', 'Home', 'Away'])
+    matches['Season'] = season_of(matches['Kickoff'])
+    return matches.reset_index(drop=True)
+
+
+def season_of(kickoff) -> pd.Series:
+
+    """ Season of the matches ("2023-2024"): a season starts in July.
+    """
+
+    first_year = kickoff.dt.year - (kickoff.dt.month < 7)
+    return first_year.astype(str) + '-' + (first_year + 1).astype(str)
+
+
+class RatingEngine:
+
+    """ Elo and Glicko ratings of every team, in arrays indexed by a team id (grown by doubling), updated match
+    day by match day: the matches of a day are independent (a team plays once a day), a day is one vectorized
+    update, so adding a match day costs O(its matches) and never replays the history.
+
+    Elo: expected score 1 / (1 + 10^(-(home - away + `home_advantage`) / 400)), step `k` times the goal
+    difference multiplier of the World Football Elo. Glicko (one match per rating period): the deviation grows
+    by `glicko_c` per day without match, up to its initial `glicko_rd`.
+
+    A team starts at `initial` plus the offset of its league in `league_offsets` (the ratings of two leagues are
+    only comparable through these offsets: their teams never play each other here), a team first seen after the
+    first season of its league (promoted) `promoted_gap` below. At its first match of a season, a rating is
+    regressed toward the start of its league by `season_regression`.
+
+    history holds the pre-match ratings of every processed match (RATING_COLUMNS, the features).
+    """
+
+    def __init__(self, k=20.0, home_advantage=60.0, initial=1500.0, league_offsets=None, promoted_gap=50.0,
+                 season_regression=0.2, glicko_rd=350.0, glicko_min_rd=30.0, glicko_c=3.0):
+        self.k = k
+        self.home_advantage = home_advantage
+        self.initial = initial
+        self.league_offsets = league_offsets or {}
+        self.promoted_gap = promoted_gap
+        self.season_regression = season_regression
+        self.glicko_rd = glicko_rd
+        self.glicko_min_rd = glicko_min_rd
+        self.glicko_c = glicko_c
+
+        self.team_ids = {}
+        self.leagues = {}        # league -> its first season (its teams first seen later are promoted)
+        self.elo = np.zeros(0)
+        self.glicko = np.zeros(0)
+        self.rd = np.zeros(0)
+        self.last_kickoff = np.zeros(0, dtype='datetime64[ns]')
+        self.season = np.zeros(0, dtype=object)
+        self.league = np.zeros(0, dtype=object)
+        self.matches = np.zeros(0, dtype=np.int32)
+        self.history = pd.DataFrame()
+
+    @classmethod
+    def from_leagues(cls, leagues, **options):
+        engine = cls(**options)
+        engine.update_from_leagues(leagues)
+        return engine
+
+    @property
+    def teams(self) -> int:
+        return len(self.team_ids)
+
+    def anchor(self, league) -> float:
+        return self.initial + self.league_offsets.get(league, 0.0)
+
+    def update_from_leagues(self, leagues) -> pd.DataFrame:
+
+        """ Process the matches of the raw data of `leagues` not processed yet: only the rows from the day of
+        the oldest last match of the teams of the current season of each league are read. Returns their
+        pre-match ratings.
+        """
+
+        frames = []
+        for league in leagues:
+            in_league = (self.league[:self.teams] == league.name) & (self.matches[:self.teams] > 0)
+            start = None
+            if in_league.any():
+                current = in_league & (self.season[:self.teams] == max(self.season[:self.teams][in_league]))
+                start = pd.Timestamp(self.last_kickoff[:self.teams][current].min()).normalize()
+            data = league.data.get_raw_data(columns=MATCH_COLUMNS, start=start)
+            frames.append(matches_from_rows(data, league.name))
+        return self.update(pd.concat(frames, ignore_index=True))
+
+    def update(self, matches) -> pd.DataFrame:
+
+        """ Process the matches (rows of matches_from_rows) played after the last match of both their teams, in
+        kickoff order, match day by match day. Matches already processed for both teams are skipped. A match
+        older than the last one of only one of its teams cannot be inserted without a replay: ValueError.
+        Returns the pre-match ratings of the processed matches, also appended to `history`.
+        """
+
+        matches = matches.sort_values(by='Kickoff', kind='stable').reset_index(drop=True)
+        home = self._ids(matches['Home'], matches['League'], matches['Season'])
+        away = self._ids(matches['Away'], matches['League'], matches['Season'])
+        kickoff = matches['Kickoff'].to_numpy(dtype='datetime64[ns]')
+
+        last_home, last_away = self.last_kickoff[home], self.last_kickoff[away]
+        new_home = np.isnat(last_home) | (kickoff > last_home)
+        new_away = np.isnat(last_away) | (kickoff > last_away)
+        if (new_home != new_away).any():
+            late = matches[new_home != new_away].iloc[0]
+            raise ValueError(f"{late['Home']} - {late['Away']} ({late['Kickoff']}) is older than the last rated "
+                             f"match of one of its teams, the ratings have to be rebuilt")
+        new = new_home & new_away
+        matches, home, away, kickoff = matches[new].reset_index(drop=True), home[new], away[new], kickoff[new]
+        if matches.empty:
+            return matches.assign(**{col: [] for col in RATING_COLUMNS})
+
+        goals = matches[['GF_Home', 'GF_Away']].to_numpy(dtype=float)
+        seasons = matches['Season'].to_numpy(dtype=object)
+        ratings = np.empty((len(matches), len(RATING_COLUMNS)))
+
+        days = kickoff.astype('datetime64[D]')
+        boundaries = np.flatnonzero(np.diff(days.astype(np.int64))) + 1
+        for rows in np.split(np.arange(len(matches)), boundaries):
+            # a team twice in a day (data error) is processed in order, one sub-batch per repetition
+            teams = np.concatenate([home[rows], away[rows]])
+            repetition = pd.Series(teams).groupby(teams).cumcount().to_numpy()
+            repetition = np.maximum(repetition[:len(rows)], repetition[len(rows):])
+            for level in range(repetition.max() + 1):
+                batch = rows[repetition == level]
+                ratings[batch] = self._play(home[batch], away[batch], goals[batch], kickoff[batch], seasons[batch])
+
+        history = matches.assign(**dict(zip(RATING_COLUMNS, ratings.T)))
+        self.history = pd.concat([self.history, history], ignore_index=True)
+        return history
+
+    def pre_match(self, fixtures) -> pd.DataFrame:
+
+        """ Ratings before the fixtures (Kickoff, League, Home, Away), from the current ratings without updating
+        them (deviations grown up to the kickoff): the features of the upcoming matches.
+        """
+
+        fixtures = fixtures.reset_index(drop=True)
+        seasons = season_of(fixtures['Kickoff'])
+        home = self._ids(fixtures['Home'], fixtures['League'], seasons)
+        away = self._ids(fixtures['Away'], fixtures['League'], seasons)
+        kickoff = fixtures['Kickoff'].to_numpy(dtype='datetime64[ns]')
+        return fixtures.assign(**dict(zip(RATING_COLUMNS, self._ratings(home, away, kickoff).T)))
+
+    def table(self, league=None) -> pd.DataFrame:
+        names = np.array(list(self.team_ids), dtype=object)
+        table = pd.DataFrame({'Team': names, 'League': self.league[:self.teams], 'Elo': self.elo[:self.teams],
+                              'Glicko': self.glicko[:self.teams], 'Glicko_RD': self.rd[:self.teams],
+                              'Matches': self.matches[:self.teams],
+                              'Last match': self.last_kickoff[:self.teams]})
+        if league is not None:
+            table = table[table['League'] == league]
+        return table.sort_values(by='Elo', ascending=False).reset_index(drop=True)
+
+    def save(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.to_pickle(self, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path=STATE_PATH):
+        return pd.read_pickle(path)
+
+    def _ids(self, names, leagues, seasons) -> np.ndarray:
+
+        """ Ids of the teams `names` (of `leagues`, in `seasons`), new teams added at the start of their league.
+        """
+
+        ids = np.empty(len(names), dtype=np.int64)
+        for position, (name, league, season) in enumerate(zip(names, leagues, seasons)):
+            team_id = self.team_ids.get(name)
+            if team_id is None:
+                team_id = self._add_team(name, league, season)
+            ids[position] = team_id
+        return ids
+
+    def _add_team(self, name, league, season) -> int:
+        team_id = self.teams
+        if team_id == len(self.elo):
+            capacity = max(64, 2 * team_id)
+            self.elo = np.resize(self.elo, capacity)
+            self.glicko = np.resize(self.glicko, capacity)
+            self.rd = np.resize(self.rd, capacity)
+            self.last_kickoff = np.resize(self.last_kickoff, capacity)
+            self.season = np.resize(self.season, capacity)
+            self.league = np.resize(self.league, capacity)
+            self.matches = np.resize(self.matches, capacity)
+
+        promoted = self.leagues.setdefault(league, season) != season
+        self.team_ids[name] = team_id
+        self.elo[team_id] = self.glicko[team_id] = self.anchor(league) - (self.promoted_gap if promoted else 0.0)
+        self.rd[team_id] = self.glicko_rd
+        self.last_kickoff[team_id] = np.datetime64('NaT')
+        self.season[team_id] = None
+        self.league[team_id] = league
+        self.matches[team_id] = 0
+        return team_id
+
+    def _deviations(self, teams, kickoff) -> np.ndarray:
+        days = (kickoff - self.last_kickoff[teams]) / np.timedelta64(1, 'D')
+        days = np.where(np.isnan(days), 0.0, days)
+        return np.minimum(np.sqrt(self.rd[teams] ** 2 + self.glicko_c ** 2 * days), self.glicko_rd)
+
+    def _ratings(self, home, away, kickoff) -> np.ndarray:
+
+        """ RATING_COLUMNS of the matches from the current arrays (no update).
+        """
+
+        rd_home, rd_away = self._deviations(home, kickoff), self._deviations(away, kickoff)
+        elo_expected = 1 / (1 + 10 ** (-(self.elo[home] - self.elo[away] + self.home_advantage) / 400))
+        g = 1 / np.sqrt(1 + 3 * GLICKO_Q ** 2 * (rd_home ** 2 + rd_away ** 2) / math.pi ** 2)
+        glicko_expected = 1 / (1 + 10 ** (-g * (self.glicko[home] - self.glicko[away] + self.home_advantage) / 400))
+        return np.column_stack([self.elo[home], self.elo[away], elo_expected, self.glicko[home], rd_home,
+                                self.glicko[away], rd_away, glicko_expected])
+
+    def _new_season(self, teams, seasons):
+
+        """ Regression toward the start of their league of the teams playing their first match of a season.
+        """
+
+        for team, season in zip(teams, seasons):
+            if self.season[team] is not None and self.season[team] != season:
+                anchor = self.anchor(self.league[team])
+                self.elo[team] = anchor + (1 - self.season_regression) * (self.elo[team] - anchor)
+                self.glicko[team] = anchor + (1 - self.season_regression) * (self.glicko[team] - anchor)
+            self.season[team] = season
+
+    def _play(self, home, away, goals, kickoff, seasons) -> np.ndarray:
+
+        """ Update the ratings with matches between distinct teams. Returns their pre-match ratings.
+        """
+
+        self._new_season(home, seasons)
+        self._new_season(away, seasons)
+        before = self._ratings(home, away, kickoff)
+
+        score = np.select([goals[:, 0] > goals[:, 1], goals[:, 0] < goals[:, 1]], [1.0, 0.0], 0.5)
+        difference = np.abs(goals[:, 0] - goals[:, 1])
+        multiplier = np.select([difference <= 1, difference == 2], [1.0, 1.5], (11 + difference) / 8)
+        elo_step = self.k * multiplier * (score - before[:, 2])
+        self.elo[home] += elo_step
+        self.elo[away] -= elo_step
+
+        for team, opponent, team_score, rd, opponent_rd, sign in [
+                (home, away, score, before[:, 4], before[:, 6], 1.0),
+                (away, home, 1 - score, before[:, 6], before[:, 4], -1.0)]:
+            g = 1 / np.sqrt(1 + 3 * GLICKO_Q ** 2 * opponent_rd ** 2 / math.pi ** 2)
+            expected = 1 / (1 + 10 ** (-g * (self.glicko[team] - self.glicko[opponent] + sign * self.home_advantage) / 400))
+            d2 = 1 / (GLICKO_Q ** 2 * g ** 2 * expected * (1 - expected))
+            precision = 1 / rd ** 2 + 1 / d2
+            self.glicko[team] = self.glicko[team] + GLICKO_Q / precision * g * (team_score - expected)
+            self.rd[team] = np.maximum(np.sqrt(1 / precision), self.glicko_min_rd)
+
+        self.last_kickoff[home] = self.last_kickoff[away] = kickoff
+        self.matches[home] += 1
+        self.matches[away] += 1
+        return before
+
+
+def add_rating_features(data, history) -> pd.DataFrame:
+
+    """ `data` (one row per match with DateTime, Team Home, Team Away: get_data_for_prediction) with the pre-match
+    ratings of its matches from RatingEngine.history (or pre_match for future fixtures).
+    """
+
+    ratings = history[['Kickoff', 'Home', 'Away'] + RATING_COLUMNS].rename(
+        columns={'Kickoff': 'DateTime', 'Home': 'Team Home', 'Away': 'Team Away'})
+    keys = {'DateTime': data['DateTime'].astype('datetime64[ns]'), 'Team Home': data['Team Home'].astype(str),
+            'Team Away': data['Team Away'].astype(str)}
+    merged = pd.DataFrame(keys).merge(ratings.drop_duplicates(subset=['DateTime', 'Team Home', 'Team Away']),
+                                      how='left', on=['DateTime', 'Team Home', 'Team Away'])
+    return pd.concat([data, merged[RATING_COLUMNS].set_axis(data.index)], axis=1)
+
+
+if __name__ == '__main__':
+    from leagues import PremierLeague, Ligue1, LaLiga, Bundesliga, Eredivisie, SerieA
+
+    leagues = [PremierLeague(), Ligue1(), LaLiga(), Bundesliga(), Eredivisie(), SerieA()]
+    engine = RatingEngine.load() if os.path.exists(STATE_PATH) else RatingEngine()
+    new = engine.update_from_leagues(leagues)
+    engine.save()
+    print(f"{len(new)} new matches rated, {len(engine.history)} in total")
+    print(engine.table().head(20).to_string())
@@ -0,0 +1,105 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class RollingFeatureEngine:
+
+    """ Computes shifted rolling and expanding statistics of many columns in a single grouped pass.
+
+    The rows of every (Season, Team) group are scattered into one dense (groups, matches, columns)
+    NumPy block, so each statistic is a single array operation over all groups and all columns
+    instead of one groupby transform (and one lambda call per group) for every column.
+    """
+
+    def __init__(self, window=5):
+        self.window = window
+
+    def scatter(self, values, codes, positions):
+
+        """ (groups, max_matches, columns) block of the (rows, columns) `values`, the row i at (codes[i],
+        positions[i]) (rows with the group -1 are left out).
+        """
+
+        valid = codes >= 0
+        n_groups = codes.max(initial=-1) + 1
+        block = np.full((n_groups, max(positions.max(initial=0) + 1, 1), values.shape[1]), np.nan)
+        block[codes[valid], positions[valid]] = values[valid]
+        return block
+
+    def _shifted_windows(self, block):
+        # Window ending at match j covers matches j-window..j-1 (the current match is excluded).
+        padding = np.full((block.shape[0], self.window, block.shape[2]), np.nan)
+        shifted = np.concatenate([padding, block[:, :-1]], axis=1)
+        return sliding_window_view(shifted, self.window, axis=1)
+
+    def rolling_mean(self, windows):
+        return windows.mean(axis=-1)
+
+    def rolling_sum(self, windows, min_periods=None):
+        if min_periods is None or min_periods >= self.window:
+            return windows.sum(axis=-1)
+        counts = (~np.isnan(windows)).sum(axis=-1)
+        return np.where(counts >= min_periods, np.nansum(windows, axis=-1), np.nan)
+
+    def rolling_std(self, windows):
+        return windows.std(axis=-1, ddof=1)
+
+    def expanding_mean(self, block, sums=None, counts=None):
+
+        """ Expanding mean over the matches of every group, following the (groups, columns) `sums` and `counts`
+        of the values before the block if given (the season so far of a processed state).
+        """
+
+        totals = np.nancumsum(block, axis=1) + (0 if sums is None else sums[:, None, :])
+        seen = np.cumsum(~np.isnan(block), axis=1) + (0 if counts is None else counts[:, None, :])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(seen > 0, totals / seen, np.nan)
+
+    def columns(self, columns) -> list:
+
+        """ Names of the statistics of `columns`: Average, Sum and Std of the last `window` matches, the Win / Loose
+        counts of their results and the season average.
+        """
+
+        return ([f'{col}_5_Last_Matches_{stat}' for stat in ['Average', 'Sum', 'Std'] for col in columns]
+                + ['5_Last_Matches_Win', '5_Last_Matches_Loose'] + [f'{col}_Scaled_Season_Average' for col in columns])
+
+    def feature(self, name):
+
+        """ (statistic, column) of a name of columns(): Average / Sum / Std of the last matches, Win / Loose (the
+        column is None) or Scaled_Season_Average.
+        """
+
+        if name in ('5_Last_Matches_Win', '5_Last_Matches_Loose'):
+            return name.rsplit('_', 1)[1], None
+        if name.endswith('_Scaled_Season_Average'):
+            return 'Scaled_Season_Average', name[:-len('_Scaled_Season_Average')]
+        column, statistic = name.rsplit('_5_Last_Matches_', 1)
+        return statistic, column
+
+    def select(self, stats_block, form_block, selection) -> dict:
+
+        """ Only the statistics of `selection`, {statistic: indices of the columns of `stats_block`} (Win and
+        Loose: 0 / 1 of the Win / Loose indicators of `form_block`, shared by 'Form'), as {statistic: (groups,
+        max_matches, len(indices)) result}. The windows are built for the columns used by a rolling statistic only.
+        """
+
+        results = {}
+        rolling = {'Average': self.rolling_mean, 'Sum': self.rolling_sum, 'Std': self.rolling_std}
+        used = sorted({j for statistic in rolling if statistic in selection for j in selection[statistic]})
+        if used:
+            windows = self._shifted_windows(stats_block if used == list(range(stats_block.shape[2])) else stats_block[:, :, used])
+            place = {j: k for k, j in enumerate(used)}
+            for statistic, function in rolling.items():
+                if statistic in selection:
+                    indices = [place[j] for j in selection[statistic]]
+                    results[statistic] = function(windows if indices == list(range(len(used))) else windows[:, :, indices])
+
+        if 'Form' in selection:
+            form = np.nan_to_num(self.rolling_sum(self._shifted_windows(form_block), min_periods=1), nan=0.0)
+            results['Form'] = form[:, :, selection['Form']]
+
+        if 'Scaled_Season_Average' in selection:
+            results['Scaled_Season_Average'] = self.expanding_mean(stats_block[:, :, selection['Scaled_Season_Average']])
+
+        return results
@@ -0,0 +1,345 @@
+""" The feature stages of ProcessingFootball as a declared graph, run over one canonical row order.
+
+The rows are sorted once by (Season, Team, DateTime): every stage reads its inputs in that order, computes per
+(Season, Team) group with the group boundaries of the CanonicalOrder and writes its columns into one
+preallocated float block. The block is attached to the frame once, at the end of the run, with the dtypes the
+stages declared. Every run reports its wall time and the bytes it copied per stage:
+
+    data = processer.feature_graph.run(data, ["lags", "rolling"])
+    print(processer.feature_graph.last_run.report())
+
+Every column of a stage is registered with the columns it is computed from, so a run can also be asked for
+named feature columns only: the stages then compute these columns and their dependencies, nothing else.
+
+    data = processer.feature_graph.run(data, columns=["Total Shots_5_Last_Matches_Std", "Ranking_Lag"])
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from profiling.trace import tracer
+
+
+class CanonicalOrder:
+
+    """ Rows of a frame sorted by (Season, Team, DateTime), Round then frame position breaking the ties (a row
+    without kickoff goes last in its group). `order` is the frame position of every canonical row, `codes` its
+    (Season, Team) group, `positions` its place in the group and `starts` / `sizes` the boundaries of the groups.
+    """
+
+    def __init__(self, data, group_keys=('Season', 'Team'), time_key='DateTime'):
+
+        kickoff = data[time_key].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        kickoff = np.where(kickoff == np.iinfo(np.int64).min, np.iinfo(np.int64).max, kickoff)
+        keys = [pd.factorize(data[key], sort=True)[0] for key in group_keys]
+        rounds = data['Round'].to_numpy(dtype=np.float64, na_value=np.inf) if 'Round' in data.columns else np.zeros(len(data))
+        self.order = np.lexsort([rounds, kickoff] + keys[::-1])
+
+        group = np.zeros(len(data), dtype=np.int64)
+        for key in keys:
+            group = group * (key.max(initial=0) + 2) + key + 1
+        group = group[self.order]
+
+        self.starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]]) if len(group) else np.zeros(0, dtype=np.int64)
+        self.sizes = np.diff(np.r_[self.starts, len(group)])
+        self.codes = np.repeat(np.arange(len(self.starts)), self.sizes)
+        self.positions = np.arange(len(group)) - self.starts[self.codes]
+
+    def __len__(self):
+        return len(self.order)
+
+    def cumsum(self, values, within=None) -> np.ndarray:
+
+        """ Cumulated sum of (canonical rows, columns) `values` in every group, in the order of the canonical
+        `within` key inside the groups if given (e.g. the rounds). As a pandas grouped cumsum, a missing value
+        stays missing and is skipped by the next rows.
+        """
+
+        if within is not None:
+            permutation = np.lexsort([within, self.codes])
+            result = np.empty_like(values, dtype=np.float64)
+            result[permutation] = self.cumsum(values[permutation])
+            return result
+
+        missing = np.isnan(values)
+        total = np.where(missing, 0, values)
+        np.cumsum(total, axis=0, out=total)
+        before = np.vstack([np.zeros((1, values.shape[1])), total[self.starts[1:] - 1]])
+        total -= np.repeat(before, self.sizes, axis=0)
+        total[missing] = np.nan
+        return total
+
+
+class Stage:
+
+    """ A feature stage: `function(run)` writes the columns of `columns` the run asks for (run.wanted) into the
+    block of the FeatureRun `run`, after the stages named in `requires`. `dependencies(column)` gives the columns
+    of these stages a column is computed from (by default all of them), the ones already in the frame are not
+    computed again.
+    """
+
+    def __init__(self, name, function, columns, requires=(), dependencies=None):
+        self.name = name
+        self.function = function
+        self.columns = list(columns)
+        self.requires = list(requires)
+        self.dependencies = dependencies
+
+
+class FeatureRun:
+
+    """ One run of the stages over a frame: the frame, its CanonicalOrder, the (columns, rows) float block the
+    stages write into (canonical row order) and per stage its wall time, the bytes copied from the frame and the
+    bytes written into the block. The float columns of the assembled frame are views of the block.
+    `context` holds what a stage leaves to the next ones of the run (the standings of the ranking stage).
+    """
+
+    def __init__(self, data, columns, dtype=np.float64):
+        self.data = data
+        self.order = CanonicalOrder(data)
+        self.columns = {name: j for j, name in enumerate(columns)}
+        # (columns, rows): the layout of a pandas block, a slice of it is a frame without copy
+        self.block = np.full((len(columns), len(data)), np.nan, dtype=dtype)
+        self.dtypes = {}
+        self.context = {}
+        self.stats = {}
+        self._stage = "canonical order"
+        self._count(copied=self.order.order.nbytes)
+
+    def values(self, columns) -> np.ndarray:
+
+        """ `columns` of the frame as float64, in canonical order.
+        """
+
+        # (column by column: the frame of nullable ints would go through objects)
+        values = np.empty((len(self.order), len(columns)))
+        for j, column in enumerate(columns):
+            values[:, j] = self.data[column].to_numpy(dtype=np.float64, na_value=np.nan)[self.order.order]
+        self._count(copied=2 * values.nbytes)
+        return values
+
+    def wanted(self, columns) -> list:
+
+        """ The columns of `columns` this run computes.
+        """
+
+        return [column for column in columns if column in self.columns]
+
+    def take(self, column) -> np.ndarray:
+        values = self.data[column].to_numpy()[self.order.order]
+        self._count(copied=values.nbytes)
+        return values
+
+    def dtype(self, column):
+        return self.dtypes[column] if column in self.dtypes else self.data[column].dtype
+
+    def write(self, columns, values, dtype=np.float64):
+
+        """ Store (canonical rows, len(columns)) `values` in the block, `dtype` is the dtype of the columns in
+        the assembled frame (or a list, one per column).
+        """
+
+        if not columns:
+            return
+        values = np.asarray(values, dtype=np.float64).reshape(len(self.order), len(columns))
+        indices = [self.columns[column] for column in columns]
+        if indices == list(range(indices[0], indices[0] + len(indices))):
+            self.block[indices[0]:indices[0] + len(indices)] = values.T
+        else:
+            self.block[indices] = values.T
+        dtypes = dtype if isinstance(dtype, list) else [dtype] * len(columns)
+        self.dtypes.update(zip(columns, dtypes))
+        self._count(written=len(columns) * len(self.order) * self.block.itemsize)
+
+    def assemble(self) -> pd.DataFrame:
+
+        """ The frame in canonical order (index 0..n-1) with the columns of the block: the ones already in the
+        frame are replaced in place, the others appended in the order of the stages. As the sorts of the former
+        stages, the frame of the run is put in canonical order in place (its former rows are released).
+        """
+
+        self._stage = "assemble"
+        frame = self.data
+        positions = np.empty(len(frame), dtype=np.int64)
+        positions[self.order.order] = np.arange(len(frame))
+        frame.index = positions
+        frame.sort_index(inplace=True)
+        frame.index = pd.RangeIndex(len(frame))
+        self._count(copied=int(frame.memory_usage(index=False).sum()))
+
+        # runs of consecutive new columns of one dtype: one 2D array per numpy run (a view of the block when it
+        # has the dtype of the block), joined without another copy
+        frame = frame.copy(deep=False)
+        parts, run, run_dtype = [frame], [], None
+        for column in list(self.columns) + [None]:
+            dtype = self._assembled_dtype(column) if column is not None else None
+            if column is None or column in frame.columns or dtype != run_dtype:
+                if run:
+                    parts.append(self._part(run, run_dtype, frame.index))
+                run, run_dtype = [], dtype
+            if column is not None and column in frame.columns:
+                frame[column] = self._column(column, dtype)
+            elif column is not None:
+                run.append(column)
+
+        if len(parts) == 1:
+            return frame
+        # (without copy on write, concat consolidates the blocks of one dtype: a copy of the frame and the views)
+        with pd.option_context("mode.copy_on_write", True):
+            return pd.concat(parts, axis=1)
+
+    def _assembled_dtype(self, column):
+        dtype = self.dtypes.get(column, np.float64)
+        # (missing values in an int column: float, as pandas)
+        return np.dtype(np.float64) if dtype == np.int64 and np.isnan(self.block[self.columns[column]]).any() else dtype
+
+    def _column(self, column, dtype):
+        values = self.block[self.columns[column]]
+        return pd.array(values, dtype=dtype) if pd.api.types.is_extension_array_dtype(dtype) else values.astype(dtype)
+
+    def _part(self, columns, dtype, index):
+        if pd.api.types.is_extension_array_dtype(dtype):
+            arrays = {column: self._column(column, dtype) for column in columns}
+            self._count(copied=sum(array.nbytes for array in arrays.values()))
+            return pd.DataFrame(arrays, index=index)
+
+        start = self.columns[columns[0]]
+        values = self.block[start:start + len(columns)].T
+        if values.dtype != dtype:
+            values = values.astype(dtype)
+            self._count(copied=values.nbytes)
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    def report(self) -> pd.DataFrame:
+
+        """ Seconds, MB copied and MB written into the block per stage, with their total.
+        """
+
+        report = pd.DataFrame.from_dict(self.stats, orient='index', columns=['seconds', 'copied', 'written'])
+        report.loc['total'] = report.sum()
+        report[['copied', 'written']] /= 1024 ** 2
+        return report.rename(columns={'copied': 'MB copied', 'written': 'MB written'}).round(4)
+
+    def _count(self, seconds=0.0, copied=0, written=0):
+        stats = self.stats.setdefault(self._stage, [0.0, 0, 0])
+        stats[0] += seconds
+        stats[1] += copied
+        stats[2] += written
+
+
+class FeatureGraph:
+
+    """ The stages of a processing, declared with their dependencies. run() computes the requested stages or
+    feature columns and what they depend on, in dependency order (declaration order between independent
+    stages), in a block of the float `dtype`. `registry` is the stage of every feature column.
+    """
+
+    def __init__(self, stages, dtype=np.float64):
+        self.stages = {stage.name: stage for stage in stages}
+        self.dtype = dtype
+        self.registry = {}
+        for stage in stages:
+            unknown = [name for name in stage.requires if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage {stage.name} requires unknown stages {unknown}")
+            for column in stage.columns:
+                if column in self.registry:
+                    raise ValueError(f"Column {column} of stage {stage.name} already computed by {self.registry[column].name}")
+                self.registry[column] = stage
+        self._check_acyclic()
+        self.last_run = None
+
+    def dependencies(self, column) -> list:
+
+        """ Feature columns `column` is computed from.
+        """
+
+        stage = self.registry[column]
+        if stage.dependencies is not None:
+            return list(stage.dependencies(column))
+        return [dependency for name in stage.requires for dependency in self.stages[name].columns]
+
+    def plan(self, targets=(), data=None, columns=()) -> dict:
+
+        """ {stage name: columns to compute} of a run, in dependency order: the columns of the `targets` stages,
+        the feature `columns` and, recursively, the columns they depend on that are not in `data` already.
+        """
+
+        needed = set()
+
+        def visit(column, required):
+            if column in needed or (required and data is not None and column in data.columns):
+                return
+            if column not in self.registry:
+                raise ValueError(f"Unknown feature column {column}")
+            needed.add(column)
+            for dependency in self.dependencies(column):
+                visit(dependency, True)
+
+        for column in [column for name in targets for column in self.stages[name].columns] + list(columns):
+            visit(column, False)
+
+        plan = {stage.name: [column for column in stage.columns if column in needed] for stage in self._topological()}
+        return {name: stage_columns for name, stage_columns in plan.items() if stage_columns}
+
+    def run(self, data, targets=(), columns=()) -> pd.DataFrame:
+
+        """ `data` with the columns of the `targets` stages and the feature `columns` (plus the ones they depend
+        on), see plan().
+        """
+
+        plan = self.plan(targets, data, columns)
+        with tracer.span("FeatureGraph.run", rows_in=len(data), stages=list(plan), columns=sum(map(len, plan.values()))) as span:
+            start = time.perf_counter()
+            run = FeatureRun(data, [column for stage_columns in plan.values() for column in stage_columns], self.dtype)
+            run._count(seconds=time.perf_counter() - start)
+
+            for stage in [self.stages[name] for name in plan]:
+                run._stage = stage.name
+                start = time.perf_counter()
+                with tracer.span(f"stage.{stage.name}"):
+                    stage.function(run)
+                run._count(seconds=time.perf_counter() - start)
+
+            start = time.perf_counter()
+            result = run.assemble()
+            run._count(seconds=time.perf_counter() - start)
+            # (last_run keeps the report: the block lives as long as the columns of the result that view it)
+            run.data = run.block = None
+            span.set(rows_out=len(result), bytes_copied=int(sum(stats[1] for stats in run.stats.values())))
+
+        self.last_run = run
+        return result
+
+    def _topological(self) -> list:
+        ordered, done = [], set()
+
+        def visit(stage):
+            if stage.name in done:
+                return
+            for requirement in stage.requires:
+                visit(self.stages[requirement])
+            done.add(stage.name)
+            ordered.append(stage)
+
+        for stage in self.stages.values():
+            visit(stage)
+        return ordered
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Cycle in the stages: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for requirement in self.stages[name].requires:
+                visit(requirement, path + [name])
+            state[name] = "done"
+
+        for name in self.stages:
+            visit(name, [])
@@ -0,0 +1,269 @@
+""" League tables after every round of every season, in dense (season, round, team) arrays.
+
+The table of a round has every team of the season (a team whose match of the round is postponed keeps its
+points), ranked on the tie-breakers of its league, so the ranking of a team is its place in the full table and
+not among the rows of the round. Rankings and cumulated lags of the rows are then array lookups:
+
+    standings = StandingsEngine.from_data(data)
+    data['Ranking'] = standings.ranking(data['Season'], data['Round'], data['Team'])
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# cumulated per team, in this order in StandingsEngine.table
+COLUMNS = ['Points', 'GD', 'GF', 'GA']
+
+# sort keys of the table after the points, all descending (then the team name)
+DEFAULT_TIE_BREAKERS = ['Points', 'GD', 'GF']
+TIE_BREAKERS = {
+    'Premier League': ['Points', 'GD', 'GF'],
+    'Ligue 1': ['Points', 'GD', 'GF'],
+    'Bundesliga': ['Points', 'GD', 'GF'],
+    'Eredivisie': ['Points', 'GD', 'GF'],
+    'La Liga': ['Points', 'H2H_Points', 'H2H_GD', 'GD', 'GF'],
+    'Serie A': ['Points', 'H2H_Points', 'H2H_GD', 'GD', 'GF'],
+}
+
+
+class StandingsEngine:
+
+    """ Cumulated Points, GD, GF, GA and ranking of every team after every round of every season: `table`
+    (seasons, rounds + 1, teams, COLUMNS), `played` (matches played) and `rankings` (0 for the teams not in the
+    season). Round 0 is the table before the first match of the season, the seasons are sorted.
+
+    The rankings of all the tables come from a single lexsort on (season, round, tie-breakers, team name).
+    H2H_Points / H2H_GD are the points and goal difference of a team in its matches played so far against the
+    teams level on points with it.
+
+    update() adds new rows and ranks again only the seasons they belong to. Rows of a round before the last round
+    counted for their season would change the tables already looked up: a ValueError is raised, the engine has to
+    be built again.
+    """
+
+    def __init__(self, tie_breakers=None):
+        self.tie_breakers = list(tie_breakers or DEFAULT_TIE_BREAKERS)
+        self.head_to_head = any(key.startswith('H2H_') for key in self.tie_breakers)
+        self.seasons = []
+        self.teams = []
+        self._team_ids = {}
+
+        self.increments = np.zeros((0, 1, 0, len(COLUMNS)))
+        self.matches = np.zeros((0, 1, 0), dtype=np.int16)
+        # (season, round, team, opponent, points, goal difference) of the matches, for the head-to-head
+        self.h2h_matches = np.zeros((0, 6), dtype=np.int64)
+        self.present = np.zeros((0, 0), dtype=bool)
+
+        self.table = self.increments.copy()
+        self.played = self.matches.copy()
+        self.rankings = np.zeros((0, 1, 0), dtype=np.int16)
+
+    @classmethod
+    def from_data(cls, data, tie_breakers=None) -> 'StandingsEngine':
+
+        """ Standings of the played rows of `data` (one row per team and match, with Season, Round, Team, Opponent
+        and COLUMNS), with the tie-breakers of its Comp by default.
+        """
+
+        engine = cls(tie_breakers or cls.league_tie_breakers(data))
+        engine.update(data)
+        return engine
+
+    @staticmethod
+    def league_tie_breakers(data) -> list:
+        comps = data['Comp'].dropna().astype(str).unique() if 'Comp' in data.columns else []
+        return TIE_BREAKERS.get(comps[0], DEFAULT_TIE_BREAKERS) if len(comps) else DEFAULT_TIE_BREAKERS
+
+    def update(self, data):
+
+        """ Count the played rows of `data` in the tables and rank again the seasons they belong to.
+        """
+
+        data = data[['Season', 'Round', 'Team', 'Opponent'] + COLUMNS]
+        data = data[data['Points'].notna()]
+        if data.empty:
+            return
+
+        rounds = data['Round'].to_numpy(dtype=np.int64)
+        self._add_seasons(pd.unique(data['Season'].astype(str)))
+        season_ids, _ = self._season_ids(data['Season'])
+        team_ids = self._ids(data['Team'], add=True)
+        opponent_ids = self._ids(data['Opponent'], add=False)
+        self._grow(rounds.max())
+
+        counted = self.matches.sum(axis=2) > 0
+        round_numbers = np.arange(counted.shape[1])
+        last_round = np.where(counted, round_numbers, 0).max(axis=1)[season_ids]
+        first_round = np.where(counted, round_numbers, counted.shape[1]).min(axis=1)[season_ids]
+        # a team new to a season after its first round changes the tables of the rounds before
+        late = (rounds < last_round) | (~self.present[season_ids, team_ids] & (first_round < rounds))
+        if late.any():
+            late_rows = sorted(set(zip(np.asarray(self.seasons)[season_ids[late]], rounds[late])))
+            raise ValueError(f"Rows of rounds already in the standings {late_rows[:5]}, build them again")
+
+        values = data[COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+        np.add.at(self.increments, (season_ids, rounds, team_ids), np.nan_to_num(values))
+        np.add.at(self.matches, (season_ids, rounds, team_ids), 1)
+        self.present[season_ids, team_ids] = True
+        if self.head_to_head:
+            known = opponent_ids >= 0
+            matches = np.column_stack([season_ids, rounds, team_ids, opponent_ids, np.nan_to_num(values[:, :2])])
+            self.h2h_matches = np.vstack([self.h2h_matches, matches[known].astype(np.int64)])
+
+        self._rank(np.unique(season_ids))
+
+    def ranking(self, seasons, rounds, teams) -> np.ndarray:
+
+        """ Place of the teams in the table after `rounds` of `seasons` (NaN for a team or season not counted).
+        """
+
+        season_ids, round_ids, team_ids, known = self._cells(seasons, rounds, teams)
+        ranking = np.full(len(team_ids), np.nan)
+        ranking[known] = self.rankings[season_ids[known], round_ids[known], team_ids[known]]
+        ranking[ranking == 0] = np.nan
+        return ranking
+
+    def before(self, seasons, rounds, teams) -> (np.ndarray, np.ndarray):
+
+        """ Ranking and cumulated COLUMNS of the teams in the table before their match of `rounds`: the table of
+        the previous round, or for the first round (or a season not counted yet) the final table of the last
+        season the team played. The cumulated COLUMNS restart every season: NaN before the first match of the
+        team in the season.
+        """
+
+        rounds = np.asarray(rounds, dtype=np.int64) - 1
+        team_ids = self._ids(teams, add=False)
+        season_ids, counted = self._season_ids(seasons)
+        in_season = counted & (rounds >= 1)
+        round_ids = np.minimum(rounds, self.table.shape[1] - 1)
+        known = team_ids >= 0
+
+        ranking = np.full(len(team_ids), np.nan)
+        cumulatives = np.full((len(team_ids), len(COLUMNS)), np.nan)
+
+        current = known & in_season
+        cells = season_ids[current], round_ids[current], team_ids[current]
+        ranking[current] = self.rankings[cells]
+        cumulatives[current] = np.where((self.played[cells] > 0)[:, None], self.table[cells], np.nan)
+
+        previous = known & ~in_season
+        last_seasons = self._last_seasons()[season_ids[previous], team_ids[previous]]
+        values = np.full(len(last_seasons), np.nan)
+        values[last_seasons >= 0] = self.rankings[last_seasons[last_seasons >= 0], -1, team_ids[previous][last_seasons >= 0]]
+        ranking[previous] = values
+
+        ranking[ranking == 0] = np.nan
+        return ranking, cumulatives
+
+    def _cells(self, seasons, rounds, teams):
+        season_ids, counted = self._season_ids(seasons)
+        team_ids = self._ids(teams, add=False)
+        round_ids = np.clip(np.asarray(rounds, dtype=np.int64), 0, self.table.shape[1] - 1)
+        return season_ids, round_ids, team_ids, counted & (team_ids >= 0)
+
+    def _season_ids(self, seasons) -> (np.ndarray, np.ndarray):
+
+        """ Index of `seasons` in the sorted seasons (where it would be inserted when not counted) and whether
+        they are counted.
+        """
+
+        inverse, unique = pd.factorize(np.asarray(seasons))
+        unique = np.asarray(unique, dtype=str)
+        positions = np.searchsorted(self.seasons, unique)
+        counted = positions < len(self.seasons)
+        counted[counted] = np.asarray(self.seasons)[positions[counted]] == unique[counted]
+        return positions[inverse], counted[inverse]
+
+    def _last_seasons(self) -> np.ndarray:
+
+        """ (seasons + 1, teams) index of the last season before each season in which the team played, -1 when none.
+        """
+
+        last = np.where(self.present, np.arange(len(self.seasons))[:, None], -1)
+        accumulated = np.maximum.accumulate(last, axis=0) if len(last) else last
+        return np.vstack([np.full((1, len(self.teams)), -1), accumulated])
+
+    def _ids(self, names, add) -> np.ndarray:
+        inverse, unique = pd.factorize(np.asarray(names))
+        unique = np.asarray(unique, dtype=str)
+        if add:
+            new = [name for name in unique if name not in self._team_ids]
+            for name in new:
+                self._team_ids[name] = len(self.teams)
+                self.teams.append(name)
+            if new:
+                self._pad(teams=len(new))
+        return np.array([self._team_ids.get(name, -1) for name in unique], dtype=np.int64)[inverse]
+
+    def _add_seasons(self, seasons):
+        new = [season for season in seasons if season not in self.seasons]
+        if new and self.seasons and min(new) < self.seasons[-1]:
+            raise ValueError(f"Seasons {new} before the last one of the standings {self.seasons[-1]}, build them again")
+        self.seasons.extend(sorted(new))
+        if new:
+            self._pad(seasons=len(new))
+
+    def _grow(self, last_round):
+        if last_round + 1 > self.increments.shape[1]:
+            self._pad(rounds=last_round + 1 - self.increments.shape[1])
+
+    def _pad(self, seasons=0, rounds=0, teams=0):
+
+        """ Grow the arrays by new seasons, rounds or teams (one of them at a time).
+        """
+
+        self.increments = np.pad(self.increments, ((0, seasons), (0, rounds), (0, teams), (0, 0)))
+        self.matches = np.pad(self.matches, ((0, seasons), (0, rounds), (0, teams)))
+        self.present = np.pad(self.present, ((0, seasons), (0, teams)))
+        # the tables of the new rounds are the last ones
+        mode = 'edge' if rounds else 'constant'
+        self.table = np.pad(self.table, ((0, seasons), (0, rounds), (0, teams), (0, 0)), mode=mode)
+        self.played = np.pad(self.played, ((0, seasons), (0, rounds), (0, teams)), mode=mode)
+        self.rankings = np.pad(self.rankings, ((0, seasons), (0, rounds), (0, teams)), mode=mode)
+
+    def _rank(self, season_ids):
+
+        """ Cumulate the tables of `season_ids` and rank them, all their rounds with one lexsort.
+        """
+
+        table = self.increments[season_ids].cumsum(axis=1)
+        self.table[season_ids] = table
+        self.played[season_ids] = self.matches[season_ids].cumsum(axis=1)
+
+        n_seasons, n_rounds, n_teams = table.shape[:3]
+        values = {column: table[..., j] for j, column in enumerate(COLUMNS)}
+        if self.head_to_head:
+            values['H2H_Points'], values['H2H_GD'] = self._head_to_head(season_ids, values['Points'])
+        shape = (n_seasons, n_rounds, n_teams)
+        names = np.broadcast_to(np.argsort(np.argsort(np.array(self.teams, dtype=str))), shape)
+        absent = np.broadcast_to(~self.present[season_ids][:, None, :], shape)
+        keys = [names] + [-values[key] for key in reversed(self.tie_breakers)] + [
+            absent, np.broadcast_to(np.arange(n_rounds)[None, :, None], shape),
+            np.broadcast_to(np.arange(n_seasons)[:, None, None], shape)]
+        order = np.lexsort([key.ravel() for key in keys])
+
+        rankings = np.empty(order.size, dtype=np.int16)
+        rankings[order] = np.arange(order.size) % n_teams + 1
+        rankings = rankings.reshape(shape)
+        rankings[absent] = 0
+        self.rankings[season_ids] = rankings
+
+    def _head_to_head(self, season_ids, points) -> (np.ndarray, np.ndarray):
+
+        """ Points and goal difference of every team in the tables of `season_ids` won in its matches against the
+        teams level on points with it: a match counts in the tables from its round on, where both teams are level.
+        """
+
+        local = np.full(len(self.seasons), -1)
+        local[season_ids] = np.arange(len(season_ids))
+        matches = self.h2h_matches[local[self.h2h_matches[:, 0]] >= 0]
+        season, round_, team, opponent = local[matches[:, 0]], matches[:, 1], matches[:, 2], matches[:, 3]
+
+        n_seasons, n_rounds, n_teams = points.shape
+        rounds = np.arange(n_rounds)
+        level = (points[season, :, team] == points[season, :, opponent]) & (rounds >= round_[:, None])
+        cells = ((season[:, None] * n_rounds + rounds) * n_teams + team[:, None])[level]
+        size = n_seasons * n_rounds * n_teams
+        return [np.bincount(cells, weights=np.broadcast_to(matches[:, k, None], level.shape)[level], minlength=size)
+                .reshape(points.shape) for k in (4, 5)]
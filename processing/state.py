@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from processing.match_index import MatchIndex
+from processing.standings import StandingsEngine
+
+
+# layout of the saved states, a state saved with another one is built again (see DataManager.get_state)
+STATE_VERSION = 3
+
+
+def concat_parts(parts, **options) -> pd.DataFrame:
+
+    """ pd.concat of `parts`, a column categorical in every part staying categorical (on the union of their
+    categories) instead of falling back to objects when the categories differ.
+    """
+
+    data = pd.concat(parts, **options)
+    for col in parts[0].columns:
+        dtypes = [part[col].dtype for part in parts if col in part.columns]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes) and not isinstance(data[col].dtype, pd.CategoricalDtype):
+            categories = sorted(set().union(*(dtype.categories for dtype in dtypes)))
+            data[col] = data[col].astype(pd.CategoricalDtype(categories))
+    return data
+
+
+class FeatureState:
+
+    """ Processed features of a league, plus what is needed to extend them with new matches without
+    reprocessing the history: cumulated points / goals and the last matches of every (Season, Team),
+    the season sums used by the season averages, the standings (processing.standings) and the rows
+    of every (Season, Round) for the rankings.
+
+    `data` is the output of ProcessingFootball.features_processing, `prediction` the matching
+    home / away rows of prediction_processing and `unpaired` the labels of the rows of data merged without their
+    opposite row (paired again when it arrives, see ProcessingFootball.incremental_processing). The rows appended are kept as parts, concatenated when
+    `data` / `prediction` are read: an update costs the new matches, not the history. `last_kickoff` is the
+    kickoff of the last processed match and `source` the backend fingerprint of the raw data the state
+    reflects (set by the DataManager).
+    """
+
+    cumulative_columns = ['Points', 'GD', 'GF', 'GA']
+
+    def __init__(self, data, prediction, list_columns, window=5, standings=None, unpaired=()):
+
+        self.version = STATE_VERSION
+        self._data = [data]
+        self._prediction = [prediction]
+        self._keys = [MatchIndex.rows(data)]   # (DateTime, Team, Opponent) of the processed rows, per part
+        self.unpaired = list(unpaired)
+        self.list_columns = list_columns
+        self.window = window
+        self.source = None
+        self.last_kickoff = data['DateTime'].max() if len(data) else None
+        self._next_label = data.index.max() + 1 if len(data) else 0
+
+        self.cumulatives = {}   # (Season, Team) -> cumulated Points, GD, GF, GA
+        self.last_round = {}    # (Season, Team) -> last Round played
+        self.last_date = {}     # (Season, Team) -> kickoff of the last match
+        self.windows = {}       # (Season, Team) -> list_columns of the last `window` matches
+        self.results = {}       # (Season, Team) -> Result of the last `window` matches
+        self.season_sums = {}   # (Season, Team) -> (sum, count) of list_columns over the season
+        self.standings = standings
+        self.rounds = {}        # (Season, Round) -> index labels of the matches of the round
+
+        self._build()
+
+    @property
+    def data(self) -> pd.DataFrame:
+        if len(self._data) > 1:
+            self._data = [concat_parts(self._data)]
+        return self._data[0]
+
+    @property
+    def prediction(self) -> pd.DataFrame:
+        if len(self._prediction) > 1:
+            self._prediction = [concat_parts(self._prediction, ignore_index=True)]
+        return self._prediction[0]
+
+    def empty(self, prediction=False) -> pd.DataFrame:
+
+        """ `data` (or `prediction`) without rows, for its columns and dtypes without concatenating the parts.
+        """
+
+        return (self._prediction if prediction else self._data)[0].iloc[:0]
+
+    def _build(self):
+
+        # canonical order of the feature graph (features_processing already returns it)
+        data = self.data.sort_values(by=['Season', 'Team', 'DateTime', 'Round'], kind='stable')
+        groups = data.groupby(['Season', 'Team'], sort=False, observed=True)
+
+        last = groups.tail(1)
+        self.last_date = dict(zip(zip(last['Season'], last['Team']), last['DateTime']))
+
+        # (the cumulatives follow the rounds: the ones of the last round are the season totals)
+        last = data.sort_values(by=['Season', 'Team', 'Round'], kind='stable').groupby(['Season', 'Team'], sort=False, observed=True).tail(1)
+        cum_columns = [f'{col}_Cum' for col in self.cumulative_columns]
+        for key, cumulatives, round_ in zip(zip(last['Season'], last['Team']), last[cum_columns].to_numpy(dtype=float, na_value=np.nan), last['Round']):
+            self.cumulatives[key] = cumulatives
+            self.last_round[key] = round_
+
+        for key, rows in groups.tail(self.window).groupby(['Season', 'Team'], sort=False, observed=True):
+            self.windows[key] = rows[self.list_columns].to_numpy(dtype=float, na_value=np.nan)
+            self.results[key] = list(rows['Result'])
+
+        sums = groups[self.list_columns].sum()
+        counts = groups[self.list_columns].count()
+        for key in sums.index:
+            self.season_sums[key] = (sums.loc[key].to_numpy(dtype=float, na_value=np.nan), counts.loc[key].to_numpy(dtype=float, na_value=np.nan))
+
+        if self.standings is None:
+            self.standings = StandingsEngine.from_data(data)
+
+        self.rounds = {key: list(labels) for key, labels in data.groupby(['Season', 'Round'], observed=True).groups.items()}
+
+    def is_processed(self, data) -> np.ndarray:
+
+        """ Rows of `data` whose (DateTime, Team, Opponent) is processed: an index lookup per part.
+        """
+
+        rows = MatchIndex.rows(data)
+        return np.logical_or.reduce([rows.isin(keys) for keys in self._keys] + [np.zeros(len(data), dtype=bool)])
+
+    def next_label(self):
+        return self._next_label
+
+    def rows(self, labels, columns) -> pd.DataFrame:
+
+        """ `columns` of the processed rows `labels`, read in the parts holding them.
+        """
+
+        found = [part.loc[part.index.intersection(labels), columns] for part in self._data]
+        return concat_parts(found).reindex(labels)
+
+    def update_rows(self, labels, column, values):
+
+        """ Set `column` of the processed rows `labels` to `values`, in the parts holding them.
+        """
+
+        values = np.asarray(values)
+        for part in self._data:
+            positions = part.index.get_indexer(labels)
+            found = positions >= 0
+            if found.any():
+                part.iloc[positions[found], part.columns.get_loc(column)] = values[found]
+
+    def append(self, new_data, new_prediction, unpaired=None, replaced=()):
+
+        """ Register new processed rows (already accounted for in the cumulatives / windows), the merged rows of
+        the matches `replaced` (MatchID) replacing their stored ones, and the labels of the rows `unpaired` now.
+        """
+
+        if unpaired is not None:
+            self.unpaired = list(unpaired)
+        if len(replaced):
+            self._prediction = [part[~part['MatchID'].isin(replaced)] for part in self._prediction]
+        if new_data.empty:
+            return
+        self._data.append(new_data)
+        self._prediction.append(new_prediction)
+        self._keys.append(MatchIndex.rows(new_data))
+        self._next_label = max(self._next_label, new_data.index.max() + 1)
+        kickoff = new_data['DateTime'].max()
+        self.last_kickoff = kickoff if self.last_kickoff is None or kickoff > self.last_kickoff else self.last_kickoff
+
+        for key, label in zip(zip(new_data['Season'], new_data['Round']), new_data.index):
+            self.rounds.setdefault(key, []).append(label)
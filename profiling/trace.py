@@ -0,0 +1,310 @@
+""" Timing instrumentation of the Downloader, the fetcher and ProcessingFootball.
+
+Disabled by default: a traced method then only checks `tracer.enabled` before calling the method. To record a
+run, set GOALAI_TRACE to the trace file (GOALAI_TRACE_MEMORY=1 also records the Python allocation peak of
+every span, which slows the run down several times):
+
+    GOALAI_TRACE=trace.json python main.py
+    python -m profiling.trace trace.json
+
+or call tracer.enable() / tracer.save(path) around the code to measure. The trace is a Chrome trace event
+file (it opens in chrome://tracing or ui.perfetto.dev), every span keeps its fields in "args".
+"""
+
+import atexit
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Span:
+
+    """ A timed block, opened with `with tracer.span(name, **fields) as span`. span.set() adds fields
+    (rows, bytes, cache outcome...) to its record.
+    """
+
+    def __init__(self, tracer, name, fields):
+        self.tracer = tracer
+        self.name = name
+        self.fields = fields
+        self.id = None
+        self.parent = None
+        self.start = None
+        self.memory_start = 0
+        self.peak = 0
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.tracer._open(self)
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.tracer._close(self, error_type)
+        return False
+
+
+class NullSpan:
+
+    """ Span returned while the tracer is disabled, records nothing.
+    """
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+
+    """ Records the spans of the current process (the spans of another thread are roots, unless the work was
+    sent to it with propagate()).
+    Every record has the wall time of the span, the peak resident memory of the process at its end and, with
+    `memory`, the peak of the Python allocations during the span above their level at its start
+    (process-wide: concurrent spans of the Downloader threads see each other's allocations).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.path = None
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    def enable(self, path=None, memory=False):
+
+        """ Start recording, from an empty trace. save() writes it to `path` by default.
+        """
+
+        self.events = []
+        self.path = path
+        self.memory = memory
+        self._origin = time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.memory = False
+
+    def span(self, name, **fields):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, fields)
+
+    def propagate(self, function):
+
+        """ `function` opening its spans under the current span of this thread, for the work sent to a thread
+        pool (the time of the pool is then counted in the spans of the workers).
+        """
+
+        if not self.enabled:
+            return function
+        stack = self._stack()
+        parent = stack[-1].id if stack else None
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            self._local.root = parent
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._local.root = None
+
+        return wrapper
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                 "otherData": {"argv": sys.argv, "memory": self.memory}}
+        with open(path + ".tmp", "w") as file:
+            json.dump(trace, file)
+        os.replace(path + ".tmp", path)
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _open(self, span):
+        stack = self._stack()
+        span.id = next(self._ids)
+        span.parent = stack[-1].id if stack else getattr(self._local, "root", None)
+
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            span.memory_start = span.peak = current
+
+        stack.append(span)
+        span.start = time.perf_counter()
+
+    def _close(self, span, error_type):
+        end = time.perf_counter()
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+
+        args = dict(span.fields, id=span.id, parent=span.parent, max_rss_mb=max_rss_mb())
+        if error_type is not None:
+            args["error"] = error_type.__name__
+
+        if self.memory and tracemalloc.is_tracing():
+            peak = max(span.peak, tracemalloc.get_traced_memory()[1])
+            args["peak_bytes"] = peak - span.memory_start
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+
+        event = {"name": span.name, "cat": span.name.split(".")[0], "ph": "X",
+                 "ts": round((span.start - self._origin) * 1e6, 1), "dur": round((end - span.start) * 1e6, 1),
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+        with self._lock:
+            self.events.append(event)
+
+
+def max_rss_mb() -> float:
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(max_rss / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+tracer = Tracer()
+
+
+def traced(name=None):
+
+    """ Decorator recording every call of the function as a span (named after its qualified name by default),
+    with the rows of its first DataFrame argument (rows_in) and of the DataFrames it returns (rows_out).
+    """
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+
+            with tracer.span(span_name) as span:
+                rows_in = next((len(arg) for arg in itertools.chain(args, kwargs.values())
+                                if isinstance(arg, pd.DataFrame)), None)
+                if rows_in is not None:
+                    span.set(rows_in=rows_in)
+                result = function(*args, **kwargs)
+                rows_out = _rows(result)
+                if rows_out is not None:
+                    span.set(rows_out=rows_out)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _rows(result):
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, tuple) and any(isinstance(item, pd.DataFrame) for item in result):
+        return [len(item) if isinstance(item, pd.DataFrame) else None for item in result]
+    return None
+
+
+def summarize(events) -> pd.DataFrame:
+
+    """ One row per span name: calls, total and self wall time (without the time of the child spans),
+    rows in and out, bytes fetched and peak memory. Sorted by self time, where the time is actually spent.
+    """
+
+    spans = pd.DataFrame([{"name": event["name"], "pid": event["pid"], "id": event["args"].get("id"),
+                           "parent": event["args"].get("parent"), "dur": event["dur"] / 1e6,
+                           "rows_in": event["args"].get("rows_in"),
+                           "rows_out": _total_rows(event["args"].get("rows_out")),
+                           "bytes": event["args"].get("bytes"), "peak_bytes": event["args"].get("peak_bytes"),
+                           "max_rss_mb": event["args"].get("max_rss_mb"),
+                           "errors": "error" in event["args"]}
+                          for event in events if event.get("ph") == "X"])
+    if spans.empty:
+        return spans
+
+    children = spans.dropna(subset=["parent"]).groupby(["pid", "parent"])["dur"].sum().to_dict()
+    # children running in parallel threads can last longer than their parent
+    spans["self"] = (spans["dur"] - [children.get((pid, id_), 0.0) for pid, id_ in zip(spans["pid"], spans["id"])]).clip(lower=0)
+
+    grouped = spans.groupby("name")
+    summary = pd.DataFrame({
+        "calls": grouped.size(),
+        "total_s": grouped["dur"].sum(),
+        "self_s": grouped["self"].sum(),
+        "mean_ms": grouped["dur"].mean() * 1000,
+        "max_ms": grouped["dur"].max() * 1000,
+        "rows_in": grouped["rows_in"].sum(min_count=1).astype("Int64"),
+        "rows_out": grouped["rows_out"].sum(min_count=1).astype("Int64"),
+        "MB_fetched": grouped["bytes"].sum(min_count=1) / 1024 ** 2,
+        "peak_MB": grouped["peak_bytes"].max() / 1024 ** 2,
+        "max_rss_MB": grouped["max_rss_mb"].max(),
+        "errors": grouped["errors"].sum(),
+    })
+    return summary.sort_values("self_s", ascending=False)
+
+
+def _total_rows(rows):
+    if isinstance(rows, list):
+        return sum(row for row in rows if row is not None)
+    return rows
+
+
+def main(path):
+    with open(path) as file:
+        events = json.load(file)["traceEvents"]
+    summary = summarize(events)
+    if summary.empty:
+        print(f"No spans in {path}")
+        return
+    wall_time = (max(event["ts"] + event["dur"] for event in events) - min(event["ts"] for event in events)) / 1e6
+    print(summary.to_string(float_format=lambda value: f"{value:.3f}"))
+    print(f"\n{len(events)} spans over {wall_time:.2f} s")
+
+
+if os.environ.get("GOALAI_TRACE") and __name__ != '__main__':
+    tracer.enable(os.environ["GOALAI_TRACE"], memory=os.environ.get("GOALAI_TRACE_MEMORY") == "1")
+    atexit.register(tracer.save)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import shutil
+import threading
+import pandas as pd
+
+from profiling.trace import traced
+
+
+KINDS = {
+    # kind -> (CSV folder, CSV file suffix)
+    "data": ("data", "_data.csv"),
+    "futur_matches": ("futur_matches", "_futur_data.csv"),
+}
+
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path) -> str:
+
+    """ sha256 of the file content, only computed again when its size or modification time changed.
+    """
+
+    stat = os.stat(path)
+    with _digests_lock:
+        known = _digests.get(path)
+    if known is not None and known[0] == (stat.st_size, stat.st_mtime_ns):
+        return known[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 ** 2), b""):
+            digest.update(block)
+
+    with _digests_lock:
+        _digests[path] = ((stat.st_size, stat.st_mtime_ns), digest.hexdigest())
+    return digest.hexdigest()
+
+
+def match_datetime(data) -> pd.Series:
+    date = data['Date'].astype(str)
+    time = data['Time'].fillna('00:00').astype(str) if 'Time' in data.columns else '00:00'
+    return pd.to_datetime(date + ' ' + time, errors='coerce')
+
+
+# A match row is identified by its date and its two teams
+MATCH_KEY = ['Date', 'Team', 'Opponent']
+
+
+def read_columns(columns, start=None, end=None) -> set:
+
+    """ Stored columns to read for a read(columns, start, end): the DateTime filters and column need Date and Time.
+    """
+
+    if columns is None:
+        return None
+    return set(columns) | ({'Date', 'Time'} if 'DateTime' in columns or start is not None or end is not None else set())
+
+
+def select(data, columns=None, start=None, end=None) -> pd.DataFrame:
+
+    """ Rows of `data` played between `start` and `end` (DateTime bounds, included) and its `columns`, a DateTime
+    column being computed from Date and Time when requested.
+    """
+
+    if start is not None or end is not None:
+        datetime = match_datetime(data)
+        mask = pd.Series(True, index=data.index)
+        if start is not None:
+            mask &= datetime >= pd.Timestamp(start)
+        if end is not None:
+            mask &= datetime <= pd.Timestamp(end)
+        data = data[mask].reset_index(drop=True)
+
+    if columns is not None:
+        if 'DateTime' in columns and 'DateTime' not in data.columns:
+            data['DateTime'] = match_datetime(data)
+        data = data[[col for col in columns if col in data.columns]]
+
+    return data
+
+
+def append_by_rewrite(backend, data, league_name, kind='data') -> int:
+
+    """ append() of the backends storing a league as a whole: the stored rows and the new ones, without the
+    new rows of already stored matches, are written again. Returns the number of new rows.
+    """
+
+    if not backend.exists(league_name, kind):
+        backend.write(data, league_name, kind)
+        return len(data)
+
+    stored = backend.read(league_name, kind)
+    merged = pd.concat([stored, data]).drop_duplicates(subset=MATCH_KEY)
+    backend.write(merged, league_name, kind)
+    return len(merged) - len(stored)
+
+
+def match_season(datetime) -> pd.Series:
+    year = datetime.dt.year - (datetime.dt.month < 8)
+    return (year.astype('Int64').astype(str) + '-' + (year + 1).astype('Int64').astype(str)).where(datetime.notna(), 'unknown')
+
+
+class CsvBackend:
+
+    """ One CSV per league and kind: storage/data/{league}_data.csv and storage/futur_matches/{league}_futur_data.csv.
+    Column projection and DateTime filters are applied after parsing.
+    """
+
+    def __init__(self, storage_folder='storage'):
+        self.storage_folder = storage_folder
+
+    def path(self, league_name, kind='data') -> str:
+        folder, suffix = KINDS[kind]
+        return os.path.join(self.storage_folder, folder, f"{league_name}{suffix}")
+
+    def exists(self, league_name, kind='data') -> bool:
+        return os.path.exists(self.path(league_name, kind))
+
+    def fingerprint(self, league_name, kind='data') -> str:
+        return file_digest(self.path(league_name, kind))
+
+    @traced("CsvBackend.read")
+    def read(self, league_name, kind='data', columns=None, start=None, end=None) -> pd.DataFrame:
+
+        wanted = read_columns(columns, start, end)
+        data = pd.read_csv(self.path(league_name, kind), usecols=None if wanted is None else (lambda col: col in wanted))
+        return select(data, columns, start, end)
+
+    @traced("CsvBackend.write")
+    def write(self, data, league_name, kind='data'):
+
+        """ Replace the CSV of the league, written next to it and renamed over it (an interrupted write leaves
+        the previous file).
+        """
+
+        path = self.path(league_name, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data.to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    @traced("CsvBackend.append")
+    def append(self, data, league_name, kind='data') -> int:
+        return append_by_rewrite(self, data, league_name, kind)
+
+
+class ParquetBackend:
+
+    """ Parquet dataset partitioned by league and season:
+    storage/parquet/{kind}/League={league}/Season={season}/part-0.parquet
+
+    Dtypes are stored with the data (no re-inference), `columns` only reads the requested columns and the
+    `start` / `end` filters on the typed DateTime column are pushed down to the Parquet reader.
+    A DateTime column (kickoff date and time) and the position of every row in the written frame are stored
+    with the columns: a read returns the stored columns in the written row order, as the other backends, and
+    DateTime only when it is requested.
+    """
+
+    # position of the row in the frame written (the partitions by season regroup the rows)
+    row_column = "_Row"
+
+    def __init__(self, storage_folder='storage'):
+        try:
+            import pyarrow
+            import pyarrow.dataset
+        except ImportError as e:
+            raise ImportError("The Parquet storage backend needs pyarrow: pip install pyarrow") from e
+
+        self.storage_folder = storage_folder
+
+    def path(self, league_name, kind='data') -> str:
+        return os.path.join(self.storage_folder, "parquet", kind, f"League={league_name}")
+
+    def exists(self, league_name, kind='data') -> bool:
+        return os.path.isdir(self.path(league_name, kind))
+
+    def fingerprint(self, league_name, kind='data') -> str:
+        path = self.path(league_name, kind)
+        digest = hashlib.sha256()
+        for folder, _, files in sorted(os.walk(path)):
+            for file_name in sorted(files):
+                file_path = os.path.join(folder, file_name)
+                digest.update(f"{os.path.relpath(file_path, path)}:{file_digest(file_path)}".encode())
+        return digest.hexdigest()
+
+    @traced("ParquetBackend.read")
+    def read(self, league_name, kind='data', columns=None, start=None, end=None) -> pd.DataFrame:
+
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(self.path(league_name, kind), format="parquet", partitioning="hive")
+
+        # The Season bounds prune whole partitions, the DateTime bounds skip row groups within them
+        predicate = None
+        if start is not None:
+            start = pd.Timestamp(start)
+            predicate = (ds.field('Season') >= match_season(pd.Series([start])).iat[0]) & (ds.field('DateTime') >= start)
+        if end is not None:
+            end = pd.Timestamp(end)
+            upper = (ds.field('Season') <= match_season(pd.Series([end])).iat[0]) & (ds.field('DateTime') <= end)
+            predicate = upper if predicate is None else predicate & upper
+
+        names = dataset.schema.names
+        stored = [col for col in names if col not in ('Season', 'DateTime', self.row_column)]
+        columns = stored if columns is None else [col for col in columns if col in stored or (col == 'DateTime' and col in names)]
+        # (datasets written without the row positions keep the order of their partitions)
+        order = [self.row_column] if self.row_column in names else []
+
+        data = dataset.to_table(columns=list(dict.fromkeys(columns + order)), filter=predicate).to_pandas()
+        if order:
+            data = data.sort_values(by=order, kind='stable').reset_index(drop=True)
+        return data[columns]
+
+    @traced("ParquetBackend.write")
+    def write(self, data, league_name, kind='data'):
+
+        """ Replace the stored data of the league. The new dataset is written next to the old one and
+        swapped in with renames.
+        """
+
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        data = data.copy()
+        data['DateTime'] = match_datetime(data)
+        data['Season'] = match_season(data['DateTime'])
+        data[self.row_column] = range(len(data))
+
+        path = self.path(league_name, kind)
+        temporary, previous = path + ".tmp", path + ".old"
+        shutil.rmtree(temporary, ignore_errors=True)
+
+        ds.write_dataset(pa.Table.from_pandas(data, preserve_index=False), temporary, format="parquet",
+                         partitioning=["Season"], partitioning_flavor="hive",
+                         basename_template="part-{i}.parquet")
+
+        if os.path.exists(path):
+            os.replace(path, previous)
+        os.replace(temporary, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @traced("ParquetBackend.append")
+    def append(self, data, league_name, kind='data') -> int:
+        return append_by_rewrite(self, data, league_name, kind)
+
+
+def default_backend(storage_folder='storage'):
+
+    """ The segment backend once the CSVs have been migrated to it (storage/segments exists), else the Parquet
+    backend once migrated (storage/parquet exists), both when pyarrow is installed, the CSV backend otherwise.
+    """
+
+    if os.path.isdir(os.path.join(storage_folder, "segments")):
+        from storage.segments import SegmentBackend
+        try:
+            return SegmentBackend(storage_folder)
+        except ImportError:
+            pass
+    if os.path.isdir(os.path.join(storage_folder, "parquet")):
+        try:
+            return ParquetBackend(storage_folder)
+        except ImportError:
+            pass
+    return CsvBackend(storage_folder)
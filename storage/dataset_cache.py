@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# Bump when a change of the processing is not visible in CODE_FILES (e.g. a pandas upgrade changing results)
+CONFIG_VERSION = 1
+
+# (leagues/league.py composes the cached views of the DataManager and applies the CompactSchema)
+CODE_FILES = ['processing/processing.py', 'processing/rolling.py', 'processing/state.py', 'processing/stages.py',
+              'processing/standings.py', 'processing/match_index.py', 'processing/mapping_columns.json', 'storage/backends.py', 'storage/segments.py',
+              'storage/schema.py', 'leagues/league.py']
+
+_code_fingerprint = None
+
+
+def code_fingerprint() -> str:
+
+    """ Hash of the processing code and configuration files, with CONFIG_VERSION: processed datasets cached by
+    an older version of the code are never served.
+    """
+
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        digest = hashlib.sha256(f"config-{CONFIG_VERSION}".encode())
+        for path in CODE_FILES:
+            with open(path, "rb") as file:
+                digest.update(file.read())
+        _code_fingerprint = digest.hexdigest()
+    return _code_fingerprint
+
+
+class DatasetCache:
+
+    """ Cache of processed DataFrames, in memory (least recently used first out once they take more than
+    `max_bytes`) and on disk in `folder` (pickles, least recently used removed above `max_disk_bytes`).
+    Callers build the key from everything the result depends on, see DatasetCache.key. get() returns a copy,
+    so that a caller modifying its frame does not modify the cached one.
+    """
+
+    def __init__(self, folder=None, max_bytes=1024 ** 3, max_disk_bytes=4 * 1024 ** 3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = {"memory": 0, "disk": 0, "miss": 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.pkl")
+
+    def get(self, key) -> pd.DataFrame:
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return self.memory[key][0].copy()
+
+        if self.folder is not None and os.path.exists(self._path(key)):
+            try:
+                data = pd.read_pickle(self._path(key))
+            except Exception as e:
+                print(f"Unreadable cached dataset {self._path(key)} - Erreur: {e}")
+            else:
+                os.utime(self._path(key))
+                self._remember(key, data)
+                self.hits["disk"] += 1
+                return data.copy()
+
+        self.hits["miss"] += 1
+        return None
+
+    def put(self, key, data):
+        data = data.copy()
+        self._remember(key, data)
+
+        if self.folder is not None:
+            os.makedirs(self.folder, exist_ok=True)
+            data.to_pickle(self._path(key) + ".tmp")
+            os.replace(self._path(key) + ".tmp", self._path(key))
+            self._evict_disk()
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+        if self.folder is not None and os.path.isdir(self.folder):
+            for file_name in os.listdir(self.folder):
+                os.remove(os.path.join(self.folder, file_name))
+
+    def _remember(self, key, data):
+        size = int(data.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.memory:
+                self.memory_bytes -= self.memory.pop(key)[1]
+            self.memory[key] = (data, size)
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_bytes:
+                _, (_, evicted) = self.memory.popitem(last=False)
+                self.memory_bytes -= evicted
+
+    def _evict_disk(self):
+        files = [entry for entry in os.scandir(self.folder) if entry.name.endswith(".pkl")]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in files)
+        while total > self.max_disk_bytes and files:
+            entry = files.pop(0)
+            total -= entry.stat().st_size
+            os.remove(entry.path)
@@ -0,0 +1,65 @@
+""" One-shot migration of the league CSVs (storage/data, storage/futur_matches) to the Parquet backend or to the
+append-only segment backend.
+
+Run from the repository root:  python -m storage.migrate [storage_folder] [target_folder]
+                               python -m storage.migrate segments [storage_folder] [target_folder]
+Once storage/parquet (or storage/segments) exists, DataManager uses that backend by default.
+"""
+
+import os
+import sys
+
+from storage.backends import KINDS, CsvBackend, ParquetBackend
+from storage.segments import SegmentBackend
+
+
+def migrate_csv_to_parquet(storage_folder='storage', target_folder=None):
+
+    """ Copy every league CSV of `storage_folder` to a Parquet dataset in `target_folder` (default: the same
+    storage folder) and check the row counts. Returns {(league, kind): rows}.
+    """
+
+    return migrate_csv(ParquetBackend(target_folder or storage_folder), storage_folder)
+
+
+def migrate_csv_to_segments(storage_folder='storage', target_folder=None):
+
+    """ Same as migrate_csv_to_parquet, to the segment backend (one segment per league and kind).
+    """
+
+    return migrate_csv(SegmentBackend(target_folder or storage_folder), storage_folder)
+
+
+def migrate_csv(target, storage_folder='storage'):
+
+    source = CsvBackend(storage_folder)
+    migrated = {}
+
+    for kind, (folder, suffix) in KINDS.items():
+        path = os.path.join(storage_folder, folder)
+        if not os.path.isdir(path):
+            continue
+
+        for file_name in sorted(os.listdir(path)):
+            if not file_name.endswith(suffix):
+                continue
+            league_name = file_name[:-len(suffix)]
+
+            data = source.read(league_name, kind)
+            target.write(data, league_name, kind)
+
+            rows = len(target.read(league_name, kind, columns=['Date']))
+            if rows != len(data):
+                raise RuntimeError(f"{league_name} {kind}: {len(data)} rows in the CSV, {rows} in {type(target).__name__}")
+
+            migrated[(league_name, kind)] = rows
+            print(f"{league_name} {kind}: {rows} rows migrated")
+
+    return migrated
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["segments"]:
+        migrate_csv_to_segments(*sys.argv[2:])
+    else:
+        migrate_csv_to_parquet(*sys.argv[1:])
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+
+# Stats with decimals (ratios, expected goals, averages), stored as float32
+FLOAT_COLUMNS = [
+    "xG", "xGA", "Challenges_Tkl%", "Take-Ons_Succ%", "Take-Ons_Tkld%", "Standard_SoT%", "Standard_G/Sh",
+    "Standard_G/SoT", "Standard_Dist", "Expected_xG", "Expected_npxG", "Expected_npxG/Sh", "Expected_G-xG",
+    "Expected_np:G-xG", "Total_Cmp%", "Short_Cmp%", "Medium_Cmp%", "Long_Cmp%", "xAG", "xA", "Performance_Save%",
+    "Performance_PSxG", "Performance_PSxG+/-", "Launched_Cmp%", "Passes_Launch%", "Passes_AvgLen",
+    "Goal Kicks_Launch%", "Goal Kicks_AvgLen", "Crosses_Stp%", "Sweeper_AvgDist",
+]
+
+# Counts that can go beyond int16
+INT32_COLUMNS = ["Attendance", "Total_TotDist", "Total_PrgDist", "Carries_TotDist", "Carries_PrgDist"]
+
+CATEGORY_COLUMNS = ["Comp", "Day", "Venue", "Result", "Captain", "Formation", "Referee", "Match Report", "Notes"]
+
+# Share one dictionary of team names
+TEAM_COLUMNS = ["Team", "Opponent"]
+
+# Kept as Python strings (parsed by the processing)
+TEXT_COLUMNS = ["Date", "Time", "Round", "Season"]
+
+
+class CompactSchema:
+
+    """ Compact dtypes of the fbref columns: decimal stats as float32, the other stats as nullable Int16 / Int32,
+    repeated strings as categories, Team and Opponent with the same sorted team dictionary (so that they can be
+    compared, and sorted as the strings were). Every other stat (not listed) is an Int16 when its values fit,
+    float32 otherwise: a value never changes, only its storage. Features computed by the processing are float32.
+    """
+
+    float_dtype = np.float32
+
+    def apply(self, data, teams=None) -> pd.DataFrame:
+
+        """ `data` with the compact dtypes. `teams` is the team dictionary, by default the teams of `data`.
+        """
+
+        data = data.copy()
+        present = [col for col in TEAM_COLUMNS if col in data.columns]
+        if present:
+            data[present] = data[present].astype(self.team_dtype(data, teams))
+
+        for col in data.columns:
+            if col in CATEGORY_COLUMNS:
+                if not isinstance(data[col].dtype, pd.CategoricalDtype):
+                    data[col] = data[col].astype("category")
+            elif col in FLOAT_COLUMNS:
+                data[col] = data[col].astype(self.float_dtype)
+            elif col in TEAM_COLUMNS or col in TEXT_COLUMNS or not pd.api.types.is_numeric_dtype(data[col]):
+                continue
+            elif pd.api.types.is_float_dtype(data[col]) or pd.api.types.is_integer_dtype(data[col]):
+                data[col] = self._integer(data[col], "Int32" if col in INT32_COLUMNS else "Int16")
+
+        return data
+
+    def team_dtype(self, data, teams=None) -> pd.CategoricalDtype:
+        if teams is None:
+            teams = pd.unique(pd.concat([data[col].dropna().astype(str) for col in TEAM_COLUMNS if col in data.columns]))
+        return pd.CategoricalDtype(sorted(set(teams)))
+
+    def _integer(self, series, dtype) -> pd.Series:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        known = values[~np.isnan(values)]
+        info = np.iinfo(dtype.lower())
+        if len(known) and ((known % 1 != 0).any() or known.min() < info.min or known.max() > info.max):
+            return series.astype(self.float_dtype)
+        return series.astype(dtype)
+
+
+def memory_usage(data) -> int:
+    return int(data.memory_usage(deep=True).sum())
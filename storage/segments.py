@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+from profiling.trace import traced
+from storage.backends import MATCH_KEY, read_columns, select
+
+
+def fsync(path):
+
+    """ Flush the file to the disk, before the manifest referencing it is committed.
+    """
+
+    with open(path, "rb") as file:
+        os.fsync(file.fileno())
+
+
+class SegmentBackend:
+
+    """ Append-only store: storage/segments/{kind}/{league}/ holds immutable Parquet segments and a manifest
+    listing them in order. A scrape adds the rows of the matches not stored yet (deduplicated on Date, Team,
+    Opponent against the keys of the stored segments) as a new segment, without rewriting the others.
+
+    Every commit (new segment, replacement, compaction) writes its files first and then swaps the manifest with
+    a rename: an interrupted write leaves the previous manifest, its segments untouched. Past `max_segments`
+    segments, a background thread compacts the league into one segment. One writing process at a time.
+    """
+
+    def __init__(self, storage_folder='storage', max_segments=16):
+        try:
+            import pyarrow
+        except ImportError as e:
+            raise ImportError("The segment storage backend needs pyarrow: pip install pyarrow") from e
+
+        self.storage_folder = storage_folder
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._compactions = {}
+
+    def path(self, league_name, kind='data') -> str:
+        return os.path.join(self.storage_folder, "segments", kind, league_name)
+
+    def exists(self, league_name, kind='data') -> bool:
+        return os.path.exists(self._manifest_path(league_name, kind))
+
+    def fingerprint(self, league_name, kind='data') -> str:
+
+        """ Segments are immutable and never reuse a name within a store: the id of the store (written in its
+        manifest when it is created) and its segments identify the content. Segment names restart in a new store,
+        their size and mtime tell apart the segments of stores saved without an id.
+        """
+
+        if not self.exists(league_name, kind):
+            return json.dumps(None)
+        try:
+            return self._fingerprint(self._manifest(league_name, kind), league_name, kind)
+        except FileNotFoundError:
+            # a compaction removed the segments of the manifest we read
+            return self._fingerprint(self._manifest(league_name, kind), league_name, kind)
+
+    @traced("SegmentBackend.read")
+    def read(self, league_name, kind='data', columns=None, start=None, end=None) -> pd.DataFrame:
+        try:
+            data = self._read_segments(self._manifest(league_name, kind), league_name, kind, columns, start, end)
+        except FileNotFoundError:
+            # a compaction removed the segments of the manifest we read
+            data = self._read_segments(self._manifest(league_name, kind), league_name, kind, columns, start, end)
+        return select(data, columns, start, end)
+
+    @traced("SegmentBackend.write")
+    def write(self, data, league_name, kind='data'):
+
+        """ Replace the stored rows of the league by `data`, in one segment.
+        """
+
+        with self._lock:
+            manifest = self._manifest(league_name, kind)
+            segment = self._write_segment(data, league_name, kind, manifest)
+            removed = manifest["segments"]
+            manifest["segments"] = [segment]
+            self._commit(manifest, league_name, kind)
+            self._keys.pop((league_name, kind), None)
+            self._remove(removed, league_name, kind)
+
+    @traced("SegmentBackend.append")
+    def append(self, data, league_name, kind='data') -> int:
+
+        """ Store the rows of `data` whose (Date, Team, Opponent) is not stored yet (the stored row of a match
+        is kept, as drop_duplicates on the whole history did). Returns the number of new rows.
+        """
+
+        with self._lock:
+            manifest = self._manifest(league_name, kind)
+            keys = self._stored_keys(manifest, league_name, kind)
+
+            data = data.drop_duplicates(subset=MATCH_KEY)
+            new = ~pd.Series([key in keys for key in self._key_tuples(data)], index=data.index, dtype=bool)
+            data = data[new]
+            if data.empty:
+                return 0
+
+            manifest["segments"].append(self._write_segment(data, league_name, kind, manifest))
+            self._commit(manifest, league_name, kind)
+            keys.update(self._key_tuples(data))
+            self._keys[(league_name, kind)] = (self._files(manifest), keys)
+            segments = len(manifest["segments"])
+
+        if segments > self.max_segments:
+            self.compact_in_background(league_name, kind)
+        return len(data)
+
+    def compact(self, league_name, kind='data'):
+
+        """ Merge the segments of the league into one. Segments appended while merging are kept after it.
+        """
+
+        with self._lock:
+            snapshot = self._manifest(league_name, kind)
+        if len(snapshot["segments"]) < 2:
+            return
+
+        # merged without holding the lock, the appends go on meanwhile
+        try:
+            merged = self._read_segments(snapshot, league_name, kind)
+        except FileNotFoundError:
+            return
+        temporary = os.path.join(self.path(league_name, kind), "compaction.tmp")
+        merged.to_parquet(temporary, index=False)
+        fsync(temporary)
+
+        with self._lock:
+            manifest = self._manifest(league_name, kind)
+            compacted = self._files(snapshot)
+            if self._files(manifest)[:len(compacted)] != compacted:
+                # replaced meanwhile: the merged segment is obsolete
+                os.remove(temporary)
+                return
+
+            segment = self._new_segment(merged, manifest)
+            os.replace(temporary, os.path.join(self.path(league_name, kind), segment["file"]))
+            manifest["segments"] = [segment] + manifest["segments"][len(compacted):]
+            self._commit(manifest, league_name, kind)
+            cached = self._keys.pop((league_name, kind), None)
+            if cached is not None and cached[0] == self._files(snapshot) + self._files(manifest)[1:]:
+                self._keys[(league_name, kind)] = (self._files(manifest), cached[1])
+            self._remove(snapshot["segments"], league_name, kind)
+
+            # segments of interrupted appends, never committed
+            referenced = set(self._files(manifest))
+            self._remove([{"file": file_name} for file_name in os.listdir(self.path(league_name, kind))
+                          if file_name.endswith(".parquet") and file_name not in referenced], league_name, kind)
+
+    def compact_in_background(self, league_name, kind='data') -> threading.Thread:
+        with self._lock:
+            running = self._compactions.get((league_name, kind))
+            if running is not None and running.is_alive():
+                return running
+            thread = threading.Thread(target=self.compact, args=(league_name, kind), daemon=True,
+                                      name=f"compaction {league_name} {kind}")
+            self._compactions[(league_name, kind)] = thread
+        thread.start()
+        return thread
+
+    def wait_for_compactions(self):
+        for thread in list(self._compactions.values()):
+            thread.join()
+
+    def _manifest_path(self, league_name, kind):
+        return os.path.join(self.path(league_name, kind), "manifest.json")
+
+    def _manifest(self, league_name, kind) -> dict:
+        if not self.exists(league_name, kind):
+            return {"store": uuid.uuid4().hex, "next": 1, "segments": []}
+        with open(self._manifest_path(league_name, kind)) as file:
+            return json.load(file)
+
+    def _commit(self, manifest, league_name, kind):
+        path = self._manifest_path(league_name, kind)
+        with open(path + ".tmp", "w") as file:
+            json.dump(manifest, file, indent=1)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _new_segment(self, data, manifest) -> dict:
+
+        """ Manifest entry of a new segment holding `data`, under the next segment number.
+        """
+
+        file_name = f"{manifest['next']:08d}.parquet"
+        manifest["next"] += 1
+        return {"file": file_name, "rows": len(data), "columns": list(data.columns)}
+
+    def _write_segment(self, data, league_name, kind, manifest) -> dict:
+        os.makedirs(self.path(league_name, kind), exist_ok=True)
+        segment = self._new_segment(data, manifest)
+        path = os.path.join(self.path(league_name, kind), segment["file"])
+        data.to_parquet(path + ".tmp", index=False)
+        fsync(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return segment
+
+    def _read_segments(self, manifest, league_name, kind, columns=None, start=None, end=None) -> pd.DataFrame:
+        wanted = read_columns(columns, start, end)
+        frames = []
+        for segment in manifest["segments"]:
+            segment_columns = [col for col in segment["columns"] if wanted is None or col in wanted]
+            frames.append(pd.read_parquet(os.path.join(self.path(league_name, kind), segment["file"]),
+                                          columns=segment_columns))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def _stored_keys(self, manifest, league_name, kind) -> set:
+        cached = self._keys.get((league_name, kind))
+        if cached is not None and cached[0] == self._files(manifest):
+            return cached[1]
+        keys = set(self._key_tuples(self._read_segments(manifest, league_name, kind, columns=MATCH_KEY)))
+        self._keys[(league_name, kind)] = (self._files(manifest), keys)
+        return keys
+
+    def _fingerprint(self, manifest, league_name, kind) -> str:
+        stats = [os.stat(os.path.join(self.path(league_name, kind), file_name)) for file_name in self._files(manifest)]
+        return json.dumps([manifest.get("store"), [[file_name, stat.st_size, stat.st_mtime_ns]
+                                                   for file_name, stat in zip(self._files(manifest), stats)]])
+
+    def _remove(self, segments, league_name, kind):
+        for segment in segments:
+            try:
+                os.remove(os.path.join(self.path(league_name, kind), segment["file"]))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _files(manifest) -> list:
+        return [segment["file"] for segment in manifest["segments"]]
+
+    @staticmethod
+    def _key_tuples(data) -> list:
+        if data.empty or not set(MATCH_KEY) <= set(data.columns):
+            return []
+        return list(zip(*(data[col].astype(object).where(data[col].notna(), None) for col in MATCH_KEY)))
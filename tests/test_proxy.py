@@ -0,0 +1,106 @@
+""" Fetcher through a ProxyPool against the local fbref stand-in and stand-in proxies (benchmarks/), offline.
+
+Run from the repository root:  python -m pytest tests
+"""
+
+import contextlib
+import threading
+import time
+
+import pytest
+import requests
+
+from benchmarks.fbref_standin import FbrefStandIn
+from benchmarks.proxy_standin import StandInProxy, dead_address
+from downloader.fetcher import Fetcher, RateLimited
+from downloader.proxy import ProxyPool
+
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+
+@pytest.fixture
+def site():
+    with FbrefStandIn(latency=0.001, teams=4, seasons=1) as site:
+        yield site
+
+
+@pytest.fixture
+def proxies():
+    with contextlib.ExitStack() as stack:
+        yield lambda count, **options: [stack.enter_context(StandInProxy(name=f"proxy-{number}", **options))
+                                        for number in range(count)]
+
+
+def test_failover_to_a_live_proxy(site, proxies):
+    healthy, = proxies(1)
+    pool = ProxyPool([dead_address(), healthy.address])
+    fetcher = Fetcher(HEADERS, rate=100, proxies=pool)
+
+    for _ in range(3):
+        assert "<table" in fetcher.get(site.league_url)
+
+    report = pool.report().set_index('Proxy')
+    assert report.loc[healthy.address, 'Failures'] == 0
+    assert site.egresses["proxy-0"] == 3
+
+
+def test_failing_proxies_are_evicted(site, proxies):
+    healthy, down, bad_gateway = proxies(3)
+    down.down = True
+    bad_gateway.failure_rate = 1.0
+    pool = ProxyPool([down.address, bad_gateway.address, healthy.address], max_failures=2)
+    fetcher = Fetcher(HEADERS, rate=100, proxies=pool)
+
+    for _ in range(10):
+        assert "<table" in fetcher.get(site.league_url)
+
+    assert [proxy.address for proxy in pool.live()] == [healthy.address]
+    assert site.egresses["proxy-0"] == 10
+    assert down.requests <= 2 and bad_gateway.requests <= 2
+
+
+def test_every_proxy_evicted_raises(site):
+    pool = ProxyPool([dead_address(), dead_address()], max_failures=1)
+    fetcher = Fetcher(HEADERS, rate=100, proxies=pool)
+
+    with pytest.raises(requests.exceptions.ProxyError):
+        for _ in range(3):
+            fetcher.get(site.league_url)
+
+
+def test_proxies_share_the_budget_of_the_host(site, proxies):
+    rate, pages = 20, 21
+    pool = ProxyPool([proxy.address for proxy in proxies(4)])
+    fetcher = Fetcher(HEADERS, rate=rate, proxies=pool)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=lambda: [fetcher.get(site.league_url) for _ in range(pages // 3)])
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # one token bucket for the host whatever the proxies: the first request goes at once, the others 1 / rate apart
+    assert site.requests == pages
+    assert elapsed >= (pages - 1) / rate * 0.95
+
+
+def test_rate_limited_host_is_not_retried(site, proxies):
+    pool = ProxyPool([proxy.address for proxy in proxies(3)])
+    fetcher = Fetcher(HEADERS, rate=100, proxies=pool, backoff=60)
+    fetcher.get(site.league_url)
+
+    site.rate_limit = site.requests
+    with pytest.raises(requests.HTTPError) as error:
+        fetcher.get(site.league_url)
+    assert error.value.response.status_code == 429
+    assert site.requests == 2, "The 429 answer was retried through another proxy"
+
+    # no request to the host until the back-off is over, through any proxy
+    with pytest.raises(RateLimited):
+        fetcher.get(site.league_url)
+    assert site.requests == 2
+    assert not pool.report()['Evicted'].any() and pool.report()['Failures'].sum() == 0